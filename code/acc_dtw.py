@@ -1,6 +1,9 @@
+import time
 import numpy as np
 import numba
 
+from instrumentation import METRICS
+
 @numba.jit(nopython=True)
 def fill_distances( D1, x, y ):
     for i in range( x.shape[0] ):
@@ -44,12 +47,45 @@ def find_path(D, p, q):
         q[n] = j
     return(n)            
 
-def dtw(x, y):
+class DTWPhases(object):
+    """
+    Time spent in the phases of dtw (fill, accumulate, traceback), summed
+    without taking the lock of the metrics: dtw runs once per pair, so the
+    totals are added to the timers by flush, for instance once per row.
+    One DTWPhases per thread.
+    """
+    NAMES = ('dtw fill', 'dtw accumulate', 'dtw traceback')
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.calls = 0
+        self.totals = [0., 0., 0.]
+        self.longest = [0., 0., 0.]
+
+    def add(self, fill, accumulate, traceback):
+        self.calls += 1
+        for phase, seconds in enumerate((fill, accumulate, traceback)):
+            self.totals[phase] += seconds
+            if seconds > self.longest[phase]:
+                self.longest[phase] = seconds
+
+    def flush(self, metrics=METRICS):
+        if self.calls:
+            for phase, name in enumerate(self.NAMES):
+                metrics.add_time(name, self.totals[phase], calls=self.calls,
+                                 longest=self.longest[phase])
+        self._reset()
+
+def dtw(x, y, phases=None):
     """
     Computes Dynamic Time Warping (DTW) of two sequences.
 
     :param array x: N1*M array
     :param array y: N2*M array
+    :param DTWPhases phases: adds the time of each phase to it (None: the
+                             phases are not timed)
 
     Returns the minimum distance, the cost matrix, the accumulated cost matrix, and the wrap path.
     """
@@ -60,15 +96,24 @@ def dtw(x, y):
     D0[0, 1:] = np.inf
     D0[1:, 0] = np.inf
     D1 = D0[1:, 1:] # view
+    if phases is not None:
+        start = time.time()
     fill_distances( D1, x, y )
     C = D1.copy()
+    if phases is not None:
+        filled = time.time()
     accumulate_distances( D0, D1 )
+    if phases is not None:
+        accumulated = time.time()
     if len(x)==1:
         path = np.zeros(len(y)), range(len(y))
     elif len(y) == 1:
         path = range(len(x)), np.zeros(len(x))
     else:
         path = _traceback(D0)
+    if phases is not None:
+        phases.add(filled - start, accumulated - filled,
+                   time.time() - accumulated)
     return D1[-1, -1] / sum(D1.shape), C, D1, path
 
 
@@ -87,3 +132,115 @@ def dtw(x, y):
 ##         p.insert(0, i)
 ##         q.insert(0, j)
 ##     return array(p), array(q)
+
+
+# One against many: the local cost abs(sum_k x[i,k]**2 - y[j,k]**2) only
+# depends on the energy of each time step (sum of the squares over the
+# emotions), so the movies are compared through these 1d series, and the
+# comparisons that cannot beat the best distances found so far are stopped
+# early (see search_closest)
+
+def energy(x):
+    """
+    sum over the emotions of the squared counts, at each time step
+    """
+    return (np.asarray(x, dtype=np.float64)**2).sum(axis=1)
+
+@numba.jit(nopython=True)
+def energy_dtw(a, b, max_distance):
+    """
+    same distance as dtw (normalized by the sum of the lengths), from the
+    energies a and b; returns inf as soon as the distance is sure to be
+    larger than max_distance (the accumulated costs only increase along the
+    path, so the minimum of a row is a lower bound of the final cost)
+    """
+    r = a.shape[0]
+    c = b.shape[0]
+    max_cost = max_distance * (r + c)
+    previous = np.empty(c + 1)
+    current = np.empty(c + 1)
+    previous[0] = 0.
+    for j in range(1, c + 1):
+        previous[j] = np.inf
+    for i in range(r):
+        current[0] = np.inf
+        row_min = np.inf
+        for j in range(c):
+            d = abs(a[i] - b[j])
+            best = previous[j]
+            if previous[j + 1] < best:
+                best = previous[j + 1]
+            if current[j] < best:
+                best = current[j]
+            current[j + 1] = d + best
+            if current[j + 1] < row_min:
+                row_min = current[j + 1]
+        if row_min > max_cost:
+            return np.inf
+        for j in range(c + 1):
+            previous[j] = current[j]
+    return previous[c] / (r + c)
+
+@numba.jit(nopython=True)
+def _one_way_bound(a, b_min, b_max):
+    # each time step of a is matched with at least one step of b, whose
+    # energy lies between b_min and b_max
+    total = 0.
+    for i in range(a.shape[0]):
+        if a[i] > b_max:
+            total += a[i] - b_max
+        elif a[i] < b_min:
+            total += b_min - a[i]
+    return total
+
+def lower_bound(a, b):
+    """
+    lower bound of energy_dtw(a, b), in O(len(a) + len(b))
+    """
+    # the path starts at (0, 0) and ends at (-1, -1): the same cell when
+    # both series have length 1, counted once
+    endpoints = abs(a[0] - b[0])
+    if len(a) > 1 or len(b) > 1:
+        endpoints += abs(a[-1] - b[-1])
+    bound = max(_one_way_bound(a, b.min(), b.max()),
+                _one_way_bound(b, a.min(), a.max()),
+                endpoints)
+    return bound / (len(a) + len(b))
+
+def search_closest(x, list_energies, n=10, deadline=None):
+    """
+    n closest series to x among list_energies (exact): the candidates are
+    visited by increasing lower bound, and the search stops when the lower
+    bound cannot beat the n-th best distance
+
+    :param array x: N*M array (smoothed counts) or energy series of length N
+    :param list list_energies: energy series of the corpus (see energy)
+    :param float deadline: time.time() after which the search stops and
+                           returns the best distances found so far
+
+    Returns the indices and the distances of the closest series (closest
+    first), the number of full DTW computed and True if the search was
+    complete.
+    """
+    import time
+    a = energy(x) if np.ndim(x) == 2 else np.asarray(x, dtype=np.float64)
+    bounds = np.array([lower_bound(a, b) for b in list_energies])
+    best = [] # sorted list of (distance, index)
+    n_dtw = 0
+    complete = True
+    for index in np.argsort(bounds, kind='mergesort'):
+        threshold = best[-1][0] if len(best) == n else np.inf
+        if bounds[index] >= threshold:
+            break
+        if deadline is not None and time.time() > deadline:
+            complete = False
+            break
+        distance = energy_dtw(a, list_energies[index], threshold)
+        n_dtw += 1
+        if distance < threshold:
+            best.append((distance, index))
+            best.sort()
+            del best[n:]
+    indices = [index for distance, index in best]
+    distances = [distance for distance, index in best]
+    return indices, distances, n_dtw, complete
@@ -0,0 +1,354 @@
+'''
+benchmark of the steps of the project on a synthetic corpus (see
+synthetic_corpus.py): no scraped data and no network are needed, and the
+corpus only depends on the seed, so that the results of two runs (two
+versions of the code, two machines) can be compared
+
+stages timed, for each number of movies (100, 1000 and 10000 by default):
+emotion_counts: counts of the windows of 100 words of the scripts, with
+                the original loop (emotions_script.window_blocks and
+                emotion_counts)
+emotion_array: same counts, vectorized (emotions_script.emotion_array)
+smoothing: the 10 emotions of each movie, with Lowess and with the
+           gaussian smoother (frac=0.1, as in LoadPlotLine)
+dtw: distance between two movies, acc_dtw.dtw and the original dtw package
+     (if it is installed), for the speedup (once, it does not depend on the
+     number of movies)
+all_pairs: the n(n-1)/2 distances (dtw_script.get_distance)
+clusters_k: 100 restarts of the clustering in 3 clusters
+            (medoids.clusters_k), on distances between the energy curves of
+            the movies (the DTW distances of 10000 movies would take days)
+
+each stage runs until all its items are done or budget seconds are spent:
+the time of the whole stage is then extrapolated from the items measured
+(sampled: true in the results)
+
+the results are saved in '../data/benchmarks/benchmark_YYYYmmdd-HHMMSS.json'
+(see config.py) and compared with the previous results (ratio of the time
+per item, above 1.25 the stage is reported as slower)
+
+Usage:
+------
+To execute this script, type in a terminal
+$ python benchmark.py
+to change the numbers of movies, the time spent per stage (s) or the corpus
+$ python benchmark.py sizes=100,1000 budget=10 seed=0
+to compare the last two results without running anything
+$ python benchmark.py compare
+'''
+
+import json
+import os
+import platform
+import sys
+import time
+from multiprocessing import cpu_count
+import numpy as np
+
+import config
+
+SLOWER = 1.25 #ratio of the time per item above which a stage is slower
+
+def timed_sizes(prepare, run, sizes, budget):
+    '''
+    times run(prepare(i)) for i = 0, 1... (prepare is not timed) until
+    max(sizes) items are done or budget seconds are spent; run is called
+    once before, so that the imports and the compilation of the numba
+    kernels are not timed
+
+    returns:
+    --------
+    list of dictionaries (one per size): items, measured (number of items
+    timed), seconds (for all the items, extrapolated if sampled),
+    ms/item, sampled
+    '''
+    n_max = max(sizes)
+    run(prepare(0))
+    cumulated = []
+    spent = 0.
+    start = time.time()
+    while len(cumulated) < n_max and time.time() - start < budget:
+        data = prepare(len(cumulated))
+        begin = time.time()
+        run(data)
+        spent += time.time() - begin
+        cumulated.append(spent)
+    results = []
+    for size in sizes:
+        measured = min(size, len(cumulated))
+        per_item = cumulated[measured - 1] / measured
+        results.append({'items': size, 'measured': measured,
+                        'seconds': per_item * size,
+                        'ms/item': per_item * 1000.,
+                        'sampled': measured < size})
+    return results
+
+def _pairs(n, rng):
+    #pairs of movies i < j, in a random order (all of them if few enough)
+    n_pairs = n * (n - 1) // 2
+    if n_pairs <= 200000:
+        first, second = np.triu_indices(n, 1)
+        order = rng.permutation(n_pairs)
+        return zip(first[order], second[order])
+    pairs = []
+    while len(pairs) < 200000:
+        i, j = rng.randint(n, size=2)
+        if i != j:
+            pairs.append((min(i, j), max(i, j)))
+    return pairs
+
+class Benchmark(object):
+    '''
+    usage:
+    ------
+    bench = Benchmark(sizes=[100, 1000], budget=10.)
+    results = bench.run()
+    '''
+    def __init__(self, sizes=(100, 1000, 10000), budget=30., seed=0,
+                 NRC_emotions_file=config.NRC_EMOTIONS_FILE):
+        from emotions_script import emotion_matrix, \
+                                    load_dictionary_and_vocabulary
+        from synthetic_corpus import Corpus
+        self.sizes = sorted(sizes)
+        self.budget = budget
+        self.seed = seed
+        self.emotion_dict, self.vocabulary = \
+            load_dictionary_and_vocabulary(NRC_emotions_file)
+        self.word_rows, self.matrix = emotion_matrix(self.emotion_dict)
+        self.corpus = Corpus(self.emotion_dict, seed=seed)
+        self._smoothed = {}
+        self.results = []
+
+    def _record(self, stage, results, **details):
+        #details: movies (if the items are not the movies), method...
+        for result in results:
+            result.update(details, stage=stage)
+            result.setdefault('movies', result['items'])
+            result.setdefault('method', '')
+            self.results.append(result)
+            print '%-15s %-12s %6d movies: %10.1f s%s | %.3f ms/item ' \
+                  '(%d items timed)' \
+                    %(stage, result['method'], result['movies'],
+                      result['seconds'],
+                      ' (estimated)' if result['sampled'] else '',
+                      result['ms/item'], result['measured'])
+
+    def _words(self, index):
+        #the words of the screenplay, as text_to_words gives them (the
+        #words of the corpus do not need to be lemmatized)
+        return self.corpus.screenplay(index).lower().split()
+
+    def smoothed(self, index):
+        #smoothed emotion counts of a movie (gaussian, to prepare the DTW)
+        from smoothing_benchmark import smooth_movie
+        if index not in self._smoothed:
+            self._smoothed[index] = smooth_movie(
+                                        self.corpus.emotion_array(index),
+                                        'gaussian')
+        return self._smoothed[index]
+
+    def emotion_stages(self):
+        from emotions_script import emotion_array, emotion_counts, \
+                                    window_blocks
+        def counts(words):
+            return np.array([emotion_counts(window, self.emotion_dict,
+                                            self.vocabulary)
+                             for window in window_blocks(words)])
+        self._record('emotion_counts', timed_sizes(self._words, counts,
+                                                   self.sizes, self.budget))
+        self._record('emotion_array', timed_sizes(
+                        self._words,
+                        lambda words: emotion_array(words, self.word_rows,
+                                                    self.matrix),
+                        self.sizes, self.budget))
+
+    def smoothing_stage(self):
+        from smoothing_benchmark import smooth_movie
+        for method in ['lowess', 'gaussian']:
+            self._record('smoothing', timed_sizes(
+                            self.corpus.emotion_array,
+                            lambda array_emotions: smooth_movie(
+                                                    array_emotions, method),
+                            self.sizes, self.budget), method=method)
+
+    def dtw_stage(self, n_pairs=50):
+        from dtw_script import get_distance
+        pairs = [(2 * index, 2 * index + 1) for index in xrange(n_pairs)]
+        def prepare(index):
+            i, j = pairs[index]
+            return self.smoothed(i), self.smoothed(j)
+        acc = timed_sizes(prepare, lambda arrays: get_distance(*arrays),
+                          [n_pairs], self.budget)
+        self._record('dtw', acc, method='acc_dtw', movies=2 * n_pairs)
+        try:
+            import dtw
+        except ImportError:
+            print 'dtw: the original dtw package is not installed, skipped'
+            return
+        original = timed_sizes(prepare,
+                               lambda arrays: get_distance(*arrays,
+                                                           acc_option=False),
+                               [n_pairs], self.budget)
+        speedup = original[0]['ms/item'] / acc[0]['ms/item']
+        self._record('dtw', original, method='dtw package',
+                     movies=2 * n_pairs, speedup=speedup)
+        print 'acc_dtw is %.0f times faster than the dtw package' %speedup
+
+    def all_pairs_stage(self):
+        from dtw_script import get_distance
+        rng = np.random.RandomState(self.seed)
+        for size in self.sizes:
+            pairs = _pairs(size, rng)
+            def prepare(index):
+                i, j = pairs[index]
+                return self.smoothed(i), self.smoothed(j)
+            result, = timed_sizes(prepare,
+                                  lambda arrays: get_distance(*arrays),
+                                  [len(pairs)], self.budget)
+            #from the pairs measured to all the pairs of size movies
+            n_pairs = size * (size - 1) // 2
+            result.update(items=n_pairs, seconds=result['ms/item'] * n_pairs
+                                                 / 1000.,
+                          sampled=result['measured'] < n_pairs)
+            self._record('all_pairs', [result], movies=size)
+
+    def energy_distances(self, size):
+        '''
+        returns:
+        --------
+        square np.array of the euclidean distances between the energy
+        curves (sum of the squares of the smoothed emotions, the quantity
+        compared by the DTW) of the movies, resampled on 32 points
+        '''
+        x = np.linspace(0, 1, 32)
+        curves = np.empty((size, 32))
+        for index in xrange(size):
+            energy = (self.smoothed(index) ** 2).sum(axis=1)
+            curves[index] = np.interp(x, np.linspace(0, 1, len(energy)),
+                                      energy)
+        squares = (curves ** 2).sum(axis=1)
+        distances = np.dot(curves, curves.T)
+        distances *= -2
+        distances += squares[:, None]
+        distances += squares[None, :]
+        np.maximum(distances, 0, out=distances)
+        np.sqrt(distances, out=distances)
+        np.fill_diagonal(distances, 0)
+        return distances
+
+    def clusters_stage(self, k=3, n_restarts=100):
+        from medoids import clusters_k
+        for size in self.sizes:
+            distances = self.energy_distances(size)
+            result, = timed_sizes(lambda restart: restart,
+                                  lambda restart: clusters_k(
+                                                    k, distances,
+                                                    n_restarts=1,
+                                                    seed=restart),
+                                  [n_restarts], self.budget)
+            self._record('clusters_k', [result], movies=size, k=k)
+
+    def run(self):
+        '''
+        runs all the stages
+
+        returns:
+        --------
+        dictionary with the environment, the parameters and the results
+        '''
+        start = time.time()
+        self.emotion_stages()
+        self.smoothing_stage()
+        self.dtw_stage()
+        self.all_pairs_stage()
+        self.clusters_stage()
+        import numba
+        return {'environment': {'python': platform.python_version(),
+                                'numpy': np.__version__,
+                                'numba': numba.__version__,
+                                'platform': platform.platform(),
+                                'cpus': cpu_count()},
+                'parameters': {'sizes': self.sizes, 'budget': self.budget,
+                               'seed': self.seed,
+                               'hit_rate': self.corpus.hit_rate},
+                'elapsed (s)': time.time() - start,
+                'results': self.results}
+
+def save_results(results, directory=config.BENCHMARKS_DIR):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, 'benchmark_%s.json'
+                        %time.strftime('%Y%m%d-%H%M%S'))
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    return path
+
+def result_files(directory=config.BENCHMARKS_DIR):
+    '''
+    returns:
+    --------
+    paths of the saved results, oldest first
+    '''
+    if not os.path.exists(directory):
+        return []
+    return [os.path.join(directory, filename)
+            for filename in sorted(os.listdir(directory))
+            if filename.startswith('benchmark_')
+            and filename.endswith('.json')]
+
+def compare(path_before, path_after, slower=SLOWER):
+    '''
+    prints the ratio of the time per item of each stage (after / before)
+
+    returns:
+    --------
+    list of the (stage, method, movies) which are slower than slower times
+    '''
+    def _key(result):
+        return (result['stage'], result['method'], result['movies'])
+    with open(path_before, 'r') as f:
+        before = dict((_key(result), result)
+                      for result in json.load(f)['results'])
+    with open(path_after, 'r') as f:
+        after = json.load(f)['results']
+    print '*'*50
+    print 'before: ' + path_before
+    print 'after: ' + path_after
+    regressions = []
+    for result in after:
+        key = _key(result)
+        if key not in before:
+            continue
+        ratio = result['ms/item'] / before[key]['ms/item']
+        flag = ''
+        if ratio > slower:
+            regressions.append(key)
+            flag = ' <-- slower'
+        print '%-15s %-12s %6d movies: x%.2f%s' %(key + (ratio, flag))
+    print '*'*50
+    return regressions
+
+def _option(name, default=None):
+    #options given as name=value in the command line
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + '='):
+            return arg.split('=', 1)[1]
+    return default
+
+if __name__ == '__main__':
+    if 'compare' in sys.argv:
+        paths = result_files()
+        if len(paths) < 2:
+            print 'at least two results are needed in ' + config.BENCHMARKS_DIR
+        else:
+            compare(paths[-2], paths[-1])
+    else:
+        previous = result_files()
+        bench = Benchmark(sizes=[int(size) for size in
+                                 _option('sizes', '100,1000,10000').split(',')],
+                          budget=float(_option('budget', 30)),
+                          seed=int(_option('seed', 0)))
+        path = save_results(bench.run())
+        print 'results saved in ' + path
+        if previous:
+            compare(previous[-1], path)
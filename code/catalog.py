@@ -0,0 +1,206 @@
+'''
+metadata of the scraped movies (title, filename, genres, writers), loaded
+once and kept in memory
+
+- the columns are arrays (one entry per movie, in the order of the scraping)
+- for each genre and each writer, the sorted array of the movies which have
+  it (inverted index): a query such as "all the Horror movies by writer X"
+  is an intersection of two such arrays, without looking at the other movies
+- indices_in translates the result into rows of the distance matrix, to
+  cluster or search the neighbours of a subset of the movies
+
+the metadata comes from '../data/scraping/scraping.db' (see
+scraping_store.py) or, if it does not exist, from
+'../data/scraping/successful_files.csv'; it is read again only if the file
+changed
+
+Usage:
+------
+To list the movies of a genre (and of a writer), type in a terminal
+$ python catalog.py genre=Horror
+$ python catalog.py genre=Horror "writer=Wes Craven"
+'''
+
+import ast
+import os
+import sys
+import numpy as np
+import config
+
+DB_PATH = config.SCRAPING_DB
+CSV_PATH = config.SUCCESSFUL_CSV
+
+_loaded = {} #path -> (modification time, Catalog)
+
+def _inverted_index(list_values):
+    '''
+    returns:
+    --------
+    dictionary: key value, value sorted np.array (int32) of the positions of
+    the lists in which it appears
+    '''
+    positions = {}
+    for position, values in enumerate(list_values):
+        for value in set(values):
+            positions.setdefault(value, []).append(position)
+    return dict((value, np.array(rows, dtype=np.int32))
+                for value, rows in positions.items())
+
+class Catalog(object):
+    '''
+    usage:
+    ------
+    catalog = load_catalog()
+    rows = catalog.select(genres=['Horror'], writers=['Wes Craven'])
+    catalog.titles[rows]
+    indices = catalog.indices_in(movies, rows) #rows of the distance matrix
+    '''
+    def __init__(self, titles, filenames, list_genres, list_writers):
+        '''
+        parameters:
+        -----------
+        titles, filenames: lists of STR, one per movie
+        list_genres, list_writers: lists (one per movie) of lists of STR
+        '''
+        self.titles = np.array(titles, dtype=object)
+        self.filenames = np.array(filenames, dtype=object)
+        self.list_genres = list_genres
+        self.list_writers = list_writers
+        self.genre_index = _inverted_index(list_genres)
+        self.writer_index = _inverted_index(list_writers)
+        self.filename_to_title = dict(zip(filenames, titles))
+        self.title_to_filename = dict(zip(titles, filenames))
+        self.filename_to_row = dict((filename, row)
+                                    for row, filename in enumerate(filenames))
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def genres(self):
+        return sorted(self.genre_index)
+
+    @property
+    def writers(self):
+        return sorted(self.writer_index)
+
+    def _rows(self, index, values, match):
+        empty = np.array([], dtype=np.int32)
+        postings = [index.get(value, empty) for value in values]
+        if match == 'any':
+            return np.unique(np.concatenate(postings))
+        rows = postings[0]
+        for posting in postings[1:]:
+            rows = np.intersect1d(rows, posting, assume_unique=True)
+        return rows
+
+    def select(self, genres=None, writers=None, match='all'):
+        '''
+        parameters:
+        -----------
+        genres, writers: lists of STR (None: no condition)
+        match: 'all' for the movies with all the genres (and all the
+               writers), 'any' for the movies with at least one of them
+
+        returns:
+        --------
+        sorted np.array (int32) of the rows of the catalog
+        '''
+        rows = np.arange(len(self), dtype=np.int32)
+        for index, values in [(self.genre_index, genres),
+                              (self.writer_index, writers)]:
+            if values:
+                rows = np.intersect1d(rows, self._rows(index, values, match),
+                                      assume_unique=True)
+        return rows
+
+    def indices_in(self, movies, rows):
+        '''
+        parameters:
+        -----------
+        movies: list of the filenames of the rows of a distance matrix (see
+                medoids.load_distances)
+        rows: rows of the catalog (see select)
+
+        returns:
+        --------
+        sorted np.array of the positions in movies of the movies of rows
+        (the movies without emotion array are not in movies)
+        '''
+        wanted = set(self.filenames[rows])
+        return np.array([position for position, movie in enumerate(movies)
+                         if movie in wanted], dtype=np.int64)
+
+    def submatrix(self, movies, distances, rows):
+        '''
+        returns:
+        --------
+        list of movies and square np.array of the distances, restricted to
+        the movies of rows (to cluster them, see medoids.cluster, or search
+        their neighbours, see knn_index.build_knn_index)
+        '''
+        indices = self.indices_in(movies, rows)
+        return [movies[index] for index in indices], \
+               np.asarray(distances[np.ix_(indices, indices)])
+
+def _read_store(path):
+    from scraping_store import ScrapingStore
+    store = ScrapingStore(path)
+    try:
+        movies = store.successful_movies()
+    finally:
+        store.close()
+    return [(title, genre, writer, movie_title)
+            for title, genre, writer, movie_title, filename in movies]
+
+def _read_csv(path):
+    movies = []
+    with open(path, 'r') as f:
+        for line in f.read().split('\n'):
+            if len(line)>=2:
+                info = line.split(';')
+                #the genres and writers were written with str(list)
+                movies.append((info[0], ast.literal_eval(info[1]),
+                               ast.literal_eval(info[2]), info[3]))
+    return movies
+
+def load_catalog(db_path=DB_PATH, csv_path=CSV_PATH):
+    '''
+    returns:
+    --------
+    Catalog, read from the database if it exists, from the csv otherwise
+    (None if none of them exists); the catalog is shared between the calls,
+    and read again only if the file changed
+    '''
+    if os.path.isfile(db_path):
+        path, read = db_path, _read_store
+    elif os.path.isfile(csv_path):
+        path, read = csv_path, _read_csv
+    else:
+        return None
+    modified = os.path.getmtime(path)
+    if path in _loaded and _loaded[path][0] == modified:
+        return _loaded[path][1]
+    movies = read(path)
+    catalog = Catalog([movie[0] for movie in movies],
+                      [movie[3] for movie in movies],
+                      [list(movie[1]) for movie in movies],
+                      [list(movie[2]) for movie in movies])
+    _loaded[path] = (modified, catalog)
+    return catalog
+
+def _options():
+    #options given as name=value in the command line (can be repeated)
+    options = {'genre': [], 'writer': []}
+    for arg in sys.argv[1:]:
+        name, value = arg.split('=', 1)
+        options[name].append(value)
+    return options
+
+if __name__ == '__main__':
+    catalog = load_catalog()
+    options = _options()
+    rows = catalog.select(genres=options['genre'], writers=options['writer'])
+    for title in catalog.titles[rows]:
+        print title
+    print '%d movies out of %d' %(len(rows), len(catalog))
@@ -0,0 +1,248 @@
+'''
+k-medoids for corpora too large to hold the full m x m distance matrix in
+memory
+
+- CLARA clusters random subsamples of the movies (FasterPAM on the
+  subsample distance matrix), then scores each candidate set of medoids
+  against all the movies, and keeps the best one
+- CLARANS (in its FastCLARANS form, see fasterpam.py for the reference)
+  starts from random medoids and tries random candidate movies: the
+  distances from one candidate to all the movies are enough to find the
+  best medoid to swap it with
+
+the distances are read from a DistanceSource, one block of rows at a time:
+- MatrixDistances: a square matrix saved as .npy (np.save), opened in
+  memory-mapped mode (only the rows needed are read from disk)
+- DTWDistances: the distances are computed when needed with acc_dtw, from
+  the smoothed arrays of the movies
+the distance matrix is symmetric, so the row of a movie gives the distances
+of all the movies to it
+
+the peak memory used for distances stays below memory_budget (in bytes)
+
+Usage:
+------
+To execute this script, type in a terminal
+$ python clara.py ../data/distances.npy 3
+or, for CLARANS
+$ python clara.py ../data/distances.npy 3 clarans
+'''
+
+import sys
+import numpy as np
+
+from fasterpam import fasterpam, kmedoids_plusplus, nearest_two, \
+                      removal_loss, best_swap
+
+DEFAULT_MEMORY_BUDGET = 256 * 2**20 #256 MB
+
+class MatrixDistances(object):
+    '''
+    square distance matrix saved as .npy, read lazily from disk
+    '''
+    def __init__(self, path):
+        self.matrix = np.load(path, mmap_mode='r')
+        self.size = self.matrix.shape[0]
+
+    def rows(self, indices, start=0, stop=None):
+        '''
+        returns:
+        --------
+        np.array [len(indices), stop-start], distances from the movies in
+        indices to the movies start to stop
+        '''
+        return np.array(self.matrix[np.asarray(indices), start:stop],
+                        dtype=np.float64)
+
+    def submatrix(self, indices):
+        indices = np.asarray(indices)
+        return np.array(self.matrix[np.ix_(indices, indices)],
+                        dtype=np.float64)
+
+class DTWDistances(object):
+    '''
+    distances computed on demand with the accelerated DTW
+
+    list_arrays: list of np arrays [time, emotions] (smoothed counts), as
+                 given by dtw_script.prepare_smooth_array
+    '''
+    def __init__(self, list_arrays):
+        self.list_arrays = list_arrays
+        self.size = len(list_arrays)
+
+    def _distance(self, index1, index2):
+        import acc_dtw
+        if index1 == index2:
+            return 0.
+        return acc_dtw.dtw(self.list_arrays[index1],
+                           self.list_arrays[index2])[0]
+
+    def rows(self, indices, start=0, stop=None):
+        if stop is None:
+            stop = self.size
+        return np.array([[self._distance(index1, index2)
+                          for index2 in xrange(start, stop)]
+                         for index1 in indices], dtype=np.float64)
+
+    def submatrix(self, indices):
+        n = len(indices)
+        sub = np.zeros((n, n))
+        for i in xrange(n):
+            for j in xrange(i+1, n):
+                sub[i, j] = self._distance(indices[i], indices[j])
+                sub[j, i] = sub[i, j]
+        return sub
+
+def score_medoids(source, medoids, memory_budget=DEFAULT_MEMORY_BUDGET):
+    '''
+    parameters:
+    -----------
+    source: DistanceSource (MatrixDistances or DTWDistances)
+    medoids: indices of the medoids
+    memory_budget: maximum size (bytes) of the block of distances in memory
+
+    returns:
+    --------
+    total distance of the movies to their closest medoid,
+    clusters: np.array giving for each movie the index of its medoid
+    '''
+    medoids = np.asarray(medoids, dtype=np.int64)
+    k = len(medoids)
+    m = source.size
+    block = max(1, int(memory_budget // (8 * k)))
+    nearest = np.empty(m, dtype=np.int64)
+    d_nearest = np.empty(m)
+    d_second = np.empty(m)
+    for start in xrange(0, m, block):
+        stop = min(start + block, m)
+        rows = source.rows(medoids, start, stop)
+        nearest_two(rows, np.arange(k), nearest[start:stop],
+                    d_nearest[start:stop], d_second[start:stop])
+    clusters = medoids[nearest]
+    clusters[medoids] = medoids #make sure to have a medoid in its own
+    return d_nearest.sum(), clusters
+
+def clara(source, k=3, n_samples=5, sample_size=None,
+          memory_budget=DEFAULT_MEMORY_BUDGET, seed=None):
+    '''
+    parameters:
+    -----------
+    source: DistanceSource (MatrixDistances or DTWDistances)
+    k: number of clusters
+    n_samples: number of subsamples clustered
+    sample_size: number of movies per subsample (defaults to 40 + 2k, the
+                 usual CLARA choice), reduced if the subsample matrix does
+                 not fit in half of the memory budget
+    memory_budget: maximum memory (bytes) used for distances
+    seed: makes the result reproducible
+
+    returns:
+    --------
+    clusters: np.array giving for each movie the index of its medoid
+    medoids: np.array of the indices of the medoids
+    '''
+    m = source.size
+    random_state = np.random.RandomState(seed)
+    if sample_size is None:
+        sample_size = 40 + 2*k
+    max_sample = int(np.sqrt(memory_budget / 2. / 8))
+    sample_size = max(k + 1, min(sample_size, max_sample, m))
+
+    best_cost = np.inf
+    best = None
+    for _ in xrange(n_samples):
+        sample = random_state.choice(m, sample_size, replace=False)
+        if best is not None:
+            #the best medoids so far are always part of the next subsample
+            others = sample[~np.in1d(sample, best[1])][:sample_size - k]
+            sample = np.concatenate((best[1], others))
+        sub_distances = source.submatrix(sample)
+        init_medoids = kmedoids_plusplus(sub_distances, k, random_state)
+        _, sub_medoids = fasterpam(sub_distances, k,
+                                   init_medoids=init_medoids)
+        medoids = sample[sub_medoids]
+        cost, clusters = score_medoids(source, medoids,
+                                       memory_budget=memory_budget / 2.)
+        if cost < best_cost:
+            best_cost = cost
+            best = (clusters, medoids)
+    return best
+
+def clarans(source, k=3, num_local=2, max_neighbor=None,
+            memory_budget=DEFAULT_MEMORY_BUDGET, seed=None):
+    '''
+    parameters:
+    -----------
+    source: DistanceSource (MatrixDistances or DTWDistances)
+    k: number of clusters
+    num_local: number of local searches (from random medoids)
+    max_neighbor: number of candidates tried without improvement before a
+                  local search stops (defaults to 1.25 % of k(m-k), at
+                  least 250)
+    memory_budget: maximum memory (bytes) used for distances, needs to hold
+                   k+1 rows of m distances
+    seed: makes the result reproducible
+
+    returns:
+    --------
+    clusters: np.array giving for each movie the index of its medoid
+    medoids: np.array of the indices of the medoids
+    '''
+    m = source.size
+    if (k + 1) * m * 8 > memory_budget:
+        raise ValueError('CLARANS needs %d MB to hold %d rows of distances, '
+                         'use clara or a larger memory_budget'
+                         %((k + 1) * m * 8 / 2**20 + 1, k + 1))
+    random_state = np.random.RandomState(seed)
+    if max_neighbor is None:
+        max_neighbor = max(250, int(0.0125 * k * (m - k)))
+    max_neighbor = min(max_neighbor, m - k)
+
+    nearest = np.empty(m, dtype=np.int64)
+    d_nearest = np.empty(m)
+    d_second = np.empty(m)
+    positions = np.arange(k)
+    best_cost = np.inf
+    best = None
+    for _ in xrange(num_local):
+        medoids = random_state.choice(m, k, replace=False)
+        medoid_rows = source.rows(medoids)
+        nearest_two(medoid_rows, positions, nearest, d_nearest, d_second)
+        loss = removal_loss(nearest, d_nearest, d_second, k)
+        tolerance = 1e-12 * (d_nearest.sum() + 1.)
+        tries = 0
+        while tries < max_neighbor:
+            x = random_state.randint(m)
+            if x in medoids:
+                continue
+            row = source.rows([x])
+            i, delta = best_swap(row, loss, nearest, d_nearest, d_second, 0)
+            if delta < -tolerance:
+                medoids[i] = x
+                medoid_rows[i] = row[0]
+                nearest_two(medoid_rows, positions, nearest, d_nearest,
+                            d_second)
+                loss = removal_loss(nearest, d_nearest, d_second, k)
+                tries = 0
+            else:
+                tries += 1
+        cost = d_nearest.sum()
+        if cost < best_cost:
+            best_cost = cost
+            clusters = medoids[nearest]
+            clusters[medoids] = medoids
+            best = (clusters, medoids.copy())
+    return best
+
+if __name__ == '__main__':
+    source = MatrixDistances(sys.argv[1])
+    k = int(sys.argv[2])
+    if len(sys.argv) > 3 and sys.argv[3] == 'clarans':
+        clusters, medoids = clarans(source, k)
+    else:
+        clusters, medoids = clara(source, k)
+    cost, _ = score_medoids(source, medoids)
+    print 'medoids: ' + ', '.join(str(medoid) for medoid in medoids)
+    print 'sum of the distances to the medoids: %.2f' %cost
+    for medoid in medoids:
+        print 'cluster of %d: %d movies' %(medoid, (clusters == medoid).sum())
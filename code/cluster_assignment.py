@@ -0,0 +1,283 @@
+'''
+assigns new movies to the existing clusters, without computing the distances
+to all the movies and without clustering again
+
+i) a ClusterModel is built once from a clustering (medoids.py): it keeps the
+   smoothed plotlines of the medoids (and optionally of the n_members movies
+   closest to each medoid), and the typical distance of the movies of each
+   cluster to their medoid
+ii) a new emotion array (emotions_script.get_emotions) is smoothed, and
+    compared with DTW to the stored plotlines only: it goes to the cluster of
+    the closest one
+iii) the model keeps track of the movies assigned since it was built: the
+     drift report says when enough of them were added (or fall far from
+     their medoid) for a new clustering to be worthwhile
+
+Usage:
+------
+To build the model for 3 clusters (saved as '../data/cluster_model.pkl'),
+type in a terminal
+$ python cluster_assignment.py build 3
+To assign a new movie (emotion counts saved as .npy): the movie is recorded
+in the model, which is saved again
+$ python cluster_assignment.py assign path/to/new_movie.npy
+To see whether enough movies were assigned for a new clustering
+$ python cluster_assignment.py drift
+'''
+
+import sys
+import time
+import cPickle as pickle
+import numpy as np
+
+import acc_dtw
+import config
+from load_plotline import LoadPlotLine
+
+def smooth_array(array_emotions, smoothing_method='lowess'):
+    '''
+    returns:
+    --------
+    np array [time, emotions], with smoothed counts (all 10 emotions), as
+    dtw_script.prepare_smooth_array for a movie saved as .npy
+    '''
+    plotline = LoadPlotLine(None, smoothing_method=smoothing_method)
+    plotline.set_emotions(array_emotions)
+    plotline.make_emotion_dictionary(list_emotions=range(10))
+    return plotline.smoothed_array_emotions
+
+class ClusterModel(object):
+    '''
+    clusters of a corpus, reduced to what is needed to place a new movie
+
+    usage:
+    ------
+    model = build_cluster_model(movies, distances, clusters, medoids,
+                                list_smooth_arrays)
+    result = model.assign(array_emotions, name='New movie')
+    model.drift_report()
+    '''
+    def __init__(self, medoid_names, reference_names, reference_arrays,
+                 reference_labels, radius, cluster_sizes,
+                 smoothing_method='lowess'):
+        '''
+        parameters:
+        -----------
+        medoid_names: list of the filenames of the medoids (one per cluster)
+        reference_names: filenames of the stored plotlines (medoids first)
+        reference_arrays: smoothed arrays of the stored plotlines
+        reference_labels: cluster (position in medoid_names) of each stored
+                          plotline
+        radius: np.array, for each cluster, 95th percentile of the distances
+                of its movies to the medoid
+        cluster_sizes: np.array, number of movies in each cluster when the
+                       model was built
+        smoothing_method: smoothing used for the plotlines of the clustering
+        '''
+        self.medoid_names = list(medoid_names)
+        self.reference_names = list(reference_names)
+        self.reference_arrays = list(reference_arrays)
+        self.reference_labels = np.asarray(reference_labels)
+        self.radius = np.asarray(radius)
+        self.cluster_sizes = np.asarray(cluster_sizes)
+        self.smoothing_method = smoothing_method
+        self.new_movies = [] #(name, cluster, distance to medoid, outlier)
+
+    def assign(self, array_emotions, name=None, record=True):
+        '''
+        parameters:
+        -----------
+        array_emotions: np.array [time, emotions] of raw emotion counts
+        name: STR, kept in the drift report
+        record: BOOL, on True the movie counts for the drift report
+
+        returns:
+        --------
+        dictionary with
+            'cluster': filename of the medoid of the cluster
+            'distance to medoid': DTW distance to that medoid
+            'outlier': BOOL, True if the movie is further from the medoid
+                       than 95 % of the movies of the cluster
+            'time (ms)': time spent smoothing and comparing
+        '''
+        start = time.time()
+        smoothed = smooth_array(array_emotions, self.smoothing_method)
+        result = self.assign_smoothed(smoothed, name=name, record=record)
+        result['time (ms)'] = (time.time() - start) * 1000.
+        return result
+
+    def assign_smoothed(self, smoothed, name=None, record=True):
+        '''
+        same as assign, for an array already smoothed with smoothing_method
+        '''
+        distances = np.array([acc_dtw.dtw(smoothed, reference)[0]
+                              for reference in self.reference_arrays])
+        label = self.reference_labels[distances.argmin()]
+        distance_to_medoid = distances[label] #medoids are stored first
+        outlier = distance_to_medoid > self.radius[label]
+        if record:
+            self.new_movies.append((name, label, distance_to_medoid, outlier))
+        return {'cluster': self.medoid_names[label],
+                'distance to medoid': distance_to_medoid,
+                'outlier': bool(outlier)}
+
+    def drift_report(self, max_new_fraction=0.1, max_outlier_rate=0.2,
+                     verbose=True):
+        '''
+        parameters:
+        -----------
+        max_new_fraction: re-clustering is advised once the movies assigned
+                          represent this fraction of the clustered corpus
+        max_outlier_rate: or once this fraction of the movies assigned are
+                          outliers (the clusters do not describe them well)
+        verbose: BOOL, prints the report
+
+        returns:
+        --------
+        dictionary with the counts, rates, and 'recluster' (BOOL)
+        '''
+        k = len(self.medoid_names)
+        n_new = len(self.new_movies)
+        labels = np.array([label for _, label, _, _ in self.new_movies],
+                          dtype=np.int64)
+        outliers = np.array([outlier for _, _, _, outlier in self.new_movies],
+                            dtype=bool)
+        new_fraction = n_new * 1. / self.cluster_sizes.sum()
+        outlier_rate = outliers.mean() if n_new else 0.
+        reasons = []
+        if new_fraction >= max_new_fraction:
+            reasons.append('%.0f %% new movies' %(new_fraction * 100))
+        if n_new and outlier_rate >= max_outlier_rate:
+            reasons.append('%.0f %% outliers' %(outlier_rate * 100))
+        report = {'new movies': n_new,
+                  'new fraction': new_fraction,
+                  'outlier rate': outlier_rate,
+                  'new per cluster': np.bincount(labels, minlength=k),
+                  'outliers per cluster': np.bincount(labels[outliers],
+                                                      minlength=k),
+                  'recluster': bool(reasons),
+                  'reasons': reasons}
+        if verbose:
+            print '*'*50
+            print 'movies assigned since the clustering: %d (%.1f %%)' \
+                    %(n_new, new_fraction * 100)
+            for i, medoid in enumerate(self.medoid_names):
+                print '%s: %d movies, %d new, %d outliers' \
+                        %(medoid, self.cluster_sizes[i],
+                          report['new per cluster'][i],
+                          report['outliers per cluster'][i])
+            if reasons:
+                print 're-clustering advised: ' + ', '.join(reasons)
+            else:
+                print 'the clusters are still up to date'
+            print '*'*50
+        return report
+
+    def save(self, path=config.CLUSTER_MODEL_PKL):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_cluster_model(path=config.CLUSTER_MODEL_PKL):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def _references(distances, clusters, medoids, n_members):
+    '''
+    returns:
+    --------
+    indices of the stored plotlines (medoids first), cluster of each of
+    them, radius and size of each cluster (see ClusterModel)
+    '''
+    k = len(medoids)
+    references = list(medoids)
+    labels = range(k)
+    radius = np.zeros(k)
+    sizes = np.zeros(k, dtype=np.int64)
+    for i, medoid in enumerate(medoids):
+        members = np.where(clusters == medoid)[0]
+        to_medoid = np.asarray(distances[medoid])[members]
+        sizes[i] = len(members)
+        radius[i] = np.percentile(to_medoid, 95)
+        order = members[np.argsort(to_medoid)]
+        closest = [member for member in order if member != medoid][:n_members]
+        references += closest
+        labels += [i] * len(closest)
+    return references, labels, radius, sizes
+
+def build_cluster_model(movies, distances, clusters, medoids,
+                        list_smooth_arrays, n_members=0,
+                        smoothing_method='lowess'):
+    '''
+    parameters:
+    -----------
+    movies: list of the filenames of the movies
+    distances: square array of pairwise distances
+    clusters, medoids: as returned by medoids.cluster (index of the medoid of
+                       each movie, indices of the medoids)
+    list_smooth_arrays: smoothed arrays of the movies (same order as movies),
+                        only the ones of the stored plotlines are kept
+    n_members: number of movies closest to each medoid stored in addition
+               to the medoid (more precise assignment, slower)
+    smoothing_method: smoothing used for list_smooth_arrays
+
+    returns:
+    --------
+    ClusterModel
+    '''
+    medoids = np.asarray(medoids)
+    references, labels, radius, sizes = _references(distances, clusters,
+                                                    medoids, n_members)
+    movies = np.array(movies)
+    return ClusterModel(medoid_names=movies[medoids],
+                        reference_names=movies[references],
+                        reference_arrays=[list_smooth_arrays[index]
+                                          for index in references],
+                        reference_labels=labels,
+                        radius=radius,
+                        cluster_sizes=sizes,
+                        smoothing_method=smoothing_method)
+
+def build_from_saved_arrays(movies, distances, clusters, medoids,
+                            n_members=0, smoothing_method='lowess'):
+    '''
+    same as build_cluster_model, with the smoothed arrays computed from the
+    emotion arrays saved by emotions_script.py ('../data/emotions/arrays'),
+    only for the plotlines stored in the model
+
+    returns:
+    --------
+    ClusterModel
+    '''
+    from dtw_script import prepare_smooth_array
+    references = _references(distances, clusters, np.asarray(medoids),
+                             n_members)[0]
+    smooth_arrays = dict((index, prepare_smooth_array(movies[index],
+                                                      smoothing_method))
+                         for index in references)
+    return build_cluster_model(movies, distances, clusters, medoids,
+                               smooth_arrays, n_members=n_members,
+                               smoothing_method=smoothing_method)
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'build':
+        import medoids as md
+        k = int(sys.argv[2])
+        movies, distances = md.load_distances()
+        chosen_medoids, medoid_movies, clusters, d1, d2 = \
+                                md.chosen_num_cluster(movies, k, distances)
+        model = build_from_saved_arrays(movies, distances, clusters,
+                                        chosen_medoids, n_members=2)
+        model.save()
+        print 'model saved for the medoids: ' + ', '.join(medoid_movies)
+
+    elif sys.argv[1] == 'assign':
+        model = load_cluster_model()
+        result = model.assign(np.load(sys.argv[2]), name=sys.argv[2])
+        #the movie counts in the drift report of the saved model
+        model.save()
+        print 'cluster: %s | distance to medoid: %.2f | outlier: %s' \
+                %(result['cluster'], result['distance to medoid'],
+                  result['outlier'])
+
+    elif sys.argv[1] == 'drift':
+        report = load_cluster_model().drift_report()
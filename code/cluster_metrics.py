@@ -0,0 +1,135 @@
+'''
+quality measures of a clustering, computed from the distance matrix and the
+label of each movie
+
+all the measures rely on the same grouped reduction: for a block of rows of
+the distance matrix, the distances of each movie to each cluster are summed
+with np.bincount (no m x m mask, no Python loop over the movies). The time
+is O(m^2), the extra memory O(m) plus one block of rows.
+
+- cluster_costs: average intra-cluster cost of each cluster (the cost used
+  by medoids.cost and medoids.clusters_k)
+- medoid_distances: distances of the movies of each cluster to their medoid
+  (data of the histograms of medoids.visualize_clusters)
+- silhouette_samples / silhouette_score: silhouette of each movie, and its
+  average (close to 1: well separated clusters, close to 0 or negative:
+  overlapping clusters), used to pick the number of clusters
+
+labels: the clusters are given as in medoids.py, by the index of the medoid
+of each movie; cluster_codes turns them into integers 0..k-1
+'''
+
+import numpy as np
+
+#number of distances read per block of rows (about 32 MB of float64)
+BLOCK_ELEMENTS = 2**22
+
+def cluster_codes(clusters, medoids=None):
+    '''
+    parameters:
+    -----------
+    clusters: np.array giving for each movie the index of its medoid
+    medoids: np.array of the indices of the medoids, giving the order of the
+             clusters (defaults to increasing medoid index)
+
+    returns:
+    --------
+    codes: np.array giving for each movie its cluster as an integer 0..k-1
+    k: number of clusters
+    '''
+    clusters = np.asarray(clusters)
+    if medoids is None:
+        medoids, codes = np.unique(clusters, return_inverse=True)
+        return codes, len(medoids)
+    medoids = np.asarray(medoids)
+    lookup = np.full(len(clusters), -1, dtype=np.int64)
+    lookup[medoids] = np.arange(len(medoids))
+    return lookup[clusters], len(medoids)
+
+def row_cluster_sums(distances, codes, k, block_elements=BLOCK_ELEMENTS):
+    '''
+    generator over blocks of rows of the distance matrix
+
+    yields:
+    -------
+    start, stop: the rows of the block
+    sums: np.array [stop-start, k], sum of the distances from each movie of
+          the block to the movies of each cluster
+    '''
+    m = len(codes)
+    block = max(1, block_elements // max(m, 1))
+    for start in xrange(0, m, block):
+        stop = min(start + block, m)
+        rows = np.asarray(distances[start:stop], dtype=np.float64)
+        n_rows = stop - start
+        bins = (np.arange(n_rows)[:, None] * k + codes[None, :]).ravel()
+        sums = np.bincount(bins, weights=rows.ravel(), minlength=n_rows * k)
+        yield start, stop, sums.reshape(n_rows, k)
+
+def cluster_costs(distances, codes, k):
+    '''
+    returns:
+    --------
+    np.array of size k: for each cluster, the sum of the distances between
+    all pairs of its movies, divided by its number of movies
+    '''
+    totals = np.zeros(k)
+    for start, stop, sums in row_cluster_sums(distances, codes, k):
+        own = codes[start:stop]
+        totals += np.bincount(own, weights=sums[np.arange(stop - start), own],
+                              minlength=k)
+    sizes = np.bincount(codes, minlength=k)
+    return totals / np.maximum(sizes, 1)
+
+def medoid_distances(distances, clusters, medoids):
+    '''
+    returns:
+    --------
+    list (in the order of medoids) of np.arrays: distances of the movies of
+    each cluster to its medoid
+    '''
+    return [np.asarray(distances[medoid])[clusters == medoid]
+            for medoid in medoids]
+
+def silhouette_samples(distances, codes, k):
+    '''
+    returns:
+    --------
+    np.array, silhouette of each movie (0 for the movies alone in their
+    cluster)
+    '''
+    m = len(codes)
+    sizes = np.bincount(codes, minlength=k).astype(np.float64)
+    silhouettes = np.zeros(m)
+    if k < 2:
+        return silhouettes
+    for start, stop, sums in row_cluster_sums(distances, codes, k):
+        rows = np.arange(stop - start)
+        own = codes[start:stop]
+        #a: mean distance to the other movies of the cluster
+        a = sums[rows, own] / np.maximum(sizes[own] - 1, 1)
+        #b: mean distance to the movies of the closest other cluster
+        means = sums / np.maximum(sizes, 1)
+        means[:, sizes == 0] = np.inf
+        means[rows, own] = np.inf
+        b = means.min(axis=1)
+        denominator = np.maximum(a, b)
+        block = np.where(denominator > 0,
+                         (b - a) / np.where(denominator > 0, denominator, 1),
+                         0.)
+        block[sizes[own] <= 1] = 0.
+        silhouettes[start:stop] = block
+    return silhouettes
+
+def silhouette_score(distances, codes, k):
+    '''
+    returns:
+    --------
+    average silhouette of the movies, and np.array of size k with the
+    average silhouette of each cluster
+    '''
+    silhouettes = silhouette_samples(distances, codes, k)
+    sizes = np.bincount(codes, minlength=k)
+    per_cluster = np.bincount(codes, weights=silhouettes, minlength=k) \
+                  / np.maximum(sizes, 1)
+    return silhouettes.mean(), per_cluster
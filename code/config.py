@@ -0,0 +1,43 @@
+'''
+paths of the data read and written by the scripts
+
+all of them are in DATA_DIR, '../data' by default (the scripts are run from
+the code folder, the notebooks from the jupyter folder); to work on another
+folder, set the environment variable PLOTLINE_DATA_DIR, for instance
+$ PLOTLINE_DATA_DIR=/path/to/data python dtw_script.py
+'''
+
+import os
+
+DATA_DIR = os.environ.get('PLOTLINE_DATA_DIR', '../data')
+
+def data_path(*parts):
+    return os.path.join(DATA_DIR, *parts)
+
+#scraping (scraping_script.py)
+SCRAPING_DIR = data_path('scraping')
+TEXTS_DIR = data_path('scraping', 'texts')
+SCRAPING_CACHE_DIR = data_path('scraping', 'cache')
+SCRAPING_DB = data_path('scraping', 'scraping.db')
+SUCCESSFUL_CSV = data_path('scraping', 'successful_files.csv')
+PDF_CSV = data_path('scraping', 'movies_pdf_script.csv')
+ERROR_CSV = data_path('scraping', 'scraping_error.csv')
+
+#emotions (emotions_script.py, load_plotline.py)
+NRC_EMOTIONS_FILE = data_path('emotions', 'NRC_emotions.txt')
+ARRAYS_DIR = data_path('emotions', 'arrays')
+SMOOTHED_DIR = data_path('emotions', 'smoothed') #streaming_pipeline.py
+GRAPHS_DIR = data_path('emotions', 'graphs')
+
+#distances and clusters (dtw_script.py, medoids.py...)
+DISTANCES_NPY = data_path('distances.npy')
+DISTANCE_MOVIES = data_path('distance_movies.txt')
+DISTANCES_PKL = data_path('distances.pkl')
+CLUSTERS_PKL = data_path('clusters.pkl')
+CLUSTER_MODEL_PKL = data_path('cluster_model.pkl')
+KNN_INDEX_NPZ = data_path('knn_index.npz')
+
+#state of the pipeline (pipeline.py), metrics of the runs (instrumentation.py)
+PIPELINE_STATE = data_path('pipeline_state.json')
+METRICS_DIR = data_path('metrics')
+BENCHMARKS_DIR = data_path('benchmarks') #benchmark.py
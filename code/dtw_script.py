@@ -10,13 +10,15 @@ Usage:
 ------
 To execute this script, type in a terminal
 $ python dtw_script.py
+(add no_pickle to skip the dictionary distances.pkl, only used by the
+notebooks)
 
 Challenges --> choices:
 -----------------------
 comparing plots: Dynamic Time Wrapping
                 the original python package was very slow. Remi Lehe used numba
                 to accelerate the algorithm by a factor 100 (essentially
-                removing nested for loops)
+                removing nested for loops), see benchmark.py to measure it
 definig a norm: taking all emotions into account
                 + penalizing big peaks that do not match -->abs(x^2 - y^2)
                 the norm is hard coded in the acc_dtw function
@@ -24,24 +26,34 @@ definig a norm: taking all emotions into account
 
 Files created:
 --------------
-in ../data folder: the dictionary of distances is pickled as 'distances.pkl'
+in ../data folder: the square matrix of distances is saved as 'distances.npy'
+        the movies of its rows and columns in 'distance_movies.txt' (one per
+        line, sorted filenames: the order, and so the cluster indices, do not
+        change from one run to the next)
+                   the dictionary of distances is pickled as 'distances.pkl'
         structure key: movie title 1
                   value: key --> movie title 2
                          value --> distance
 '''
 
 import acc_dtw
-import dtw #original package
+import config
 import os
+import sys
 from collections import defaultdict
 import numpy as np
 import cPickle as pickle
 
 from load_plotline import LoadPlotLine
-from plotline_utilities import progression_bar
+from instrumentation import Progress, save_metrics
 
-def prepare_smooth_array(filename):
+def prepare_smooth_array(filename, smoothing_method='lowess'):
     '''
+    parameters:
+    -----------
+    filename: STR, such that '../data/emotions/arrays/filename.npy' exists
+    smoothing_method: STR, see plotline_utilities.SMOOTHING_METHODS
+
     returns:
     --------
     np array [time, emotions], with smoothed counts
@@ -49,7 +61,7 @@ def prepare_smooth_array(filename):
     time2 [emotion1, emotion2, emotion3,...]
     ...
     '''
-    plotline = LoadPlotLine(filename)
+    plotline = LoadPlotLine(filename, smoothing_method=smoothing_method)
     plotline.load_emotions()
     plotline.make_emotion_dictionary(list_emotions=range(10))
     return plotline.smoothed_array_emotions
@@ -61,7 +73,7 @@ def distance(x, y):
     """
     return( abs( (x**2 - y**2).sum(axis=-1) ) )
 
-def get_distance(arr1, arr2, norm=distance, acc_option=True):
+def get_distance(arr1, arr2, norm=distance, acc_option=True, phases=None):
     '''
     parameters:
     -----------
@@ -74,6 +86,8 @@ def get_distance(arr1, arr2, norm=distance, acc_option=True):
           different heights.
     acc_option: defaults to True, to use acc_dtw (accelerated version of Dynamic
     Time Wrapping). Setting option to False leads to standard dtw
+    phases: acc_dtw.DTWPhases timing the phases of acc_dtw.dtw (None: not
+            timed)
 
     returns:
     --------
@@ -83,14 +97,107 @@ def get_distance(arr1, arr2, norm=distance, acc_option=True):
     '''
     if acc_option:
         min_dist, cost_matrix, acc_cost_matrix, wrap_path =\
-                            acc_dtw.dtw(arr1, arr2)
+                            acc_dtw.dtw(arr1, arr2, phases)
     else:
+        import dtw #original package, only needed for the comparison
         min_dist, cost_matrix, acc_cost_matrix, wrap_path =\
                         dtw.dtw(arr1, arr2, dist=norm)
 
     return min_dist
 
-def dtw_dictionary():
+def list_legit_files(path_to_file=config.ARRAYS_DIR):
+    '''
+    returns:
+    --------
+    sorted list of the movies (filenames without .npy) in path_to_file
+    the order is the order of the rows of the distance matrix
+    '''
+    files = os.listdir(path_to_file)
+    return sorted(filename[:-4] for filename in files
+                  if filename[-3:]=='npy')
+
+def prepare_all_arrays(legit_files, smoothing_method='lowess'):
+    '''
+    returns:
+    --------
+    list of the smoothed arrays (see prepare_smooth_array), in the order of
+    legit_files
+    '''
+    list_smooth_arrays = []
+    with Progress(len(legit_files), 'smoothing') as progress:
+        for filename in legit_files:
+            arr = prepare_smooth_array(filename,
+                                       smoothing_method=smoothing_method)
+            list_smooth_arrays.append(arr)
+            progress.update()
+    return list_smooth_arrays
+
+def condensed_distances(list_smooth_arrays):
+    '''
+    returns:
+    --------
+    np.array of size m(m-1)/2: the distance between the movies i < j, ordered
+    as (0,1), (0,2)..., (0,m-1), (1,2)... (the order of scipy pdist, see
+    square_distances)
+    '''
+    m = len(list_smooth_arrays)
+    condensed = np.empty(m * (m - 1) // 2)
+    position = 0
+    #the timers of the phases of the DTW are updated once per row
+    phases = acc_dtw.DTWPhases()
+    #one item per pair, the early rows have more pairs
+    with Progress(len(condensed), 'distances') as progress:
+        for index1 in xrange(m):
+            arr1 = list_smooth_arrays[index1]
+            for index2 in xrange(index1+1, m):
+                condensed[position] = get_distance(arr1,
+                                                   list_smooth_arrays[index2],
+                                                   phases=phases)
+                position += 1
+            phases.flush()
+            progress.update(m - index1 - 1)
+    return condensed
+
+def square_distances(condensed):
+    '''
+    returns:
+    --------
+    square np.array (symmetric, 0 on the diagonal) from the condensed
+    distances
+    '''
+    m = int(round((1 + np.sqrt(1 + 8 * len(condensed))) / 2))
+    distances = np.zeros((m, m))
+    upper = np.triu_indices(m, 1) #same order as condensed_distances
+    distances[upper] = condensed
+    distances.T[upper] = condensed
+    return distances
+
+def save_distances(movies, distances, path=config.DISTANCES_NPY,
+                   path_movies=config.DISTANCE_MOVIES):
+    '''
+    saves the square matrix (np.save, can be memory-mapped, see clara.py) and
+    the movies in the order of its rows (one filename per line)
+    '''
+    np.save(path, distances)
+    with open(path_movies, 'w') as f:
+        f.write('\n'.join(movies) + '\n')
+
+def dictionary_from_matrix(movies, distances):
+    '''
+    returns:
+    --------
+    dictionary of distances d[movie1][movie2] (former format of
+    distances.pkl, used by the notebooks)
+    '''
+    full_dictionary = defaultdict(dict)
+    for index1, movie1 in enumerate(movies):
+        row = distances[index1].tolist()
+        del row[index1]
+        others = movies[:index1] + movies[index1+1:]
+        full_dictionary[movie1] = dict(zip(others, row))
+    return full_dictionary
+
+def dtw_matrix(smoothing_method='lowess'):
     '''
     takes in the .npy files in arrays
     uses de load_plotline to produce a smooth plot (x,y values)
@@ -98,44 +205,36 @@ def dtw_dictionary():
 
     return:
     -------
-
+    list of the movies (sorted filenames)
+    square np.array of the pairwise distances, in the order of the movies
     '''
-    # Loop through the script files
-    path_to_file = '../data/emotions/arrays'
-    files = os.listdir(path_to_file)
-    legit_files = [filename[:-4] for filename in files if filename[-3:]=='npy']
-    Ntot = len(legit_files)
+    legit_files = list_legit_files()
     #prepare all arrays
     print "Preparing all the files"
-    list_smooth_arrays = []
-    index = 0
-    for filename in legit_files:
-        arr = prepare_smooth_array(filename)
-        list_smooth_arrays.append(arr)
-        index += 1
-        progression_bar(index, Ntot, Nbars=60, char='-')
-
+    list_smooth_arrays = prepare_all_arrays(legit_files, smoothing_method)
 
     #looking at the similarity in the plots
-    print "\n"
     print "Computing all the distances"
-    full_dictionary = defaultdict(dict)
-    index = 0
-    for index1 in xrange(len(legit_files)):
-        filename1 = legit_files[index1]
-        arr1 = list_smooth_arrays[index1]
-        for index2 in xrange(index1+1,len(legit_files)):
-            filename2 = legit_files[index2]
-            arr2 = list_smooth_arrays[index2]
-            min_distance = get_distance(arr1, arr2)
-            full_dictionary[filename1][filename2] = min_distance
-            full_dictionary[filename2][filename1] = min_distance
-        index += 1
-        progression_bar(index, Ntot, Nbars=60, char='-')
-    return full_dictionary
+    distances = square_distances(condensed_distances(list_smooth_arrays))
+    return legit_files, distances
+
+def dtw_dictionary():
+    '''
+    same as dtw_matrix, with the distances as a dictionary
+    d[movie1][movie2]
+
+    return:
+    -------
+    dictionary of distances
+    '''
+    movies, distances = dtw_matrix()
+    return dictionary_from_matrix(movies, distances)
 
 if __name__ == "__main__":
-    d = dtw_dictionary()
-    with open('../data/distances.pkl', 'w') as f:
-        pickle.dump(d, f)
-    print "\n"
+    movies, distances = dtw_matrix()
+    save_distances(movies, distances)
+    if 'no_pickle' not in sys.argv:
+        d = dictionary_from_matrix(movies, distances)
+        with open(config.DISTANCES_PKL, 'w') as f:
+            pickle.dump(d, f)
+    save_metrics('dtw_script')
@@ -22,7 +22,8 @@ increasing speed of code: i) read NRC_emotions.txt into a dataframe,
                           ii) pivot dataframe (to have word as index),
                           iii) export to dictionary (word as key, 0/1s as array)
                           iv) pretty obvious: vocabulary as set
-detecting emotions: words are lemmatized (time consumming operation)
+detecting emotions: words are lemmatized (time consumming operation, so each
+                   different word is lemmatized once, see LemmaCache)
                    i) not stemmed, to keep real words to look up
                    ii) sarcastic phrasing, or negative phrases, are not detected
                     ('he was not happy' --> 'happy' will count as positive)
@@ -35,7 +36,8 @@ in ../data/emotions/arrays folder: all of the emotion counts available in .npy
 import pandas as pd
 import numpy as np
 import os
-from plotline_utilities import progression_bar
+import config
+from instrumentation import Progress, save_metrics, timer
 
 from nltk.stem import WordNetLemmatizer
 
@@ -54,8 +56,10 @@ def load_dictionary_and_vocabulary(filename):
 
     '''
     # Load the NRC emotions
+    #keep_default_na: the word 'null' is in the lexicon (read as NaN otherwise)
     emotion_df = pd.read_csv(filename,
-                     delim_whitespace=True, header=None)
+                     delim_whitespace=True, header=None,
+                     keep_default_na=False)
     reshaped_df = emotion_df.pivot( 0, 1, 2 )
 
     # Get the list of existing words
@@ -68,30 +72,63 @@ def load_dictionary_and_vocabulary(filename):
     return emotion_dict, vocabulary
 
 #######text clean-up (lemmatize, lowercase)
-def get_clean_text(list_filenames, path_to_file):
+class LemmaCache(object):
+    '''
+    lemmatizes each different word only once: a script uses a few thousand
+    different words, so most lookups are answered from the dictionary
+    '''
+    def __init__(self):
+        self.wnl = WordNetLemmatizer()
+        self.lemmas = {}
+
+    def lemmatize(self, word):
+        #word is already lowercase
+        lemma = self.lemmas.get(word)
+        if lemma is None:
+            lemma = self.wnl.lemmatize(word)
+            self.lemmas[word] = lemma
+        return lemma
+
+def text_to_words(text, lemma_cache):
+    '''
+    parameters:
+    -----------
+    text: STR, content of a script
+    lemma_cache: LemmaCache
+
+    returns:
+    --------
+    list of words (lemmatize, lowercase) in the text (order preserved)
+    '''
+    lemmatize = lemma_cache.lemmatize
+    with timer('tokenize'):
+        tokens = [word.lower() for line in text.split('\n')
+                  for word in line.strip().split(' ') if word]
+    with timer('lemmatize'):
+        words = [lemmatize(token) for token in tokens]
+    return [word for word in words if word]
+
+def get_clean_text(list_filenames, path_to_file, lemma_cache=None):
     '''
     parameter:
     ----------
     list_filenames: as LST is a list of filename as STR
     path_to_file: as STR is the path to the file containing movie scripts
     --> such that path_to_file/filename.txt is the file to open
+    lemma_cache: LemmaCache, to share the lemmas between calls
 
     returns:
     --------
     list of list of words (lemmatize, lowercase) in the text (order preserved)
     '''
-    wnl = WordNetLemmatizer()
+    if lemma_cache is None:
+        lemma_cache = LemmaCache()
     list_texts_as_words = []
     for filename in list_filenames:
         path_file = path_to_file+"/"+filename+".txt"
         with open(path_file) as f:
-            text = f.readlines()
-            lines = [line.strip() for line in text if line.strip()]
-            string_words = []
-            for line in lines:
-                words = [wnl.lemmatize(word.lower()) for word in line.split(' ') if wnl.lemmatize(word.lower())]
-                string_words += words
-        list_texts_as_words.append(string_words)
+            text = f.read()
+        list_texts_as_words.append(text_to_words(text, lemma_cache))
     return list_texts_as_words
 
 #######get chunks of text
@@ -148,9 +185,52 @@ def emotion_counts(list_words, emotion_dict, vocabulary):
 
     return emotion_count
 
+def emotion_matrix(emotion_dict):
+    '''
+    returns:
+    --------
+    dictionary with word as key and row number as value
+    np.array [words, emotions] of the 0/1s of emotion_dict
+    '''
+    words = sorted(emotion_dict)
+    word_rows = dict((word, row) for row, word in enumerate(words))
+    matrix = np.array([emotion_dict[word] for word in words], dtype=np.float64)
+    return word_rows, matrix
+
+def emotion_array(text, word_rows, matrix, size_block=100):
+    '''
+    same counts as emotion_counts on each window of window_blocks, for all the
+    windows at once
+
+    parameters:
+    -----------
+    text: list of words in a textfile
+    word_rows, matrix: see emotion_matrix
+    size_block: size of the window
+
+    returns:
+    --------
+    an array [time, emotions] (see get_emotions)
+    '''
+    with timer('score'):
+        n_windows = len(xrange(0, len(text)-size_block, size_block))
+        n_words = n_windows * size_block
+        rows = np.fromiter((word_rows.get(word, -1)
+                            for word in text[:n_words]),
+                           dtype=np.int64, count=n_words)
+        known = rows >= 0
+        windows = np.arange(n_words)[known] // size_block
+        counts = np.empty((n_windows, matrix.shape[1]))
+        for emotion in xrange(matrix.shape[1]):
+            counts[:, emotion] = np.bincount(
+                                    windows,
+                                    weights=matrix[rows[known], emotion],
+                                    minlength=n_windows)
+    return counts
+
 def get_emotions(filename, path_to_file, emotion_dict, vocabulary,
                  print_to_file=False,
-                 verbose=False):
+                 verbose=False, lemma_cache=None, emotion_rows=None):
     '''
     parameters:
     -----------
@@ -162,7 +242,10 @@ def get_emotions(filename, path_to_file, emotion_dict, vocabulary,
     vocabulary: all the words from the previous dictionary in set
     print_to_file: BOOL gives the option to save the counts as array in
                     ../data/emotions/arrays/filename.npy
-    verbose: BOOL that prints progress (every 10 windows treated)
+    verbose: BOOL that prints the number of windows
+    lemma_cache: LemmaCache, to share the lemmas between scripts
+    emotion_rows: (word_rows, matrix) from emotion_matrix, to avoid building
+                  it for each script
 
     returns:
     --------
@@ -170,41 +253,50 @@ def get_emotions(filename, path_to_file, emotion_dict, vocabulary,
         time1[emotion1, emotion2, emotion3, ..., emotion10]
         time2[emotion1, emotion2, emotion3, ..., emotion10]
     '''
-    text = get_clean_text([filename], path_to_file)[0]
-    list_windows = window_blocks(text, size_block=100)
+    text = get_clean_text([filename], path_to_file, lemma_cache)[0]
+    if emotion_rows is None:
+        emotion_rows = emotion_matrix(emotion_dict)
+    word_rows, matrix = emotion_rows
+    array_emotions = emotion_array(text, word_rows, matrix, size_block=100)
     if verbose:
-        print 'New file:', len(list_windows)
-    list_emotions=[]
-    index = 0
-    for window in list_windows:
-        index +=1
-        list_emotions.append(emotion_counts(window, emotion_dict , vocabulary))
-        if index%10==0 and verbose:
-            print index
-    array_emotions = np.array(list_emotions)
+        print 'New file:', len(array_emotions)
     if print_to_file:
-        path_to_file = "../data/emotions/arrays/"+filename
+        path_to_file = os.path.join(config.ARRAYS_DIR, filename)
         np.save(path_to_file, array_emotions)
     return array_emotions
 
-if __name__ == '__main__':
-    NRC_emotions_file = '../data/emotions/NRC_emotions.txt'
+def emotions_all(path_to_file=config.TEXTS_DIR,
+                 NRC_emotions_file=config.NRC_EMOTIONS_FILE):
+    '''
+    saves the emotion counts of all the scripts of path_to_file in
+    config.ARRAYS_DIR
+
+    returns:
+    --------
+    number of scripts
+    '''
     print 'Loading the NRC emotions database, please wait.'
     emotion_dictionary, vocabulary = \
                             load_dictionary_and_vocabulary(NRC_emotions_file)
 
     # Create the proper directories
-    if not os.path.exists('../data/emotions/arrays'):
-        os.mkdir('../data/emotions/arrays')
+    if not os.path.exists(config.ARRAYS_DIR):
+        os.mkdir(config.ARRAYS_DIR)
 
     # Loop through the script files
-    path_to_file = '../data/scraping/texts'
     files = os.listdir(path_to_file)
-    index = 1
     legit_files = [filename for filename in files if filename[-3:]=='txt']
     Ntot = len(legit_files)
-    for filename in legit_files:
-        get_emotions( filename[:-4], path_to_file, emotion_dictionary,
-                    vocabulary, print_to_file=True, verbose=False)
-        progression_bar(index, Ntot, Nbars=60, char='-')
-        index += 1
+    lemma_cache = LemmaCache()
+    emotion_rows = emotion_matrix(emotion_dictionary)
+    with Progress(Ntot, 'emotions') as progress:
+        for filename in legit_files:
+            get_emotions( filename[:-4], path_to_file, emotion_dictionary,
+                        vocabulary, print_to_file=True, verbose=False,
+                        lemma_cache=lemma_cache, emotion_rows=emotion_rows)
+            progress.update()
+    return Ntot
+
+if __name__ == '__main__':
+    emotions_all()
+    save_metrics('emotions_script')
@@ -0,0 +1,135 @@
+'''
+this script saves the graph of every movie as png, without any display
+i) the raw data as .npy is found in '../data/emotions/arrays'
+ii) the movies are spread over a pool of processes, each process smoothes
+    the movies it receives and draws them on its own figure (Agg backend,
+    the figure is created once and reused for all its movies)
+iii) each graph is saved once in '../data/emotions/graphs/'
+
+the progression can be followed on the terminal, and the throughput is
+printed at the end
+
+Usage:
+------
+To execute this script, type in a terminal
+$ python export_graphs.py
+or, to choose the number of processes (defaults to the number of cpus)
+$ python export_graphs.py 4
+'''
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import config
+from load_plotline import LoadPlotLine, graph_path
+from instrumentation import Progress, save_metrics
+
+#figure of the worker process, created by _init_worker
+_figure = None
+
+def _init_worker():
+    global _figure
+    _figure = Figure(figsize=(8, 6))
+    FigureCanvasAgg(_figure)
+
+def export_graph(args):
+    '''
+    parameters:
+    -----------
+    args: tuple (filename, list_emotions, path_save)
+          filename: STR, such that '../data/emotions/arrays/filename.npy'
+          list_emotions: list of integers of the emotions to plot
+          path_save: directory in which to save filename.png
+
+    returns:
+    --------
+    filename, time spent (in s), error message (None if successful)
+    '''
+    filename, list_emotions, path_save = args
+    if _figure is None:
+        _init_worker()
+    start = time.time()
+    try:
+        _figure.clf()
+        _figure.subplots_adjust(right=0.73)
+        ax = _figure.add_subplot(111)
+        plotline = LoadPlotLine(filename)
+        plotline.load_emotions()
+        plotline.draw_emotions(ax, list_emotions=list_emotions)
+        _figure.savefig(graph_path(filename, path_save), transparent=True,
+                        format='png')
+    except Exception as error:
+        return filename, time.time() - start, str(error)
+    return filename, time.time() - start, None
+
+def export_all(legit_files, list_emotions=range(5)+range(7,10),
+               path_save=config.GRAPHS_DIR, n_workers=None):
+    '''
+    parameters:
+    -----------
+    legit_files: list of filenames (without extension)
+    list_emotions: list of integers of the emotions to plot
+                   (all emotions except positive and negative by default)
+    path_save: directory in which the png are saved
+    n_workers: number of processes, defaults to the number of cpus
+
+    returns:
+    --------
+    dictionary with the throughput statistics
+    '''
+    if n_workers is None:
+        n_workers = cpu_count()
+    if not os.path.exists(path_save):
+        os.mkdir(path_save)
+    tasks = [(filename, list_emotions, path_save) for filename in legit_files]
+    Ntot = len(tasks)
+    errors = []
+    worker_time = 0.
+    start = time.time()
+    pool = Pool(n_workers, initializer=_init_worker)
+    progress = Progress(Ntot, 'graphs')
+    try:
+        chunksize = max(1, Ntot // (4 * n_workers))
+        results = pool.imap_unordered(export_graph, tasks, chunksize)
+        for filename, elapsed, error in results:
+            worker_time += elapsed
+            if error is not None:
+                errors.append((filename, error))
+            progress.update()
+    finally:
+        progress.close()
+        pool.close()
+        pool.join()
+    total_time = time.time() - start
+    return {'movies': Ntot,
+            'errors': errors,
+            'workers': n_workers,
+            'total time (s)': total_time,
+            'movies/s': Ntot / total_time if total_time > 0 else 0.,
+            'ms/movie in a worker': worker_time * 1000. / max(Ntot, 1)}
+
+if __name__ == '__main__':
+    n_workers = None
+    if len(sys.argv) > 1:
+        n_workers = int(sys.argv[1])
+
+    path_to_file = config.ARRAYS_DIR
+    files = os.listdir(path_to_file)
+    legit_files = [filename[:-4] for filename in files if filename[-3:]=='npy']
+    stats = export_all(legit_files, n_workers=n_workers)
+
+    print '%d graphs saved with %d processes in %.1f s' \
+            %(stats['movies'] - len(stats['errors']), stats['workers'],
+              stats['total time (s)'])
+    print 'throughput: %.1f movies/s | %.1f ms/movie in a worker' \
+            %(stats['movies/s'], stats['ms/movie in a worker'])
+    for filename, error in stats['errors']:
+        print 'failed: ' + filename + ' (' + error + ')'
+    save_metrics('export_graphs', extra={'throughput': stats})
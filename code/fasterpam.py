@@ -0,0 +1,216 @@
+'''
+k-medoids clustering with the FasterPAM swap algorithm
+(Schubert and Rousseeuw, "Fast and eager k-medoids clustering: O(k) runtime
+improvement of the PAM, CLARA, and CLARANS algorithms", 2021)
+
+instead of alternating between assigning the points and recomputing the
+medoid of each cluster (medoids.cluster with method='voronoi'), FasterPAM
+looks for the swap (medoid out, datapoint in) that lowers the total distance
+of the points to their closest medoid:
+i) for each datapoint, the distance to the nearest and to the second nearest
+   medoid are kept in memory
+ii) thanks to these, the gain of swapping a candidate datapoint with each of
+    the k medoids is computed in a single pass over the datapoints (O(m))
+iii) the best swap for a candidate is applied as soon as it lowers the cost
+     (eager swapping), and the candidates are visited in turn until a whole
+     pass does not improve the clustering
+
+the loops are compiled with numba (as in acc_dtw)
+
+note: the distance matrix is assumed to be symmetric (as the DTW distances
+are), so that the distances to a candidate are read along a row
+'''
+
+import numpy as np
+import numba
+
+from instrumentation import count
+
+@numba.jit(nopython=True)
+def nearest_two(distances, medoids, nearest, d_nearest, d_second):
+    '''
+    fills, for each datapoint, the position (in medoids) of the nearest
+    medoid, the distance to it and the distance to the second nearest medoid
+    (distances only needs the rows of the medoids, one column per datapoint)
+    '''
+    for o in range(distances.shape[1]):
+        best = np.inf
+        second = np.inf
+        best_i = -1
+        for i in range(medoids.shape[0]):
+            d = distances[medoids[i], o]
+            if d < best:
+                second = best
+                best = d
+                best_i = i
+            elif d < second:
+                second = d
+        nearest[o] = best_i
+        d_nearest[o] = best
+        d_second[o] = second
+
+@numba.jit(nopython=True)
+def removal_loss(nearest, d_nearest, d_second, k):
+    '''
+    increase of the cost if each medoid was removed (its points going to
+    their second nearest medoid)
+    '''
+    loss = np.zeros(k)
+    for o in range(nearest.shape[0]):
+        loss[nearest[o]] += d_second[o] - d_nearest[o]
+    return loss
+
+@numba.jit(nopython=True)
+def best_swap(distances, loss, nearest, d_nearest, d_second, x):
+    '''
+    returns:
+    --------
+    position (in medoids) of the best medoid to replace by the datapoint x,
+    and the corresponding change of cost (negative if the swap is an
+    improvement)
+    (distances only needs the row of x, one column per datapoint)
+    '''
+    delta = loss.copy()
+    shared = 0.
+    for o in range(distances.shape[1]):
+        d = distances[x, o]
+        if d < d_nearest[o]:
+            #o would move to x, whichever medoid is removed
+            shared += d - d_nearest[o]
+            delta[nearest[o]] += d_nearest[o] - d_second[o]
+        elif d < d_second[o]:
+            #o would only move to x if its nearest medoid is removed
+            delta[nearest[o]] += d - d_second[o]
+    best_i = 0
+    for i in range(1, delta.shape[0]):
+        if delta[i] < delta[best_i]:
+            best_i = i
+    return best_i, delta[best_i] + shared
+
+@numba.jit(nopython=True)
+def swap_medoids(distances, medoids, max_iter, nearest, d_nearest, d_second):
+    '''
+    runs the eager swaps in place on medoids (see module docstring)
+
+    returns:
+    --------
+    number of swaps, number of passes over the datapoints
+    '''
+    m = distances.shape[0]
+    k = medoids.shape[0]
+    is_medoid = np.zeros(m, dtype=np.bool_)
+    for i in range(k):
+        is_medoid[medoids[i]] = True
+    nearest_two(distances, medoids, nearest, d_nearest, d_second)
+    loss = removal_loss(nearest, d_nearest, d_second, k)
+    tolerance = 1e-12 * (d_nearest.sum() + 1.)
+
+    last_swap = -1
+    n_swaps = 0
+    n_passes = 0
+    for n_passes in range(1, max_iter + 1):
+        for x in range(m):
+            if x == last_swap:
+                #a full pass since the last swap did not improve the cost
+                return n_swaps, n_passes
+            if is_medoid[x]:
+                continue
+            i, delta = best_swap(distances, loss, nearest, d_nearest,
+                                 d_second, x)
+            if delta < -tolerance:
+                is_medoid[medoids[i]] = False
+                medoids[i] = x
+                is_medoid[x] = True
+                nearest_two(distances, medoids, nearest, d_nearest, d_second)
+                loss = removal_loss(nearest, d_nearest, d_second, k)
+                last_swap = x
+                n_swaps += 1
+        if last_swap == -1:
+            #no swap at all during the first pass
+            return n_swaps, n_passes
+    return n_swaps, n_passes
+
+def kmedoids_plusplus(distances, k, random_state):
+    '''
+    k-medoids++ seeding: the first medoid is picked uniformly, each next one
+    with a probability proportional to the squared distance to the closest
+    medoid already picked (the medoids start spread over the data)
+
+    parameters:
+    -----------
+    distances: square (symmetric) np.array of size m x m
+    k: number of medoids
+    random_state: np.random.RandomState
+
+    returns:
+    --------
+    np.array of the indices of the k initial medoids
+    '''
+    m = distances.shape[0]
+    medoids = [random_state.randint(m)]
+    closest = np.array(distances[medoids[0]], dtype=np.float64)
+    for _ in xrange(1, k):
+        weights = closest**2
+        weights[medoids] = 0.
+        total = weights.sum()
+        if total > 0:
+            new_medoid = random_state.choice(m, p=weights/total)
+        else:
+            #all the points sit on a medoid: pick any other point
+            others = np.setdiff1d(np.arange(m), medoids)
+            new_medoid = random_state.choice(others)
+        medoids.append(new_medoid)
+        closest = np.minimum(closest, distances[new_medoid])
+    return np.array(medoids, dtype=np.int64)
+
+def fasterpam(distances, k=3, init_medoids=None, max_iter=100, seed=None):
+    '''
+    parameters:
+    ----------
+    distances: square (symmetric) np.array of size m x m, with m the number
+               of datapoints
+    k: number of clusters
+    init_medoids: indices of the k initial medoids, picked at random if None
+    max_iter: maximum number of passes over the datapoints
+    seed: seed of the random initialisation (None for a random seed)
+
+    returns:
+    --------
+    clusters: np.array giving for each datapoint the number of the cluster it
+            belongs to (the index of its medoid)
+    medoids: np.array of indices of the datapoints which are the medoids
+    '''
+    distances = np.ascontiguousarray(distances, dtype=np.float64)
+    m = distances.shape[0]
+    if init_medoids is None:
+        init_medoids = np.random.RandomState(seed).choice(m, k, replace=False)
+    medoids = np.array(init_medoids, dtype=np.int64)
+    if len(np.unique(medoids)) != len(medoids):
+        raise ValueError('the initial medoids must be %d different datapoints'
+                         %len(medoids))
+
+    if len(medoids) == 1:
+        #a single cluster: the medoid is the point closest to all the others
+        medoids[0] = distances.sum(axis=1).argmin()
+        return np.repeat(medoids, m), medoids
+
+    nearest = np.empty(m, dtype=np.int64)
+    d_nearest = np.empty(m)
+    d_second = np.empty(m)
+    n_swaps, n_passes = swap_medoids(distances, medoids, max_iter, nearest,
+                                     d_nearest, d_second)
+    count('clustering passes', n_passes)
+    count('clustering swaps', n_swaps)
+
+    clusters = medoids[nearest]
+    clusters[medoids] = medoids #make sure to have a medoid in its own
+    return clusters, medoids
+
+def total_deviation(distances, medoids):
+    '''
+    returns:
+    --------
+    the cost minimized by FasterPAM: sum of the distances of the datapoints to
+    their closest medoid
+    '''
+    return distances[np.asarray(medoids)].min(axis=0).sum()
@@ -0,0 +1,76 @@
+'''
+local HTTP server over a folder of saved IMSDb pages, to run the scraping
+without network (see test_scraping.py)
+
+the folder has the same structure as the website, for instance
+fixtures/imsdb/all scripts/index.html       -> /all%20scripts/
+fixtures/imsdb/Movie Scripts/Alien Script.html
+fixtures/imsdb/scripts/Alien.html
+the pages which are not in the folder answer 404
+
+Usage:
+------
+To serve the pages of fixtures/imsdb on the port 8000, type in a terminal
+$ python fixture_server.py 8000
+then, in another terminal
+$ python scraping_script.py base_url=http://localhost:8000 cache=off
+'''
+
+import os
+import posixpath
+import sys
+import threading
+import urllib
+from BaseHTTPServer import HTTPServer
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures', 'imsdb')
+
+class _Handler(SimpleHTTPRequestHandler):
+    #the pages are read from server.directory instead of the current folder
+
+    def translate_path(self, path):
+        path = posixpath.normpath(urllib.unquote(path.split('?', 1)[0]
+                                                     .split('#', 1)[0]))
+        parts = [part for part in path.split('/')
+                 if part and part not in (os.curdir, os.pardir)]
+        return os.path.join(self.server.directory, *parts)
+
+    def log_message(self, format, *args):
+        pass
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def start_server(directory=FIXTURES_DIR, port=0):
+    '''
+    serves the pages of directory from a background thread
+
+    parameters:
+    -----------
+    directory: folder of saved pages
+    port: port of the server (0 picks a free port)
+
+    returns:
+    --------
+    server (server.shutdown() stops it), address of the website (the
+    base_url of scraping_script.py)
+    '''
+    server = _ThreadingServer(('localhost', port), _Handler)
+    server.directory = directory
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://localhost:%d' %server.server_address[1]
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server, base_url = start_server(port=port)
+    print 'serving %s at %s (Ctrl-C to stop)' %(FIXTURES_DIR, base_url)
+    try:
+        while True:
+            threading.Event().wait(1)
+    except KeyboardInterrupt:
+        server.shutdown()
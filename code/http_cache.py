@@ -0,0 +1,159 @@
+'''
+on-disk cache of the pages downloaded by scraping_script.py, so that
+scraping again only downloads the pages which changed, and that the pages
+can be parsed again without network (offline mode)
+
+structure of the cache directory ('../data/scraping/cache' by default):
+- objects/ab/abcdef...: the pages, named after the sha1 of their content (a
+  page shared by several urls, or unchanged between two scrapings, is stored
+  once)
+- urls/123456....json: one file per url (named after the sha1 of the url)
+  with the sha1 of its page, the ETag and Last-Modified headers sent by the
+  website and the time of the last download or check
+
+policy:
+- a page younger than ttl seconds is used without any request
+- an older page is checked with a conditional request (If-None-Match,
+  If-Modified-Since): the website answers 304 (no transfer) if it did not
+  change
+- in offline mode, the cached pages are always used, and the pages that were
+  never downloaded are errors
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import config
+
+DEFAULT_TTL = 7 * 24 * 3600 #one week
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+def _write_atomic(path, data):
+    #the file is complete or absent, even if the scraping is interrupted
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError: #created by another thread in the meantime
+            pass
+    handle, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, 'wb') as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+class ResponseCache(object):
+    '''
+    usage:
+    ------
+    cache = ResponseCache()
+    entry = cache.lookup(url)
+    if entry is None or not cache.is_fresh(entry):
+        ... download, with cache.conditional_headers(entry)
+        cache.store(url, text, headers) or cache.touch(url, entry)
+    text = cache.text(entry)
+    '''
+    def __init__(self, directory=config.SCRAPING_CACHE_DIR, ttl=DEFAULT_TTL,
+                 offline=False):
+        '''
+        parameters:
+        -----------
+        directory: where the pages are stored
+        ttl: age (s) under which a page is used without checking the website
+        offline: BOOL, on True the website is never contacted
+        '''
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0 #pages used without request
+        self.not_modified = 0 #pages checked, unchanged (304)
+        self.downloads = 0 #pages downloaded
+        self._lock = threading.Lock()
+
+    def _url_path(self, url):
+        return os.path.join(self.directory, 'urls',
+                            _sha1(url.encode('utf-8')) + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def lookup(self, url):
+        '''
+        returns:
+        --------
+        dictionary with the information stored for url, None if it was never
+        downloaded
+        '''
+        path = self._url_path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            entry = json.load(f)
+        if not os.path.exists(self._object_path(entry['sha1'])):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return self.offline or time.time() - entry['checked'] < self.ttl
+
+    def text(self, entry, count=True):
+        '''
+        returns:
+        --------
+        text of the page of the entry
+        '''
+        if count:
+            self._count('hits')
+        with open(self._object_path(entry['sha1']), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def conditional_headers(self, entry):
+        '''
+        returns:
+        --------
+        headers asking the website to send the page only if it changed
+        '''
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, text, headers):
+        '''
+        stores the page downloaded from url
+        headers: headers of the response (for ETag and Last-Modified)
+        '''
+        self._count('downloads')
+        data = text.encode('utf-8')
+        digest = _sha1(data)
+        if not os.path.exists(self._object_path(digest)):
+            _write_atomic(self._object_path(digest), data)
+        entry = {'url': url, 'sha1': digest, 'checked': time.time(),
+                 'etag': headers.get('ETag'),
+                 'last_modified': headers.get('Last-Modified')}
+        _write_atomic(self._url_path(url), json.dumps(entry))
+
+    def touch(self, url, entry):
+        '''
+        the website answered that the page did not change (304): it is
+        considered fresh for ttl seconds more
+        '''
+        self._count('not_modified')
+        entry = dict(entry, checked=time.time())
+        _write_atomic(self._url_path(url), json.dumps(entry))
+        return self.text(entry, count=False)
+
+    def summary(self):
+        return {'from cache': self.hits, 'not modified': self.not_modified,
+                'downloaded': self.downloads}
@@ -0,0 +1,88 @@
+'''
+this script checks that the core modules (loading and smoothing plotlines)
+stay cheap to import: every batch script and every process of a pool
+imports them, and only needs numpy (+ the smoother)
+
+for each module of CORE_MODULES, a fresh python interpreter imports it and
+reports
+i) the time spent in the import (the interpreter start-up is not counted)
+ii) the heavy packages that were imported with it (HEAVY_PACKAGES), which
+    should only be imported by the functions that draw or display something
+
+Usage:
+------
+To execute this script, type in a terminal
+$ python import_budget.py
+or, to change the budget (in ms, defaults to 250)
+$ python import_budget.py 300
+
+the script exits with status 1 if a module goes over the budget or imports
+a heavy package. To see which imports are the slowest, use
+$ python -X importtime -c "import load_plotline"
+(python >= 3.7)
+'''
+
+import subprocess
+import sys
+import os
+
+CORE_MODULES = ['plotline_utilities', 'load_plotline']
+HEAVY_PACKAGES = ['matplotlib', 'ipywidgets', 'IPython', 'statsmodels',
+                  'pandas', 'seaborn', 'scipy', 'dtw']
+
+_MEASURE = '''
+import sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+heavy = [name for name in %r if name in sys.modules]
+print('%%f;%%s' %% (elapsed, ','.join(heavy)))
+'''
+
+def measure_import(module, directory=None):
+    '''
+    parameters:
+    -----------
+    module: STR, name of the module to import
+    directory: directory from which to import it (defaults to the directory
+               of this script)
+
+    returns:
+    --------
+    time of the import in ms, list of the heavy packages it imported
+    '''
+    if directory is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.check_output([sys.executable, '-c',
+                                      _MEASURE %(module, HEAVY_PACKAGES)],
+                                     cwd=directory)
+    elapsed, heavy = output.decode().strip().split('\n')[-1].split(';')
+    heavy = [name for name in heavy.split(',') if name]
+    return float(elapsed) * 1000., heavy
+
+def check_budget(budget_ms=250., modules=CORE_MODULES):
+    '''
+    returns:
+    --------
+    BOOL, True if all the modules are within the budget and import no heavy
+    package
+    '''
+    success = True
+    for module in modules:
+        elapsed, heavy = measure_import(module)
+        status = 'ok'
+        if elapsed > budget_ms or heavy:
+            status = 'OVER BUDGET'
+            success = False
+        print '%-20s %8.1f ms  (budget %.0f ms)  %s' %(module, elapsed,
+                                                        budget_ms, status)
+        if heavy:
+            print ' '*21 + 'heavy packages imported: ' + ', '.join(heavy)
+    return success
+
+if __name__ == '__main__':
+    budget_ms = 250.
+    if len(sys.argv) > 1:
+        budget_ms = float(sys.argv[1])
+    if not check_budget(budget_ms):
+        sys.exit(1)
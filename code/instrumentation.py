@@ -0,0 +1,240 @@
+'''
+timers, counters and progress display of the scripts
+
+- timer(name): context manager adding the time spent in the block to the
+  timer name (number of calls, total, maximum)
+- count(name, n): adds n to the counter name
+- Progress: progress bar of a loop, with the number of items per second and
+  the estimated time left
+- save_metrics(run_name): writes the timers and counters of the run as JSON
+  in '../data/metrics' (see config.py), to compare the runs
+
+the timers and counters are kept per process (the processes of a
+multiprocessing.Pool have their own); a timer costs a couple of microseconds,
+so it can be used in the loops over movies or pairs of movies, but not in
+the numba kernels
+
+the timers used by the scripts:
+download, parse, browser (scraping_script.py), tokenize, lemmatize, score
+(emotions_script.py), smooth (plotline_utilities.smoothing), dtw fill,
+dtw accumulate, dtw traceback (acc_dtw.dtw, summed without lock in a
+DTWPhases and added once per row of the matrix by dtw_script.py), clustering
+(one restart, medoids.py); and the counters clustering passes (passes over the datapoints
+of FasterPAM, iterations of the voronoi method), clustering swaps and
+clustering restarts
+
+usage:
+------
+with timer('smooth'):
+    ...
+progress = Progress(len(movies), 'distances')
+for movie in movies:
+    ...
+    progress.update()
+progress.close()
+save_metrics('dtw_script')
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+
+import config
+
+class _Timer(object):
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.metrics.add_time(self.name, time.time() - self.start)
+
+class Metrics(object):
+    '''
+    timers and counters of a run, shared by the threads
+    '''
+    def __init__(self):
+        self.timers = {} #name -> [calls, total time (s), maximum time (s)]
+        self.counters = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def add_time(self, name, seconds, calls=1, longest=None):
+        #calls > 1: seconds is the total of several calls, the longest of
+        #which took longest seconds
+        if longest is None:
+            longest = seconds
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [calls, seconds, longest]
+            else:
+                timer[0] += calls
+                timer[1] += seconds
+                if longest > timer[2]:
+                    timer[2] = longest
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def summary(self):
+        '''
+        returns:
+        --------
+        dictionary with the duration of the run, the counters, and for each
+        timer its number of calls, total and mean time (ms) and calls per
+        second
+        '''
+        with self._lock:
+            timers = dict(
+                (name, {'calls': calls, 'total (ms)': total * 1000.,
+                        'mean (ms)': total * 1000. / calls,
+                        'max (ms)': longest * 1000.,
+                        'calls/s': calls / total if total > 0 else None})
+                for name, (calls, total, longest) in self.timers.items())
+            return {'elapsed (s)': time.time() - self.started,
+                    'timers': timers, 'counters': dict(self.counters)}
+
+    def report(self):
+        summary = self.summary()
+        print '*'*50
+        print 'elapsed: %.1f s' %summary['elapsed (s)']
+        for name, timer in sorted(summary['timers'].items(),
+                                  key=lambda item: -item[1]['total (ms)']):
+            print '%-20s %8d calls %10.1f ms (mean %.3f ms)' \
+                    %(name, timer['calls'], timer['total (ms)'],
+                      timer['mean (ms)'])
+        for name, value in sorted(summary['counters'].items()):
+            print '%-20s %8d' %(name, value)
+        print '*'*50
+
+    def save(self, run_name, directory=None, extra=None):
+        '''
+        writes the summary (and the dictionary extra) in
+        directory/run_name_YYYYmmdd-HHMMSS.json (None: config.METRICS_DIR)
+
+        returns:
+        --------
+        path of the file
+        '''
+        directory = directory or config.METRICS_DIR
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        summary = self.summary()
+        summary.update({'run': run_name, 'argv': sys.argv,
+                        'started': time.strftime('%Y-%m-%d %H:%M:%S',
+                                                 time.localtime(self.started)),
+                        'pid': os.getpid()})
+        if extra:
+            summary.update(extra)
+        path = os.path.join(directory, '%s_%s.json'
+                            %(run_name, time.strftime('%Y%m%d-%H%M%S')))
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=1, sort_keys=True)
+        return path
+
+class Progress(object):
+    '''
+    progress bar of a loop of total items, for instance
+    distances [--------------                ] 120/300 41.2/s ETA 0:00:04
+    the display is refreshed at most every min_interval seconds, and the
+    time of the loop is added to the timer name (and the items to the
+    counter name + ' items')
+    '''
+    def __init__(self, total, name='progress', Nbars=30, char='-',
+                 min_interval=0.2, metrics=None, stream=None):
+        self.total = total
+        self.name = name
+        self.Nbars = Nbars
+        self.char = char
+        self.min_interval = min_interval
+        self.metrics = metrics if metrics is not None else METRICS
+        self.stream = stream if stream is not None else sys.stdout
+        self.done = 0
+        self.start = time.time()
+        self._shown = 0.
+        self._shown_done = None
+        self._closed = False
+
+    def update(self, n=1):
+        self.done += n
+        now = time.time()
+        if now - self._shown >= self.min_interval or \
+                (self.done >= self.total and self._shown_done != self.done):
+            self._display(now)
+
+    def rate(self, now=None):
+        elapsed = (now or time.time()) - self.start
+        return self.done / elapsed if elapsed > 0 else 0.
+
+    def eta(self, now=None):
+        '''
+        returns:
+        --------
+        estimated time left (s), None before the first item
+        '''
+        rate = self.rate(now)
+        if rate == 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def _display(self, now):
+        self._shown = now
+        self._shown_done = self.done
+        nbars = int(self.done * 1. / max(self.total, 1) * self.Nbars)
+        eta = self.eta(now)
+        eta = '--:--:--' if eta is None else \
+              time.strftime('%H:%M:%S', time.gmtime(eta))
+        self.stream.write('\r%s [%s%s] %d/%d %.1f/s ETA %s'
+                          %(self.name, nbars*self.char,
+                            (self.Nbars-nbars)*' ', self.done, self.total,
+                            self.rate(now), eta))
+        self.stream.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        now = time.time()
+        if self._shown_done != self.done:
+            self._display(now)
+        self.stream.write('\n')
+        self.stream.flush()
+        self.metrics.add_time(self.name, now - self.start)
+        self.metrics.count(self.name + ' items', self.done)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+#metrics of the current process
+METRICS = Metrics()
+
+def timer(name):
+    return METRICS.timer(name)
+
+def count(name, n=1):
+    METRICS.count(name, n)
+
+def save_metrics(run_name, extra=None):
+    return METRICS.save(run_name, extra=extra)
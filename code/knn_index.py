@@ -0,0 +1,192 @@
+'''
+index of the closest movies to each movie, built once from the distance
+matrix (see dtw_script.py and medoids.load_distances)
+
+i) the matrix is read by blocks of rows: np.argpartition finds the K closest
+   movies of each row without sorting the whole row, then only these K are
+   sorted
+ii) the index keeps the neighbours (int32) and their distances (float32) in
+    two m x K arrays, with the filenames and titles of the movies
+iii) a query reads one row of these arrays: O(K), whatever the number of
+     movies
+iv) new movies are appended with their distances to all the movies: the
+    neighbours of the other movies are updated without reading the matrix
+    again
+
+Usage:
+------
+To build the index of the 10 closest movies (saved as '../data/knn_index.npz')
+$ python knn_index.py build 10
+To print the closest movies to a movie (title or filename)
+$ python knn_index.py "Pulp Fiction"
+'''
+
+import sys
+import numpy as np
+import config
+
+from cluster_metrics import BLOCK_ELEMENTS
+
+def _top_k(rows, K):
+    '''
+    returns:
+    --------
+    np.arrays [len(rows), K] of the positions of the K smallest values of each
+    row, in increasing order, and these values
+    '''
+    positions = np.argpartition(rows, K - 1, axis=1)[:, :K]
+    values = rows[np.arange(len(rows))[:, None], positions]
+    order = np.argsort(values, axis=1, kind='mergesort')
+    positions = positions[np.arange(len(rows))[:, None], order]
+    values = values[np.arange(len(rows))[:, None], order]
+    return positions, values
+
+class KnnIndex(object):
+    '''
+    usage:
+    ------
+    index = build_knn_index(movies, distances, K=10)
+    index.query('Pulp Fiction')
+    index.append(new_movies, new_rows)
+    index.save()
+    '''
+    def __init__(self, movies, neighbours, distances, titles=None):
+        '''
+        parameters:
+        -----------
+        movies: list of the filenames of the movies (rows of the index)
+        neighbours: np.array [m, K] (int32), rows of the closest movies
+        distances: np.array [m, K] (float32), distances to these movies
+        titles: list of the titles of the movies (defaults to the filenames)
+        '''
+        self.movies = list(movies)
+        self.neighbours = np.asarray(neighbours, dtype=np.int32)
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.titles = list(titles) if titles is not None else list(movies)
+        self._make_lookup()
+
+    def _make_lookup(self):
+        #both filenames and titles lead to the row of a movie
+        self.lookup = dict(zip(self.titles, xrange(len(self.titles))))
+        self.lookup.update(zip(self.movies, xrange(len(self.movies))))
+
+    @property
+    def K(self):
+        return self.neighbours.shape[1]
+
+    def query(self, movie, n=10):
+        '''
+        parameters:
+        -----------
+        movie: STR, title or filename of the movie
+        n: number of closest movies (at most K)
+
+        returns:
+        --------
+        list of tuples (title, filename, distance), the closest first
+        '''
+        row = self.lookup[movie]
+        return [(self.titles[neighbour], self.movies[neighbour],
+                 float(distance))
+                for neighbour, distance in zip(self.neighbours[row, :n],
+                                               self.distances[row, :n])]
+
+    def append(self, new_movies, new_rows, new_titles=None):
+        '''
+        parameters:
+        -----------
+        new_movies: list of the filenames of the new movies
+        new_rows: np.array [len(new_movies), m + len(new_movies)], distances
+                  of the new movies to the movies of the index, then to the
+                  new movies (in the order of new_movies)
+        new_titles: list of the titles of the new movies
+        '''
+        m = len(self.movies)
+        n_new = len(new_movies)
+        new_rows = np.array(new_rows, dtype=np.float64)
+        new_rows[np.arange(n_new), m + np.arange(n_new)] = np.inf
+        K = self.K
+
+        #the old movies keep their K closest among the old and the new ones
+        candidates = np.hstack((self.distances.astype(np.float64),
+                                new_rows[:, :m].T))
+        rows = np.hstack((self.neighbours,
+                          np.tile(np.arange(m, m + n_new, dtype=np.int32),
+                                  (m, 1))))
+        positions, values = _top_k(candidates, K)
+        old_neighbours = rows[np.arange(m)[:, None], positions]
+
+        #the new movies get their K closest from their rows
+        new_neighbours, new_values = _top_k(new_rows, K)
+
+        self.neighbours = np.vstack((old_neighbours, new_neighbours)) \
+                            .astype(np.int32)
+        self.distances = np.vstack((values, new_values)).astype(np.float32)
+        self.movies += list(new_movies)
+        self.titles += list(new_titles) if new_titles is not None \
+                       else list(new_movies)
+        self._make_lookup()
+
+    def save(self, path=config.KNN_INDEX_NPZ):
+        np.savez(path, movies=np.array(self.movies),
+                 titles=np.array(self.titles),
+                 neighbours=self.neighbours, distances=self.distances)
+
+def load_knn_index(path=config.KNN_INDEX_NPZ):
+    data = np.load(path)
+    return KnnIndex(data['movies'].tolist(), data['neighbours'],
+                    data['distances'], titles=data['titles'].tolist())
+
+def build_knn_index(movies, distances, K=10, titles=None,
+                    block_elements=BLOCK_ELEMENTS):
+    '''
+    parameters:
+    -----------
+    movies: list of the filenames of the movies
+    distances: square np.array of the pairwise distances (can be
+               memory-mapped, it is read by blocks of rows)
+    K: number of neighbours kept per movie
+    titles: list of the titles of the movies (defaults to the filenames)
+
+    returns:
+    --------
+    KnnIndex
+    '''
+    m = len(movies)
+    K = min(K, m - 1)
+    neighbours = np.empty((m, K), dtype=np.int32)
+    values = np.empty((m, K), dtype=np.float32)
+    block = max(1, block_elements // max(m, 1))
+    for start in xrange(0, m, block):
+        stop = min(start + block, m)
+        rows = np.array(distances[start:stop], dtype=np.float64)
+        #a movie is not its own neighbour
+        rows[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        neighbours[start:stop], values[start:stop] = _top_k(rows, K)
+    return KnnIndex(movies, neighbours, values, titles=titles)
+
+def movie_titles(movies):
+    '''
+    returns:
+    --------
+    list of the titles of the movies (see
+    plotline_utilities.make_title_dictionary), the filename if unknown
+    '''
+    from plotline_utilities import make_title_dictionary
+    filename_to_title, _ = make_title_dictionary()
+    return [filename_to_title.get(movie, movie) for movie in movies]
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'build':
+        from medoids import load_distances
+        K = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+        movies, distances = load_distances(mmap_mode='r')
+        index = build_knn_index(movies, distances, K=K,
+                                titles=movie_titles(movies))
+        index.save()
+        print 'index of the %d closest movies saved for %d movies' \
+                %(index.K, len(movies))
+    else:
+        index = load_knn_index()
+        for title, filename, distance in index.query(sys.argv[1]):
+            print title + '('+ str(round(distance,1))+')'
@@ -1,24 +1,38 @@
 '''
-this code contains two classes,
+this code contains three classes,
 - LoadPlotLine, designed to help the visualisation of .npy files created
  by the emotion_script.
+- PlotLineCache, keeps recently used LoadPlotLine objects (already smoothed)
+ in memory, and loads the neighbouring movies in the background
 - ExploreData, designed to explore interactively the plots thanks to widgets
 (user selects the movie, then the emotions to plot)
 
 the aim is to allow the user to interactively explore the evolution of emotions
 in the chosen movie. Open the 'Visualize_Emotions' Jupyter Notebook.
+
+matplotlib and the widgets (ipywidgets, IPython) are only imported by the
+functions that draw or display something, so that loading and smoothing
+plotlines (dtw_script, export_graphs, pools of processes) only needs numpy
+(see import_budget.py)
 '''
 
 import os
+import threading
+from collections import OrderedDict
 import numpy as np
-import matplotlib.pyplot as plt
 
-import ipywidgets as widgets #new version of IPython.htlm
-from IPython.display import display
-from ipywidgets import fixed
+import config
+from instrumentation import Progress
+from plotline_utilities import smoothing, make_title_dictionary
 
-from plotline_utilities import progression_bar, smoothing,\
-                               make_title_dictionary
+def graph_path(filename, path_save=config.GRAPHS_DIR):
+    '''
+    returns:
+    --------
+    path of the png of the graph of a movie (used by
+    LoadPlotLine.visualisation_for_emotions and export_graphs.py)
+    '''
+    return os.path.join(path_save, filename + '.png')
 
 class LoadPlotLine(object):
     '''
@@ -29,9 +43,11 @@ class LoadPlotLine(object):
         2 overall sentiment analysis (positive or negative sentiments) are
         included
     '''
-    def __init__(self, filename):
+    def __init__(self, filename, smoothing_method='lowess'):
         self.filename = filename
-        self.path = "../data/emotions/arrays/"
+        self.path = config.ARRAYS_DIR
+        self.smoothing_method = smoothing_method
+        #see plotline_utilities.SMOOTHING_METHODS for the available smoothers
 
         self.emotions = ['anger', 'anticipation', 'disgust', 'fear', 'joy',
                             'negative', 'positive', 'sadness', 'surprise',
@@ -44,11 +60,81 @@ class LoadPlotLine(object):
         #entry type: key (emotion, corresponding integer),
         #            value [array of x, array of smoothed counts]
         #color choice is also inspired by Plutchik's wheel of emotions
+        self.array_emotions = None
+        self._smooth_cache = {}
+        #entry type: key integer of the emotion,
+        #            value (array of x, array of smoothed counts)
+        self._cumulative_cache = {}
+        #entry type: key integer of the emotion,
+        #            value cumulative sum of the smoothed counts (starts at 0)
 
     def load_emotions(self):
         #retrieves the .npy array
-        path_file = self.path + self.filename + '.npy'
+        path_file = os.path.join(self.path, self.filename + '.npy')
         self.array_emotions = np.load(path_file)
+        #a new array invalidates what was smoothed before
+        self._smooth_cache = {}
+        self._cumulative_cache = {}
+
+    def set_emotions(self, array_emotions):
+        '''
+        alternative to load_emotions, for an array that is not saved as .npy
+        (for instance a new script, see cluster_assignment.py)
+
+        parameters:
+        -----------
+        array_emotions: np.array [time, emotions], as made by
+                        emotions_script.get_emotions
+        '''
+        self.array_emotions = np.asarray(array_emotions)
+        self._smooth_cache = {}
+        self._cumulative_cache = {}
+
+    def smooth_emotion(self, index):
+        '''
+        smoothes one emotion, the result is kept so that each emotion of the
+        movie is smoothed at most once (load_emotions is run if needed)
+
+        parameters:
+        -----------
+        index: integer of the emotion (see make_emotion_dictionary)
+
+        returns:
+        --------
+        array of x, array of smoothed counts
+        '''
+        if index not in self._smooth_cache:
+            if self.array_emotions is None:
+                self.load_emotions()
+            self._smooth_cache[index] = smoothing(self.array_emotions[:,index],
+                                                  frac=0.1,
+                                                  method=self.smoothing_method)
+        return self._smooth_cache[index]
+
+    def segment_total(self, index, percent_min=0, percent_max=1):
+        '''
+        sum of the smoothed counts of an emotion between two points of the
+        script, read from a cumulative sum (no loop over the script)
+
+        parameters:
+        -----------
+        index: integer of the emotion (see make_emotion_dictionary)
+        percent_min, percent_max: from 0 to 1, same meaning as in
+                                  global_overview
+
+        returns:
+        --------
+        FLOAT, total of the smoothed counts in the segment
+        '''
+        if index not in self._cumulative_cache:
+            x, y = self.smooth_emotion(index)
+            self._cumulative_cache[index] = np.concatenate(([0.],
+                                                            np.cumsum(y)))
+        cumulative = self._cumulative_cache[index]
+        length = len(cumulative) - 1
+        x_min = int(percent_min * length)
+        x_max = int(percent_max * length)
+        return cumulative[x_max] - cumulative[x_min]
 
     def make_emotion_dictionary(self, list_emotions=range(5)+range(7,10)):
         '''
@@ -66,14 +152,15 @@ class LoadPlotLine(object):
         creates:
         --------
         2 dictionaries and 1 np.array to look at the data
+        (the emotions already smoothed for this movie are not smoothed again)
         '''
         smoothed_emotion_list = []
         #smoothed_emotion_list [list_for_anger, list_for_joy, ...]
         for index in list_emotions:
+            x,y = self.smooth_emotion(index)
             emotion_scores = self.array_emotions[:,index]
             emotion = self.emotions[index]
             self.emotion_dictionary_raw[(emotion,index)] = emotion_scores
-            x,y = smoothing(emotion_scores, frac=0.1)
             self.emotion_dictionary_smooth[(emotion,index)] = (x,y)
             smoothed_emotion_list.append(y)
         self.smoothed_array_emotions =\
@@ -102,6 +189,8 @@ class LoadPlotLine(object):
                     defaults to True
         )
         '''
+        import matplotlib.pyplot as plt
+
         list_total = [] #list that will have tuples to make the graph
         #eg: [(emotion1, total_words), (emotion2, total_words)]
         total_all_emotions = 0.0
@@ -110,13 +199,12 @@ class LoadPlotLine(object):
         self.make_emotion_dictionary(list_emotions)
         #makes self.emotion_dictionary_raw
         #makes self.emotion_dictionary_smooth
+        #(only smoothes the emotions that were not smoothed yet)
 
-        for (emotion,index), (x,y) in self.emotion_dictionary_smooth.iteritems():
-            x_min = int(percent_min * len(y))
-            x_max = int(percent_max * len(y))
-            new_y = y[x_min:x_max]
-            list_total.append((emotion, sum(new_y)))
-            total_all_emotions += sum(new_y)
+        for index in list_emotions:
+            total = self.segment_total(index, percent_min, percent_max)
+            list_total.append((self.emotions[index], total))
+            total_all_emotions += total
 
         #sort the list to find strongest emotions
         list_total.sort(key=lambda (x,y):y)
@@ -150,27 +238,154 @@ class LoadPlotLine(object):
                         4 'joy'                 9 'trust'
                       by default, 'positive' and 'negative' are not plotted
         save_png: BOOL, allows to save matplotlib figure as png in
-                 "../data/emotions/graphs/"
+                 "../data/emotions/graphs/" (see graph_path)
         '''
+        import matplotlib.pyplot as plt
+
         plt.clf()
         plt.subplots_adjust(right=0.73)
+        self.draw_emotions(plt.gca(), list_emotions=list_emotions,
+                           raw_data=raw_data, title_option=title_option)
+        if save_png:
+            plt.savefig(graph_path(self.filename), transparent=True,
+                        format='png')
+
+    def draw_emotions(self, ax, list_emotions=range(5)+range(7,10),
+                      raw_data=True,
+                      title_option=True):
+        '''
+        draws the smoothed emotions on a given matplotlib Axes, without using
+        the global state of pyplot (used by visualisation_for_emotions and by
+        the batch export of export_graphs.py)
+
+        parameters:
+        -----------
+        ax: matplotlib Axes
+        list_emotions, raw_data, title_option: see visualisation_for_emotions
+        '''
         self.make_emotion_dictionary(list_emotions)
-        valid_indices = set(list_emotions)
-        for (emotion,index), (x,y) in self.emotion_dictionary_smooth.iteritems():
-            if index in valid_indices:
-                if not raw_data:
-                    x_max = np.max(x)
-                    x = x*100.0/x_max
-                    plt.xlabel('Advancement of the script (%)')
-                plt.ylabel('Emotion intensity (a.u.)')
-                plt.plot(x,y, label=emotion, color=self.colors[index])
-                plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
-                if title_option:
-                    plt.title(self.filename)
-                if save_png:
-                    path_save = "../data/emotions/graphs/"+self.filename
-
-                    plt.savefig(path_save, transparent=True, format='png')
+        for index in list_emotions:
+            emotion = self.emotions[index]
+            x, y = self.emotion_dictionary_smooth[(emotion,index)]
+            if not raw_data:
+                x_max = np.max(x)
+                x = x*100.0/x_max
+            ax.plot(x,y, label=emotion, color=self.colors[index])
+        if not raw_data:
+            ax.set_xlabel('Advancement of the script (%)')
+        ax.set_ylabel('Emotion intensity (a.u.)')
+        ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+        if title_option:
+            ax.set_title(self.filename)
+
+class PlotLineCache(object):
+    '''
+    bounded LRU (least recently used) cache of LoadPlotLine objects
+    a plotline is loaded and smoothed (all 10 emotions) the first time it is
+    requested, afterwards switching movies or emotions costs no disk access
+    and no smoothing
+
+    usage:
+    ------
+    cache = PlotLineCache(max_size=32, n_prefetch=2)
+    cache.set_order(list_filenames) #order of the movies in the select widget
+    plotline = cache.get(filename)
+    cache.prefetch_neighbours(filename) #loads the movies next to filename
+    '''
+    def __init__(self, max_size=32, n_prefetch=2, smoothing_method='lowess'):
+        '''
+        parameters:
+        -----------
+        max_size: maximum number of plotlines kept in memory
+        n_prefetch: number of movies loaded before and after the selected one
+        smoothing_method: STR, see plotline_utilities.SMOOTHING_METHODS
+        '''
+        self.max_size = max(max_size, 2*n_prefetch + 1)
+        self.n_prefetch = n_prefetch
+        self.smoothing_method = smoothing_method
+        self._plotlines = OrderedDict() #oldest first
+        self._lock = threading.Lock()
+        self._loading = set()
+        self._order = []
+        self._positions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def set_order(self, filenames):
+        '''
+        filenames: list of the filenames, in the order in which the user
+                   browses them (used to find the neighbours to prefetch)
+        '''
+        self._order = list(filenames)
+        self._positions = dict((filename, i) for i, filename
+                               in enumerate(self._order))
+
+    def _load(self, filename):
+        plotline = LoadPlotLine(filename,
+                                smoothing_method=self.smoothing_method)
+        plotline.load_emotions()
+        plotline.make_emotion_dictionary(list_emotions=range(10))
+        return plotline
+
+    def _store(self, filename, plotline):
+        #must be called with the lock held
+        self._plotlines[filename] = plotline
+        while len(self._plotlines) > self.max_size:
+            self._plotlines.popitem(last=False)
+
+    def get(self, filename):
+        '''
+        returns:
+        --------
+        LoadPlotLine object, with all emotions loaded and smoothed
+        '''
+        with self._lock:
+            if filename in self._plotlines:
+                self.hits += 1
+                plotline = self._plotlines.pop(filename)
+                self._plotlines[filename] = plotline #most recently used
+                return plotline
+            self.misses += 1
+        plotline = self._load(filename)
+        with self._lock:
+            self._store(filename, plotline)
+        return plotline
+
+    def prefetch_neighbours(self, filename):
+        '''
+        loads, in a background thread, the n_prefetch movies before and after
+        filename (in the order given to set_order) that are not in memory yet
+        '''
+        if filename not in self._positions:
+            return
+        position = self._positions[filename]
+        neighbours = []
+        for shift in xrange(1, self.n_prefetch + 1):
+            for i in (position + shift, position - shift):
+                if 0 <= i < len(self._order):
+                    neighbours.append(self._order[i])
+        with self._lock:
+            neighbours = [neighbour for neighbour in neighbours
+                          if neighbour not in self._plotlines
+                          and neighbour not in self._loading]
+            self._loading.update(neighbours)
+        if neighbours:
+            thread = threading.Thread(target=self._prefetch,
+                                      args=(neighbours,))
+            thread.daemon = True
+            thread.start()
+
+    def _prefetch(self, filenames):
+        for filename in filenames:
+            try:
+                plotline = self._load(filename)
+                with self._lock:
+                    #max_size > 2*n_prefetch, so the selected movie stays
+                    if filename not in self._plotlines:
+                        self._store(filename, plotline)
+            finally:
+                with self._lock:
+                    self._loading.discard(filename)
 
 class ExploreData(object):
     '''
@@ -182,9 +397,41 @@ class ExploreData(object):
     exploration = ExploreData()
     exploration.explore()
     then select the movie to look at
+
+    the plotlines are kept in a PlotLineCache (cache_size movies, the
+    n_prefetch movies around the selected one are loaded in the background);
+    exploration.preload() loads the first cache_size movies in advance
+    use cache_size=0 to read the .npy file again at each change of the widgets
     '''
-    def __init__(self):
+    def __init__(self, directory=config.ARRAYS_DIR, cache_size=32,
+                 n_prefetch=2):
         self.filename_to_title, self.title_to_filename = make_title_dictionary()
+        self.directory = directory
+        self.legit_files = None #filled once, by list_legit_files
+        if cache_size:
+            self.plotline_cache = PlotLineCache(max_size=cache_size,
+                                                n_prefetch=n_prefetch)
+        else:
+            self.plotline_cache = None
+
+    def _get_legit_files(self):
+        #the directory is only scanned the first time
+        if self.legit_files is None:
+            self.legit_files = self.list_legit_files(self.directory)
+            if self.plotline_cache is not None:
+                self.plotline_cache.set_order(self.legit_files)
+        return self.legit_files
+
+    def preload(self):
+        '''
+        loads and smoothes the first movies of the list (as many as the cache
+        can hold), so that the first selections are immediate
+        '''
+        if self.plotline_cache is None:
+            return
+        legit_files = self._get_legit_files()
+        for filename in legit_files[:self.plotline_cache.max_size]:
+            self.plotline_cache.get(filename)
 
     def explore(self):
         '''
@@ -192,14 +439,27 @@ class ExploreData(object):
         '''
         select_widget, checkbox_list = self.widget_creation(
                                        filename_to_title=self.filename_to_title,
-                                       directory='../data/emotions/arrays'
+                                       directory=self.directory,
+                                       legit_files=self._get_legit_files()
                                        )
         self.display_widget(self.f_interactive, self.title_to_filename,
-                        select_widget, checkbox_list)
+                        select_widget, checkbox_list,
+                        plotline_cache=self.plotline_cache)
         return select_widget, checkbox_list
 
     @staticmethod
-    def widget_creation(filename_to_title, directory='../data/emotions/arrays'):
+    def list_legit_files(directory=config.ARRAYS_DIR):
+        '''
+        returns:
+        --------
+        list of the filenames (without extension) of the npy files in directory
+        '''
+        files = os.listdir(directory)
+        return [filename[:-4] for filename in files if filename[-3:]=='npy']
+
+    @staticmethod
+    def widget_creation(filename_to_title, directory=config.ARRAYS_DIR,
+                        legit_files=None):
         '''
         this function creates the widgets needed to explore the data
         parameters:
@@ -208,16 +468,19 @@ class ExploreData(object):
                            and the movie title as value
         directory: path, as STR, to the directory containing the npy files to use
                    usually '../data/emotions/arrays'
+        legit_files: list of the filenames to show, if already known
+                     (otherwise the directory is scanned)
         returns:
         --------
         a select widget, with the movie titles corresponding to the npy files
                 in the selected directory
         several checkbox widgets to choose which emotion to explore
         '''
+        import ipywidgets as widgets #new version of IPython.htlm
+
         #widget for the selection of files:
-        path_to_file = directory
-        files = os.listdir(path_to_file)
-        legit_files = [filename[:-4] for filename in files if filename[-3:]=='npy']
+        if legit_files is None:
+            legit_files = ExploreData.list_legit_files(directory)
         legit_titles = [filename_to_title[filename] for filename in legit_files]
 
         select_widget = widgets.Select()
@@ -240,7 +503,8 @@ class ExploreData(object):
                       sadness, surprise, trust,
                       visulalize_emotions=True,
                       hierarchy_emotions=False,
-                      hierarchy_emotions_subplot=False):
+                      hierarchy_emotions_subplot=False,
+                      plotline_cache=None):
 
         '''
         this function allows the creation of the interactive interface
@@ -261,7 +525,12 @@ class ExploreData(object):
                             emotion importance for the beginning (20 %), the
                             middle (next 60 %) and the end (last 20 %) of the
                             script
+        plotline_cache: PlotLineCache to take the plotline from (and to
+                        prefetch the neighbouring movies), None to load the
+                        .npy file
         '''
+        import matplotlib.pyplot as plt
+
         #taking in the user choice of emotions
         #(list of booleans, in the same order as in the LoadPlotLine class)
         list_emotions = [anger, anticipation, disgust, fear, joy,
@@ -274,8 +543,13 @@ class ExploreData(object):
             if list_emotions[i]:
                 list_integers.append(i)
 
-        plotline = LoadPlotLine(title_to_filename[movie_title])
-        plotline.load_emotions()
+        filename = title_to_filename[movie_title]
+        if plotline_cache is not None:
+            plotline = plotline_cache.get(filename)
+            plotline_cache.prefetch_neighbours(filename)
+        else:
+            plotline = LoadPlotLine(filename)
+            plotline.load_emotions()
         if visulalize_emotions:
             plotline.visualisation_for_emotions(list_emotions=list_integers,
                                                 raw_data=False,
@@ -308,10 +582,16 @@ class ExploreData(object):
             plt.show()
 
     @staticmethod
-    def display_widget(f, title_to_filename, select_widget, checkbox_list):
+    def display_widget(f, title_to_filename, select_widget, checkbox_list,
+                       plotline_cache=None):
         '''
         this function creates the interactive window for the user to explore the data
+        (plotline_cache: optional PlotLineCache passed on to f)
         '''
+        import ipywidgets as widgets #new version of IPython.htlm
+        from IPython.display import display
+        from ipywidgets import fixed
+
         i = widgets.interactive(f,
                      movie_title = select_widget,
                      title_to_filename = fixed(title_to_filename),
@@ -326,6 +606,7 @@ class ExploreData(object):
                      surprise=checkbox_list[8],
                      trust=checkbox_list[9],
                      visulalize_emotions=fixed(True),
+                     plotline_cache=fixed(plotline_cache),
                      hierarchy_emotions=widgets.ToggleButton(value=False,
                                         description='See emotion importance for\
                                          the whole script'),
@@ -353,21 +634,19 @@ if __name__ == '__main__':
     save_png = (user_input == 'y')
 
     # Create the directory for pngs
-    if not os.path.exists('../data/emotions/graphs') and save_png:
-        os.mkdir('../data/emotions/graphs')
+    if not os.path.exists(config.GRAPHS_DIR) and save_png:
+        os.mkdir(config.GRAPHS_DIR)
 
     # Loop through the script files
-    path_to_file = '../data/emotions/arrays'
+    path_to_file = config.ARRAYS_DIR
     files = os.listdir(path_to_file)
-    index = 1
     legit_files = [filename[:-4] for filename in files if filename[-3:]=='npy']
-    Ntot = len(legit_files)
     chosen_emotions = range(5)+range(7,10)
     #all emotions except positive and negative
-    for filename in legit_files:
-        plotline = LoadPlotLine(filename)
-        plotline.load_emotions()
-        plotline.visualisation_for_emotions(list_emotions=chosen_emotions,
-                                            save_png=save_png)
-        progression_bar(index, Ntot, Nbars=60, char='-')
-        index += 1
+    with Progress(len(legit_files), 'graphs') as progress:
+        for filename in legit_files:
+            plotline = LoadPlotLine(filename)
+            plotline.load_emotions()
+            plotline.visualisation_for_emotions(list_emotions=chosen_emotions,
+                                                save_png=save_png)
+            progress.update()
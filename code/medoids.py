@@ -3,7 +3,8 @@ usage:
 ------
 3 actions are possible with this script:
 
-i) to see the costs associated with the number of clusters
+i) to see the costs (and the silhouette) associated with the number of
+clusters
 
 $ python medoids.py pick_k
 
@@ -16,29 +17,57 @@ is done several times (change 3 to number of clusters chosen)
 
 $ python medoids.py 3_stability
 
+iv) to see how many restarts the early stopping policy saves, and at which
+cost, for random and k-medoids++ initialisations (stop after 10 restarts
+without improvement, or once 30 % of the restarts reach the best cost)
+
+$ python medoids.py 3_restarts patience=10 hit=30
+
+the random restarts of the clustering can be spread over several processes,
+and the random seed fixed (the results do not depend on the number of
+processes), for instance:
+
+$ python medoids.py pick_k jobs=4 seed=0
+
 '''
 
 # fonctions: cluster, assign_points_to_clusters, compute_new_medoid
 #from : https://github.com/salspaugh/machine_learning/blob/master/clustering/kmedoids.py
 # AnnaVM added some of the comments and most of the docstring
+# the default clustering engine is now FasterPAM (see fasterpam.py), the
+# original alternating algorithm is kept as method='voronoi'
 #!/usr/bin/env python
 
 import cPickle as pickle
-import matplotlib.pyplot as plt
-from plotline_utilities import progression_bar
-from collections import defaultdict
-from seaborn import heatmap
+import config
+from instrumentation import count, save_metrics, timer
+from fasterpam import fasterpam, kmedoids_plusplus
+from itertools import imap
+import cluster_metrics
+from multiprocessing import Pool, cpu_count
 import numpy as np
-import pandas as pd
+import os
 import random
 import sys
+import tempfile
+#matplotlib, seaborn and pandas are imported by the plotting functions only,
+#so that the processes running the restarts start quickly
 
-def cluster(distances, k=3):
+def cluster(distances, k=3, method='fasterpam', seed=None, init='random'):
     '''
     parameters:
     ----------
     distances: square np.array of size m x m, with m the number of datapoints
     k: number of clusters
+    method: 'fasterpam' (default) swaps medoids as long as it lowers the sum
+            of the distances to the medoids (see fasterpam.py)
+            'voronoi' alternates between assigning the points and computing
+            the medoid of each cluster
+    seed: seed for the choice of the initial medoids (None uses the random
+          module)
+    init: 'random' picks the initial medoids uniformly
+          'k-medoids++' picks them far from each other (D^2 weighting, see
+          fasterpam.kmedoids_plusplus)
 
     returns:
     --------
@@ -53,13 +82,29 @@ def cluster(distances, k=3):
     #integers (each interger is the index of the datapoint used to initialize
     #the cluster)
     curr_medoids = np.array([-1]*k)
+    if init == 'k-medoids++':
+        if seed is None:
+            seed = random.randint(0, 2**31 - 1)
+        curr_medoids = kmedoids_plusplus(distances, k,
+                                         np.random.RandomState(seed))
+    elif init != 'random':
+        raise ValueError('unknown initialisation %s' %init)
+    elif seed is not None:
+        curr_medoids = np.random.RandomState(seed).choice(m, k, replace=False)
     while not len(np.unique(curr_medoids)) == k:
         curr_medoids = np.array([random.randint(0, m - 1) for _ in range(k)])
+
+    if method == 'fasterpam':
+        return fasterpam(distances, k=k, init_medoids=curr_medoids)
+    elif method != 'voronoi':
+        raise ValueError('unknown clustering method %s' %method)
+
     old_medoids = np.array([-1]*k) # Doesn't matter what we initialize these to.
     new_medoids = np.array([-1]*k)
 
     # Until the medoids stop updating, do the following:
     while not ((old_medoids == curr_medoids).all()):
+        count('clustering passes')
         # Assign each point to cluster with closest medoid.
         clusters = assign_points_to_clusters(curr_medoids, distances)
 
@@ -90,63 +135,258 @@ def assign_points_to_clusters(medoids, distances):
     return clusters
 
 def compute_new_medoid(cluster, distances):
-    mask = np.ones(distances.shape)
-    mask[np.ix_(cluster,cluster)] = 0.
-    cluster_distances = np.ma.masked_array(data=distances, mask=mask, fill_value=10e9)
-    costs = cluster_distances.sum(axis=1)
-    return costs.argmin(axis=0, fill_value=10e9)
+    #only the distances inside the cluster are read (no m x m mask)
+    costs = distances[np.ix_(cluster,cluster)].sum(axis=1)
+    return cluster[costs.argmin()]
 
 def cost(curr_medoids, clusters, distances):
     '''
     average distance in clusters (sum(distance(point one to others in cluster)))/num point in cluster
     my own added function
+    (computed for all the clusters in one pass, see cluster_metrics.py)
     '''
-    list_average_costs = []
-    for curr_medoid in curr_medoids:
-        #defines the cluster with indices and gets num of elements
-        #in the cluster
-        cluster_ = np.where(clusters == curr_medoid)[0]
-        num_movies = len(cluster_)
-        mask = np.ones(distances.shape)
-        #add zeros everywhere that belongs to cluster
-        mask[np.ix_(cluster_,cluster_)] = 0.
-        cluster_distances = np.ma.masked_array(data=distances, mask=mask, fill_value=10e9)
-        costs = cluster_distances.sum(axis=1)
-        #get average_cost for cluster:
-        avg_cost = sum(costs.data)*1./num_movies
-        list_average_costs.append(avg_cost)
+    codes, k = cluster_metrics.cluster_codes(clusters, curr_medoids)
+    list_average_costs = list(cluster_metrics.cluster_costs(distances, codes, k))
     return curr_medoids, list_average_costs, np.mean(list_average_costs)
 
 ###########################    added on      ###########################
 ###########################    functions     ###########################
 ###########################    by AnnaVM     ###########################
 
-def make_distance_array(distance_dictionary):
+def make_distance_array(distance_dictionary, movies=None):
     '''
     parameters:
     -----------
     Takes in the pickled dictionary (d[movie1][movie2]=distance)
+    movies: order of the rows, defaults to the sorted movies of the
+            dictionary (the same order as dtw_script.save_distances, so the
+            cluster indices do not change from one run to the next)
 
     Returns:
     --------
     list of movies (from the dictionary)
     np.array (square array of size num movies) as the matrix of
     pairwise distances
+
+    raises KeyError if the distance of two different movies is missing (only
+    the distance of a movie to itself defaults to 0)
     '''
-    movies = distance_dictionary.keys()
-    list_distances = []
-    for movie1 in movies:
-        movie_distances = []
-        for movie2 in movies:
-            if movie1 == movie2:
-                movie_distances.append(0)
-            else:
-                movie_distances.append(distance_dictionary[movie1][movie2])
-        list_distances.append(movie_distances)
-    distances = np.array(list_distances)
+    if movies is None:
+        movies = sorted(distance_dictionary)
+    m = len(movies)
+    distances = np.zeros((m, m))
+    missing = [np.nan] * m
+    for index, movie1 in enumerate(movies):
+        #one bulk lookup per row, the missing pairs are nan
+        row = distance_dictionary[movie1]
+        distances[index] = np.fromiter(imap(row.get, movies, missing),
+                                       np.float64, m)
+        distances[index, index] = 0.
+        for column in np.flatnonzero(np.isnan(distances[index])):
+            if movies[column] not in row:
+                raise KeyError('no distance between %s and %s'
+                               %(movie1, movies[column]))
     return movies, distances
 
-def clusters_k(k, distances, plot_option=False):
+def load_distances(path=config.DISTANCES_NPY,
+                   path_movies=config.DISTANCE_MOVIES,
+                   path_pickle=config.DISTANCES_PKL, mmap_mode=None):
+    '''
+    returns:
+    --------
+    list of movies, square np.array of the pairwise distances
+    read from the matrix saved by dtw_script.py if it exists, from the
+    pickled dictionary otherwise
+    mmap_mode: 'r' to read the matrix lazily from disk
+    '''
+    if os.path.exists(path) and os.path.exists(path_movies):
+        with open(path_movies, 'r') as f:
+            movies = f.read().splitlines()
+        return movies, np.load(path, mmap_mode=mmap_mode)
+    with open(path_pickle, 'r') as f:
+        distance_dictionary = pickle.load(f)
+    return make_distance_array(distance_dictionary)
+
+def restart_seeds(k, n_restarts, seed):
+    '''
+    the seed of each restart only depends on (seed, k, restart number), so the
+    clustering is reproducible whatever the number of processes, and
+    whichever range of k it is computed with
+    '''
+    return np.random.RandomState([seed, k]).randint(0, 2**31 - 1,
+                                                    size=n_restarts)
+
+def _is_npy_file(distances):
+    '''
+    True if distances is the whole array of the .npy file it maps: a slice
+    of a memmap (distances[:10, :10]) keeps the filename and the offset of
+    its parent, so its shape and layout are compared with the header
+    '''
+    filename = getattr(distances, 'filename', None)
+    if not isinstance(distances, np.memmap) or not filename \
+            or not filename.endswith('.npy') or not os.path.exists(filename):
+        return False
+    with open(filename, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        header_end = f.tell()
+    shape, fortran_order, dtype = header
+    contiguous = distances.flags.f_contiguous if fortran_order \
+                 else distances.flags.c_contiguous
+    return distances.offset == header_end and distances.shape == shape \
+           and distances.dtype == dtype and contiguous
+
+def share_distances(distances):
+    '''
+    the processes read the distance matrix from a .npy file mapped in memory
+    (no copy of the matrix is sent to the processes)
+
+    returns:
+    --------
+    path of the .npy file, BOOL True if it is a temporary file to remove
+    '''
+    if _is_npy_file(distances):
+        #the matrix was opened with np.load(path, mmap_mode='r')
+        return distances.filename, False
+    handle, path = tempfile.mkstemp(suffix='.npy')
+    os.close(handle)
+    np.save(path, np.asarray(distances, dtype=np.float64))
+    return path, True
+
+#distance matrix of a restart process, mapped by _init_restart_worker
+_shared_distances = None
+
+def _init_restart_worker(path):
+    global _shared_distances
+    _shared_distances = np.asarray(np.load(path, mmap_mode='r'))
+
+def _run_restart(task, distances=None):
+    '''
+    task: tuple (k, seed, init)
+    returns: medoids, list of the average cost per cluster, average cost
+    '''
+    if distances is None:
+        distances = _shared_distances
+    k, seed, init = task
+    with timer('clustering'):
+        clusters, curr_medoids = cluster(distances, k=k, seed=seed, init=init)
+    return cost(curr_medoids, clusters, distances)
+
+def run_restarts(distances, tasks, n_jobs=1, stop=None):
+    '''
+    parameters:
+    -----------
+    distances: square matrix of pairwise distances
+    tasks: list of (k, seed, init), one per clustering to run
+    n_jobs: number of processes (None for the number of cpus), 1 runs the
+            clusterings in the current process
+    stop: function called with the list of costs obtained so far (in the
+          order of tasks), returning True when no more restarts are needed
+          (None runs all the tasks)
+
+    returns:
+    --------
+    list of (medoids, list_average_costs, avg_cost), in the order of tasks
+    '''
+    if n_jobs is None:
+        n_jobs = cpu_count()
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = (_run_restart(task, distances) for task in tasks)
+        return _collect(results, stop)
+    path, temporary = share_distances(distances)
+    pool = Pool(n_jobs, initializer=_init_restart_worker, initargs=(path,))
+    try:
+        chunksize = 1 if stop else max(1, len(tasks) // (4 * n_jobs))
+        results = _collect(pool.imap(_run_restart, tasks, chunksize), stop)
+    finally:
+        #the restarts still running are not needed anymore
+        pool.terminate()
+        pool.join()
+        if temporary:
+            os.remove(path)
+    return results
+
+def _collect(results, stop):
+    #the results arrive in the order of the tasks, so the restarts kept do
+    #not depend on the number of processes
+    #(the timers of the restarts run by other processes stay there, the
+    #number of restarts is counted here)
+    collected = []
+    for result in results:
+        collected.append(result)
+        count('clustering restarts')
+        if stop is not None and stop([avg_cost for _, _, avg_cost
+                                      in collected]):
+            break
+    return collected
+
+def stopping_point(costs, patience=None, hit_rate=None, min_restarts=10,
+                   rtol=1e-9):
+    '''
+    adaptive restart policy: number of restarts after which the search stops
+
+    parameters:
+    -----------
+    costs: list of the costs of the restarts, in order
+    patience: stop once the best cost has not improved for patience restarts
+    hit_rate: stop once this fraction of the restarts (at least min_restarts)
+              has reached the best cost (within rtol)
+    (None disables a criterion)
+
+    returns:
+    --------
+    INT, number of restarts needed (None if the policy never stops)
+    '''
+    best = None
+    hits = 0
+    since_improvement = 0
+    for n_done, value in enumerate(costs, 1):
+        #(best - rtol * abs(best) would be nan if best started at np.inf)
+        if best is None or value < best - rtol * abs(best):
+            best = value
+            hits = 1
+            since_improvement = 0
+        else:
+            since_improvement += 1
+            if abs(value - best) <= rtol * abs(best):
+                hits += 1
+        if patience is not None and since_improvement >= patience:
+            return n_done
+        if hit_rate is not None and n_done >= min_restarts \
+                and hits * 1. / n_done >= hit_rate:
+            return n_done
+    return None
+
+def _stop_rule(patience, hit_rate, min_restarts):
+    if patience is None and hit_rate is None:
+        return None
+    def stop(costs):
+        return stopping_point(costs, patience, hit_rate,
+                              min_restarts) is not None
+    return stop
+
+def _draw_seed(seed):
+    #without a seed, the random module decides (as in cluster)
+    if seed is None:
+        return random.randint(0, 2**31 - 1)
+    return seed
+
+def _best_restart(results):
+    #first restart with the minimum cost, as in the sequential loop
+    mini = 10e9
+    medoids = None
+    for curr_medoids, list_average_costs, avg_cost in results:
+        if avg_cost<mini:
+            mini = avg_cost
+            medoids = curr_medoids
+    return mini, medoids
+
+def clusters_k(k, distances, plot_option=False, n_restarts=100, n_jobs=1,
+               seed=None, init='random', patience=None, hit_rate=None,
+               min_restarts=10):
     '''
     k custers are formed with the medoids algorithm
     the procedure is repeated 100 times to ensure with find global, not local minimum
@@ -156,38 +396,42 @@ def clusters_k(k, distances, plot_option=False):
     k: number of clusters
     distances: square matrix of pairwise distances
     plot_option: seeing the costs as bar graph
+    n_restarts: number of times the clustering is repeated
+    n_jobs: number of processes running the restarts (None for all cpus)
+    seed: makes the result reproducible (None for a random seed)
+    init: initialisation of the medoids, 'random' or 'k-medoids++'
+    patience, hit_rate, min_restarts: stop the restarts early, see
+              stopping_point (restart_report compares the policies)
 
     return:
     -------
     mini: the minimum cost encountered
     medoids: the medoids ('center of clusters') correponding to the minimum cost
     '''
-    list_values = []
-    mini = 10e9
-    index = 0
-    for _ in xrange(100):
-        #the clustering runs 100 times, we keep the best one (in an attempt to get the )
-        clusters, curr_medoids = cluster(distances, k=k)
-        curr_medoids, list_average_costs, avg_cost = cost(curr_medoids, clusters, distances)
-        if plot_option:
+    seeds = restart_seeds(k, n_restarts, _draw_seed(seed))
+    results = run_restarts(distances, [(k, s, init) for s in seeds],
+                           n_jobs=n_jobs,
+                           stop=_stop_rule(patience, hit_rate, min_restarts))
+    if plot_option:
+        import matplotlib.pyplot as plt
+        for index, (curr_medoids, list_average_costs, avg_cost) \
+                in enumerate(results):
             plt.bar(xrange(len(list_average_costs)), list_average_costs, label=avg_cost)
             plt.legend()
             plt.title(index)
             plt.show()
-        index +=1
-        list_values.append([curr_medoids, list_average_costs, avg_cost])
-        if avg_cost<mini:
-            mini = avg_cost
-            medoids = curr_medoids
-    return mini, medoids
+    return _best_restart(results)
 
-def defining_k(distances, range_k=range(2,15), plot_option=True):
+def defining_k(distances, range_k=range(2,15), plot_option=True,
+               n_restarts=100, n_jobs=1, seed=None, init='random'):
     '''
     parameters:
     -----------
     distances: square matrix of pairwise distances
     range_k: list of the number of clusters to explore
     plot_option: see the cost
+    n_restarts, n_jobs, seed, init: see clusters_k
+              (the restarts of all the values of k share the same processes)
 
     return:
     -------
@@ -195,26 +439,106 @@ def defining_k(distances, range_k=range(2,15), plot_option=True):
     list_medoids: list of medoids
     --> both are in the same order as range_k
     '''
+    seed = _draw_seed(seed)
+    tasks = []
+    for k in range_k:
+        tasks += [(k, s, init) for s in restart_seeds(k, n_restarts, seed)]
+    print 'executing for ' + ', '.join(str(k) for k in range_k) + ' clusters'
+    results = run_restarts(distances, tasks, n_jobs=n_jobs)
+
     list_val = [] #will receive the cost of the clustering
     list_medoids = [] #will receive the medoids
-    for k in range_k:
-        print 'executing for ' + str(k) + ' clusters'
-        mini, curr_medoids = clusters_k(k,distances)
+    for i, k in enumerate(range_k):
+        mini, curr_medoids = _best_restart(
+                            results[i*n_restarts:(i+1)*n_restarts])
         list_val.append(mini)
         list_medoids.append(curr_medoids)
     if plot_option:
+        import matplotlib.pyplot as plt
         plt.plot(range_k, list_val, '-x')
         plt.xlabel('num of clusters')
         plt.ylabel('cost')
     return list_val, list_medoids
 
-def chosen_num_cluster(movies, chosen_k, distances):
+def silhouettes_k(distances, list_medoids):
+    '''
+    parameters:
+    -----------
+    distances: square matrix of pairwise distances
+    list_medoids: list of medoids (as returned by defining_k)
+
+    returns:
+    --------
+    list of the average silhouette of each clustering (the higher, the
+    better separated the clusters)
+    '''
+    list_silhouettes = []
+    for curr_medoids in list_medoids:
+        clusters = assign_points_to_clusters(curr_medoids, distances)
+        codes, k = cluster_metrics.cluster_codes(clusters, curr_medoids)
+        score, per_cluster = cluster_metrics.silhouette_score(distances,
+                                                              codes, k)
+        list_silhouettes.append(score)
+    return list_silhouettes
+
+def restart_report(k, distances, n_restarts=100, patience=10, hit_rate=0.3,
+                   min_restarts=10, n_jobs=1, seed=None):
+    '''
+    compares the restart policies: for each initialisation ('random' and
+    'k-medoids++'), all the n_restarts are run, and the early stopping policy
+    is replayed on the sequence of costs (it only depends on the costs
+    obtained in order)
+
+    returns:
+    --------
+    dictionary: key init, value dictionary with
+        'restarts used': restarts run before the policy stops
+        'best cost': best cost found within these restarts
+        'best cost (all restarts)': best cost found with all the restarts
+        'hit rate': fraction of all the restarts reaching that best cost
+    '''
+    seed = _draw_seed(seed)
+    report = {}
+    for init in ['random', 'k-medoids++']:
+        tasks = [(k, s, init) for s in restart_seeds(k, n_restarts, seed)]
+        costs = [avg_cost for _, _, avg_cost
+                 in run_restarts(distances, tasks, n_jobs=n_jobs)]
+        n_used = stopping_point(costs, patience, hit_rate, min_restarts) \
+                 or n_restarts
+        best = min(costs)
+        report[init] = {'restarts used': n_used,
+                        'best cost': min(costs[:n_used]),
+                        'best cost (all restarts)': best,
+                        'hit rate': np.mean(np.isclose(costs, best,
+                                                       rtol=1e-9, atol=0))}
+
+    print '*'*72
+    print 'restart policy for k = %d: patience %s, hit rate %s' \
+            %(k, patience, hit_rate)
+    print '-'*72
+    print 'init'.ljust(14) + 'restarts used'.rjust(15) + 'saved'.rjust(8) \
+            + 'best cost'.rjust(13) + 'best (all)'.rjust(13) \
+            + 'hit rate'.rjust(9)
+    for init in ['random', 'k-medoids++']:
+        r = report[init]
+        print init.ljust(14) + ('%d/%d' %(r['restarts used'], n_restarts))\
+              .rjust(15) + ('%d%%' %(100 - r['restarts used']*100/n_restarts))\
+              .rjust(8) + ('%.2f' %r['best cost']).rjust(13) \
+              + ('%.2f' %r['best cost (all restarts)']).rjust(13) \
+              + ('%.2f' %r['hit rate']).rjust(9)
+    print '*'*72
+    return report
+
+def chosen_num_cluster(movies, chosen_k, distances, n_jobs=1, seed=None,
+                       init='random', patience=None, hit_rate=None,
+                       min_restarts=10):
     '''
     parameters:
     -----------
     movies: list of movies
     chosen_k: the number of cluster chosen (needs to be >=2)
     distances: square array of pairwise distances
+    n_jobs, seed, init, patience, hit_rate, min_restarts: see clusters_k
 
     returns:
     --------
@@ -228,7 +552,10 @@ def chosen_num_cluster(movies, chosen_k, distances):
     '''
 
     #do the clustering and keep smallest cost for 100 tries
-    mini, curr_medoids = clusters_k(chosen_k,distances)
+    mini, curr_medoids = clusters_k(chosen_k,distances, n_jobs=n_jobs,
+                                    seed=seed, init=init, patience=patience,
+                                    hit_rate=hit_rate,
+                                    min_restarts=min_restarts)
 
     movies_array = np.array(movies)
     chosen_medoids = curr_medoids
@@ -255,6 +582,7 @@ def chosen_num_cluster(movies, chosen_k, distances):
             dict_clusters_mask, dict_clusters_movie_names
 
 def see_histograms(list_distances):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10,10))
     n_cluster = len(list_distances)
     if n_cluster%2 == 0:
@@ -273,6 +601,9 @@ def see_histograms(list_distances):
     plt.show()
 
 def see_heatmap(d_intracluster_distances, dict_clusters_mask):
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    from seaborn import heatmap
     #create a symetrical pandas dataframe
     df = pd.DataFrame(d_intracluster_distances, columns=dict_clusters_mask.keys())
     #rename column to have right label in heatmap
@@ -290,8 +621,12 @@ def visualize_clusters(dict_clusters_mask, dict_clusters_movie_names,distances):
     #distances in cluster
     list_distances = []
     d_intracluster_distances = {}
+    clusters = np.empty(distances.shape[0], dtype=np.int64)
+    for cluster1, bool_array in dict_clusters_mask.items():
+        clusters[bool_array] = cluster1
+    list_distances = cluster_metrics.medoid_distances(distances, clusters,
+                                                      dict_clusters_mask.keys())
     for cluster1, bool_array in dict_clusters_mask.items():
-        list_distances.append(distances[bool_array][:,cluster1])
         list_for_dict = []
         for cluster2, bool_array2 in dict_clusters_mask.items():
             pp = distances[bool_array][:, bool_array2]
@@ -303,11 +638,14 @@ def visualize_clusters(dict_clusters_mask, dict_clusters_movie_names,distances):
 
     return list_distances, d_intracluster_distances
 
-def investigate_stability(movies, distances, times_run, k):
+def investigate_stability(movies, distances, times_run, k, n_jobs=1,
+                          seed=None, n_restarts=100):
     '''
     exploring the stability of the clusters
     the clustering (with 100 initiations to enhance the chance of reaching the global minimum)
     is run multiple times
+    the runs are compared with their co-association matrix (how many times
+    two movies are in the same cluster), see stability.py
 
     parameters:
     -----------
@@ -315,48 +653,44 @@ def investigate_stability(movies, distances, times_run, k):
     distances: square array of pairewise distances
     k: number of clusters
     times_run: number of times the clustering is run (for instance 6 or 10)
+    n_jobs: number of processes running the restarts (of all the runs)
+    seed: makes the result reproducible
+    n_restarts: number of restarts of each clustering
 
     returns:
     --------
     dictionary with the stable sets
+        key: medoid (as STR) of a consensus cluster
+        value: set of the movies that were in the same cluster as this
+               medoid in all the runs
     '''
-    list_runs = [] #will get all the movies as filename in the clusters
-                   # for instance k = 3:
-                   # [[set1, set2, set3], [set1, set2, set3]]
-    print 'Progression of clustering'
+    import stability
+
+    #each run has its own seed, all the restarts go to the same processes
+    run_seeds = restart_seeds(k, times_run, _draw_seed(seed))
+    tasks = []
+    for run_seed in run_seeds:
+        tasks += [(k, s, 'random') for s in restart_seeds(k, n_restarts,
+                                                         run_seed)]
+    print 'Clustering %d times (%d restarts each)' %(times_run, n_restarts)
+    results = run_restarts(distances, tasks, n_jobs=n_jobs)
+
+    list_codes = []
+    list_medoids = []
     for i in xrange(times_run):
-        progression_bar(i, times_run-1, Nbars=times_run-1, char='-')
-        #for a run let's get the clusters
-        m1,m2,c,d1,d2 = chosen_num_cluster(movies, k, distances)
-        list_sets = [] # will receive the sets: [set1, set2, set3]
-        for key in d2.keys():
-            s1 = set(d2[key])
-            s1.add(key)
-            list_sets.append(s1)
-        list_runs.append(list_sets)
-
-    medoids = m2 #the medoids can vary with the runs, but they should be in the same
-                 #clusters, this will allow us to id clusters in different clusters
-
-    #figure out corresponding clusters from the various runs, and bringing them together
-    d = defaultdict(list)
-    #dictionary: d[medoid] = [set1_from_run1, set3_from_run2, ...] containing the medoid
-    for run in list_runs:
-        for set_ in run:
-            for medoid in medoids:
-                if medoid in set_: #identify the right cluster
-                    d[medoid].append(set_)
-
-    #finally, intersect the sets
+        mini, curr_medoids = _best_restart(
+                            results[i*n_restarts:(i+1)*n_restarts])
+        clusters = assign_points_to_clusters(curr_medoids, distances)
+        codes, _ = cluster_metrics.cluster_codes(clusters, curr_medoids)
+        list_codes.append(codes)
+        list_medoids.append(curr_medoids)
+
+    report = stability.stability_report(list_codes, list_medoids, k)
+
+    movies_array = np.array(movies)
     d_intersection = {}
-    for medoid in d.keys():
-        list_sets = d[medoid]
-        for i in range(len(list_sets)):
-            if i == 0:
-                set_intersect = list_sets[i]
-            else:
-                set_intersect = set_intersect.intersection(list_sets[i])
-        d_intersection[medoid] = set_intersect
+    for medoid, core in report['core'].items():
+        d_intersection[movies_array[medoid]] = set(movies_array[core])
 
     #print the stability: how many movies are always together in the same cluster
     num_movies = 0
@@ -365,34 +699,65 @@ def investigate_stability(movies, distances, times_run, k):
     print '*'*50
     print '**' + ' '*12 + 'stability of clusters' + ' '*13 +'**'
     print '*'*50
-    for intersect_set in d_intersection.values():
+    for medoid, stability_score in zip(report['medoids'],
+                                       report['cluster stability']):
+        intersect_set = d_intersection[movies_array[medoid]]
         num_movies += len(intersect_set)
-        print 'number of movies always in the cluster: '+ str(len(intersect_set))
+        print 'number of movies always in the cluster: '+ str(len(intersect_set)) \
+              + ' | stability: %.2f' %stability_score
     print '-'*50
     print 'movies that are always in the same cluster: '
     print 'in numbers: '+ str(num_movies) + ' | in percent: ' + str(num_movies*1./total_num_movies * 100) +'%'
+    print 'average stability of the movies: %.2f' \
+            %report['movie stability'].mean()
     print '*'*50
 
     return d_intersection
 
+def _option(name, default=None):
+    #reads an option given as name=value after the action, eg jobs=4
+    for argument in sys.argv[2:]:
+        if argument.startswith(name + '='):
+            return int(argument[len(name)+1:])
+    return default
+
 if __name__ == '__main__':
-    #getting distances in a dictionary
-    with open('../data/distances.pkl', 'r') as f:
-        distance_dictionary = pickle.load(f)
+    n_jobs = _option('jobs', 1)
+    seed = _option('seed')
+
     #getting distances as a square array
-    movies, distances = make_distance_array(distance_dictionary)
+    movies, distances = load_distances()
 
     if sys.argv[1] == 'pick_k':
-        list_val, list_medoids = defining_k(distances, range_k=range(2,15), plot_option=True)
+        import matplotlib.pyplot as plt
+        range_k = range(2,15)
+        plt.subplot(2,1,1)
+        list_val, list_medoids = defining_k(distances, range_k=range_k,
+                                            plot_option=True,
+                                            n_jobs=n_jobs, seed=seed)
+        plt.subplot(2,1,2)
+        plt.plot(range_k, silhouettes_k(distances, list_medoids), '-x')
+        plt.xlabel('num of clusters')
+        plt.ylabel('silhouette')
         plt.show()
 
     elif sys.argv[1][:-1] == 'k=':
         k = int(sys.argv[1][-1])
-        m1,m2,c,d1,d2 = chosen_num_cluster(movies, k, distances)
+        m1,m2,c,d1,d2 = chosen_num_cluster(movies, k, distances,
+                                           n_jobs=n_jobs, seed=seed)
         list_distances, d_intracluster_distances = visualize_clusters(d1, d2 ,distances)
 
+    elif sys.argv[1][1:] == '_restarts':
+        k = int(sys.argv[1][0])
+        report = restart_report(k, distances, n_jobs=n_jobs, seed=seed,
+                                patience=_option('patience', 10),
+                                hit_rate=_option('hit', 30) / 100.)
+
     elif sys.argv[1][1:] == '_stability':
         k = int(sys.argv[1][0])
-        d_stable_clusters = investigate_stability(movies, distances, 10, k)
-        with open('../data/clusters.pkl', 'w') as f:
+        d_stable_clusters = investigate_stability(movies, distances, 10, k,
+                                                  n_jobs=n_jobs, seed=seed)
+        with open(config.CLUSTERS_PKL, 'w') as f:
             pickle.dump(d_stable_clusters, f)
+
+    save_metrics('medoids')
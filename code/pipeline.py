@@ -0,0 +1,453 @@
+'''
+runs the steps of the project (scraping, emotions, distances, clusters...)
+in the order of their dependencies, and only the ones which are not up to
+date
+
+each stage declares the files (or folders) it reads and writes, and its
+parameters:
+- a stage is run if its fingerprint (parameters, and size and modification
+  time of all the files of its inputs) is not the one of its last
+  successful run, or if a stage it depends on is run
+- a stage whose outputs are missing is run if it is asked for, or if a
+  stage reading them is run
+- the outputs of a stage with no fingerprint recorded (made before the
+  pipeline, or copied) are taken as up to date, and their fingerprint is
+  recorded ('adopt' records them again, after the files were changed by
+  hand)
+- a stage depends on the stages which write its inputs; it is not run if
+  one of them failed, or if its inputs are missing
+- the stages which do not depend on each other are run at the same time, in
+  separate processes (jobs of them at most)
+
+the fingerprints of the last successful runs are kept in
+'../data/pipeline_state.json' (see config.py for the paths)
+
+stages:
+-------
+scrape: scripts from IMSDb (scraping_script.py), not run unless asked for or
+        if a stage run needs the texts and they are missing
+emotions: emotion counts of the scripts (emotions_script.py)
+distances: DTW distances between the smoothed plotlines (dtw_script.py)
+clusters: stable clusters for k clusters (medoids.py)
+cluster_model: model assigning new movies to the clusters of the stage
+               clusters (cluster_assignment.py)
+knn: index of the K closest movies (knn_index.py)
+graphs: png of the plotlines (export_graphs.py)
+
+Usage:
+------
+To bring everything up to date, type in a terminal
+$ python pipeline.py
+to see what would be run, without running it
+$ python pipeline.py dry
+to run some stages (and the ones they depend on, if not up to date), to run
+them even if they are up to date, and to change the parameters
+$ python pipeline.py knn clusters force k=3 K=10 smoothing=lowess jobs=2
+to take the outputs on disk as up to date (all the stages, or some of them)
+$ python pipeline.py adopt
+'''
+
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from multiprocessing import Process, Queue
+
+import config
+
+class Stage(object):
+    '''
+    usage:
+    ------
+    Stage('knn', build_knn, inputs=[config.DISTANCES_NPY],
+          outputs=[config.KNN_INDEX_NPZ], params={'K': 10})
+    the function is called with the parameters as keyword arguments
+    '''
+    def __init__(self, name, function, inputs, outputs, params=None):
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+
+    def fingerprint(self):
+        '''
+        returns:
+        --------
+        sha1 (STR) of the parameters and of the size and modification time
+        of the input files (all the files of the input folders)
+        '''
+        files = []
+        for path in self.inputs:
+            if os.path.isdir(path):
+                for directory, _, filenames in os.walk(path):
+                    files += [os.path.join(directory, filename)
+                              for filename in filenames]
+            else:
+                files.append(path)
+        listing = []
+        for path in sorted(files):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                listing.append((os.path.relpath(path, config.DATA_DIR),
+                                stat.st_size, stat.st_mtime))
+            else:
+                listing.append((os.path.relpath(path, config.DATA_DIR),
+                                None, None))
+        return hashlib.sha1(json.dumps([sorted(self.params.items()), listing])
+                            ).hexdigest()
+
+    def outputs_exist(self):
+        return all(os.path.exists(path) for path in self.outputs)
+
+#functions of the stages (run in their own process)
+
+def scrape(base_url):
+    from scraping_script import BASE_URL, scrape_all
+    scrape_all(base_url=base_url or BASE_URL)
+
+def emotions():
+    from emotions_script import emotions_all
+    emotions_all()
+
+def distances(smoothing_method):
+    from dtw_script import dtw_matrix, save_distances
+    movies, matrix = dtw_matrix(smoothing_method)
+    save_distances(movies, matrix)
+
+def clusters(k, times_run, seed):
+    import cPickle as pickle
+    from medoids import investigate_stability, load_distances
+    movies, matrix = load_distances()
+    d_stable_clusters = investigate_stability(movies, matrix, times_run, k,
+                                              seed=seed)
+    with open(config.CLUSTERS_PKL, 'w') as f:
+        pickle.dump(d_stable_clusters, f)
+
+def cluster_model(smoothing_method):
+    #the model describes the clusters saved by the stage clusters (the same
+    #medoids, every movie going to the closest one)
+    import cPickle as pickle
+    import numpy as np
+    from cluster_assignment import build_from_saved_arrays
+    from medoids import assign_points_to_clusters, load_distances
+    movies, matrix = load_distances()
+    with open(config.CLUSTERS_PKL, 'r') as f:
+        d_stable_clusters = pickle.load(f)
+    positions = dict((movie, index) for index, movie in enumerate(movies))
+    chosen_medoids = np.array(sorted(positions[medoid]
+                                     for medoid in d_stable_clusters))
+    groups = assign_points_to_clusters(chosen_medoids, matrix)
+    build_from_saved_arrays(movies, matrix, groups, chosen_medoids,
+                            n_members=2,
+                            smoothing_method=smoothing_method).save()
+
+def knn(K):
+    from knn_index import build_knn_index, movie_titles
+    from medoids import load_distances
+    movies, matrix = load_distances(mmap_mode='r')
+    build_knn_index(movies, matrix, K=K, titles=movie_titles(movies)).save()
+
+def graphs():
+    from dtw_script import list_legit_files
+    from export_graphs import export_all
+    export_all(list_legit_files())
+
+def default_stages(k=3, K=10, smoothing_method='lowess', times_run=10,
+                   seed=None, base_url=None):
+    '''
+    returns:
+    --------
+    list of the Stages of the module docstring (base_url None: IMSDb)
+    '''
+    distance_files = [config.DISTANCES_NPY, config.DISTANCE_MOVIES]
+    return [Stage('scrape', scrape, [], [config.TEXTS_DIR],
+                  {'base_url': base_url}),
+            Stage('emotions', emotions,
+                  [config.TEXTS_DIR, config.NRC_EMOTIONS_FILE],
+                  [config.ARRAYS_DIR]),
+            Stage('distances', distances, [config.ARRAYS_DIR], distance_files,
+                  {'smoothing_method': smoothing_method}),
+            Stage('clusters', clusters, distance_files, [config.CLUSTERS_PKL],
+                  {'k': k, 'times_run': times_run, 'seed': seed}),
+            Stage('cluster_model', cluster_model,
+                  distance_files + [config.CLUSTERS_PKL, config.ARRAYS_DIR],
+                  [config.CLUSTER_MODEL_PKL],
+                  {'smoothing_method': smoothing_method}),
+            Stage('knn', knn, distance_files, [config.KNN_INDEX_NPZ],
+                  {'K': K}),
+            Stage('graphs', graphs, [config.ARRAYS_DIR], [config.GRAPHS_DIR])]
+
+def _run_stage(stage, results):
+    #in the process of the stage: reports the outcome to the runner
+    from instrumentation import METRICS, save_metrics
+    METRICS.reset() #not the ones of the runner, copied by the fork
+    start = time.time()
+    try:
+        stage.function(**stage.params)
+        error = None
+    except BaseException:
+        error = traceback.format_exc()
+    save_metrics('pipeline_' + stage.name, extra={'params': stage.params,
+                                                  'failed': error is not None})
+    results.put((stage.name, error, time.time() - start))
+
+class Runner(object):
+    '''
+    usage:
+    ------
+    runner = Runner(default_stages(k=3))
+    runner.run(['knn'], jobs=2)
+    '''
+    def __init__(self, stages, state_path=config.PIPELINE_STATE):
+        self.stages = stages
+        self.by_name = dict((stage.name, stage) for stage in stages)
+        self.state_path = state_path
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                self.state = json.load(f)
+        #a stage depends on the stages writing its inputs
+        writers = {}
+        for stage in stages:
+            for path in stage.outputs:
+                writers[path] = stage.name
+        self.dependencies = dict(
+                (stage.name, sorted(set(writers[path] for path in stage.inputs
+                                        if path in writers)))
+                for stage in stages)
+
+    def _save_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.state_path)
+
+    def is_up_to_date(self, name):
+        #the outputs of a stage with no fingerprint recorded (made before
+        #the pipeline, or by hand) are taken as they are: see adopt
+        stage = self.by_name[name]
+        return stage.outputs_exist() and \
+               self.state.get(name, stage.fingerprint()) == stage.fingerprint()
+
+    def adopt(self, names=None, overwrite=False):
+        '''
+        records the fingerprints of stages whose outputs exist, as if they
+        had just been run
+
+        parameters:
+        -----------
+        names: names of the stages (None: all of them)
+        overwrite: BOOL, on False only the stages with no fingerprint recorded
+                   are adopted, on True the recorded ones are replaced too
+
+        returns:
+        --------
+        list of the names of the stages adopted
+        '''
+        adopted = [name for name in (names or [stage.name for stage
+                                               in self.stages])
+                   if self.by_name[name].outputs_exist() and
+                   (overwrite or name not in self.state)]
+        for name in adopted:
+            self.state[name] = self.by_name[name].fingerprint()
+        if adopted:
+            self._save_state()
+        return adopted
+
+    def _with_dependencies(self, targets):
+        #the targets and the stages they depend on, dependencies first
+        order = []
+        def visit(name):
+            if name not in order:
+                for dependency in self.dependencies[name]:
+                    visit(dependency)
+                order.append(name)
+        for name in targets:
+            visit(name)
+        return order
+
+    def plan(self, targets=None, force=False):
+        '''
+        a stage is run if it is forced, if its inputs or parameters changed
+        since its last run, or if a stage it depends on is run; a stage
+        whose outputs are missing is run if it is a target or if a stage
+        reading them is run (so an unasked scrape is not run while the
+        stages after it are up to date)
+
+        parameters:
+        -----------
+        targets: names of the stages wanted (None: all of them but scrape,
+                 which is only run if a stage needs its missing texts)
+        force: BOOL, on True the targets are run even if up to date
+
+        returns:
+        --------
+        list of the names of the stages to run, in an order compatible with
+        the dependencies
+        '''
+        if targets is None:
+            targets = [stage.name for stage in self.stages
+                       if stage.name != 'scrape']
+        for name in targets:
+            if name not in self.by_name:
+                raise ValueError('unknown stage: %s (stages: %s)'
+                                 %(name, ', '.join(self.by_name)))
+        order = self._with_dependencies(targets)
+        readers = dict((name, [other for other in order
+                               if name in self.dependencies[other]])
+                       for name in order)
+        def changed(name):
+            if force and name in targets:
+                return True
+            if name == 'scrape' and name not in targets:
+                #the scraping is slow: only run for its missing texts
+                return False
+            stage = self.by_name[name]
+            return stage.outputs_exist() and not self.is_up_to_date(name)
+        to_run = set(name for name in order if changed(name))
+        while True:
+            for name in order:
+                if any(dependency in to_run
+                       for dependency in self.dependencies[name]):
+                    to_run.add(name)
+            missing = [name for name in order if name not in to_run and
+                       not self.by_name[name].outputs_exist() and
+                       (name in targets or
+                        any(reader in to_run for reader in readers[name]))]
+            if not missing:
+                return [name for name in order if name in to_run]
+            to_run.update(missing)
+
+    def run(self, targets=None, force=False, jobs=2, verbose=True):
+        '''
+        runs the stages of plan(targets, force), at most jobs at the same
+        time; a stage starts when all the stages it depends on succeeded,
+        and if its inputs exist. The fingerprints of the stages found up to
+        date with none recorded are recorded (see adopt)
+
+        returns:
+        --------
+        dictionary: key name of the stage run, value its duration (s), or
+        the traceback (STR) if it failed, or 'not run: ' and the reason
+        '''
+        to_run = self.plan(targets, force)
+        if targets is None:
+            targets = [stage.name for stage in self.stages
+                       if stage.name != 'scrape']
+        adopted = self.adopt([name for name
+                              in self._with_dependencies(targets)
+                              if name not in to_run])
+        if verbose and adopted:
+            print 'adopted (no fingerprint recorded): ' + ', '.join(adopted)
+        pending = list(to_run)
+        running = {}
+        outcomes = {}
+        results = Queue()
+        while pending or running:
+            for name in list(pending):
+                if len(running) >= jobs:
+                    break
+                waiting = [dependency for dependency
+                           in self.dependencies[name]
+                           if dependency in to_run and
+                           not isinstance(outcomes.get(dependency), float)]
+                failed = [dependency for dependency in waiting
+                          if isinstance(outcomes.get(dependency), str)]
+                stage = self.by_name[name]
+                if failed:
+                    outcomes[name] = 'not run: %s did not run' \
+                                     %', '.join(failed)
+                elif not waiting:
+                    missing = [path for path in stage.inputs
+                               if not os.path.exists(path)]
+                    if missing:
+                        outcomes[name] = 'not run: missing inputs ' + \
+                                         ', '.join(missing)
+                if name in outcomes:
+                    pending.remove(name)
+                    if verbose:
+                        print '%s %s' %(name, outcomes[name])
+                    continue
+                if waiting:
+                    continue
+                #the fingerprint of the inputs it is run with
+                fingerprint = stage.fingerprint()
+                process = Process(target=_run_stage, args=(stage, results))
+                process.start()
+                running[name] = (process, fingerprint)
+                pending.remove(name)
+                if verbose:
+                    print 'started: ' + name
+            if not running:
+                continue
+            name, error, elapsed = results.get()
+            process, fingerprint = running.pop(name)
+            process.join()
+            if error is None:
+                outcomes[name] = elapsed
+                self.state[name] = fingerprint
+                self._save_state()
+                if verbose:
+                    print 'done: %s (%.1f s)' %(name, elapsed)
+            else:
+                outcomes[name] = error
+                if verbose:
+                    print 'failed: ' + name
+                    print error
+        return outcomes
+
+def _option(name, default=None):
+    #options given as name=value in the command line
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + '='):
+            return arg.split('=', 1)[1]
+    return default
+
+if __name__ == '__main__':
+    seed = _option('seed')
+    runner = Runner(default_stages(k=int(_option('k', 3)),
+                                   K=int(_option('K', 10)),
+                                   smoothing_method=_option('smoothing',
+                                                            'lowess'),
+                                   times_run=int(_option('runs', 10)),
+                                   seed=int(seed) if seed else None))
+    commands = ('dry', 'force', 'adopt')
+    targets = [arg for arg in sys.argv[1:]
+               if '=' not in arg and arg not in commands] or None
+    force = 'force' in sys.argv
+    if 'adopt' in sys.argv:
+        adopted = runner.adopt(targets, overwrite=True)
+        print 'adopted: ' + (', '.join(adopted) or 'none (no outputs found)')
+    elif 'dry' in sys.argv:
+        to_run = runner.plan(targets, force)
+        for stage in runner.stages:
+            if stage.name in to_run:
+                status = 'run'
+            elif not stage.outputs_exist():
+                status = 'outputs missing, not needed'
+            elif stage.name not in runner.state:
+                status = 'up to date (no fingerprint recorded yet)'
+            elif runner.is_up_to_date(stage.name):
+                status = 'up to date'
+            else:
+                status = 'not asked'
+            print '%-15s %s' %(stage.name, status)
+    else:
+        outcomes = runner.run(targets, force, jobs=int(_option('jobs', 2)))
+        if not outcomes:
+            print 'everything is up to date'
+        failed = [name for name, outcome in outcomes.items()
+                  if isinstance(outcome, str) and
+                  not outcome.startswith('not run: ')]
+        not_run = [name for name, outcome in outcomes.items()
+                   if isinstance(outcome, str) and
+                   outcome.startswith('not run: ')]
+        if failed:
+            print 'failed: ' + ', '.join(failed)
+        for name in not_run:
+            print '%s %s' %(name, outcomes[name])
+        if failed or not_run:
+            sys.exit(1)
@@ -0,0 +1,333 @@
+'''
+local HTTP service answering the questions of the notebooks in JSON, without
+loading the distances and the titles again for each question
+
+the data is loaded once when the service starts:
+- the distance matrix '../data/distances.npy', memory-mapped (see
+  medoids.load_distances), and the index of the closest movies
+  '../data/knn_index.npz' if it was built (see knn_index.py)
+- the titles (plotline_utilities.make_title_dictionary)
+- the clusters: the medoids of '../data/clusters.pkl' if they were saved
+  (see medoids.py, 3_stability), of '../data/cluster_model.pkl' otherwise
+  (see cluster_assignment.py); every movie goes to its closest medoid, the
+  stable sets of clusters.pkl tell which movies are always clustered
+  together
+- the smoothed plotlines are kept in a PlotLineCache (see load_plotline.py)
+
+the requests are handled by a fixed pool of threads
+
+Endpoints:
+----------
+/closest?title=Pulp Fiction&n=10   the n closest movies and their distances
+/cluster?title=Pulp Fiction        the medoid and the movies of its cluster,
+                                   and whether the movie is in its stable set
+/plotline?title=Pulp Fiction       the smoothed emotions of the movie
+POST /script?n=10&budget=500      the closest movies and the cluster of the
+                                   script sent as body of the request (see
+                                   script_query.py), with a time budget (ms)
+/stats                             number of requests and latencies (ms, p50
+                                   and p99) of each endpoint
+a missing title or an invalid n or budget is answered with the code 400, an
+unknown movie with 404
+
+Usage:
+------
+To start the service on http://localhost:8000 with 8 threads, type in a
+terminal
+$ python plotline_service.py port=8000 threads=8
+'''
+
+import BaseHTTPServer
+import json
+import os
+import sys
+import threading
+import time
+import cPickle as pickle
+from collections import deque
+from Queue import Queue
+from urlparse import urlparse, parse_qs
+
+import numpy as np
+
+import config
+from knn_index import build_knn_index, load_knn_index
+from load_plotline import PlotLineCache
+from medoids import assign_points_to_clusters, load_distances
+from plotline_utilities import make_title_dictionary
+
+class BadRequest(ValueError):
+    '''
+    missing or invalid parameter of a request (answered with the code 400)
+    '''
+
+def _title_option(options):
+    if 'title' not in options:
+        raise BadRequest('missing parameter title')
+    return options['title']
+
+def _number_option(options, name, default, kind=int):
+    #positive number given as name=value in the query
+    try:
+        value = kind(options.get(name, default))
+    except ValueError:
+        raise BadRequest('%s must be a number (%s)' %(name, kind.__name__))
+    if value <= 0:
+        raise BadRequest('%s must be positive' %name)
+    return value
+
+class LatencyCounter(object):
+    '''
+    latencies of the last max_samples requests of each endpoint
+    '''
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self._latencies = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, latency):
+        with self._lock:
+            if endpoint not in self._latencies:
+                self._latencies[endpoint] = deque(maxlen=self.max_samples)
+                self._counts[endpoint] = 0
+            self._latencies[endpoint].append(latency)
+            self._counts[endpoint] += 1
+
+    def summary(self):
+        '''
+        returns:
+        --------
+        dictionary: key endpoint, value dictionary with the number of
+        requests and the p50/p99 latencies (ms)
+        '''
+        with self._lock:
+            latencies = dict((endpoint, np.array(values))
+                             for endpoint, values in self._latencies.items())
+            counts = dict(self._counts)
+        return dict((endpoint, {'requests': counts[endpoint],
+                                'p50 (ms)': np.percentile(values, 50) * 1000.,
+                                'p99 (ms)': np.percentile(values, 99) * 1000.})
+                    for endpoint, values in latencies.items())
+
+class PlotlineData(object):
+    '''
+    the data the service answers from, loaded once
+    '''
+    def __init__(self, K=50, cache_size=64):
+        '''
+        parameters:
+        -----------
+        K: number of neighbours kept per movie if the index of the closest
+           movies was not saved (built from the distance matrix instead)
+        cache_size: number of smoothed plotlines kept in memory
+        '''
+        self.movies, self.distances = load_distances(mmap_mode='r')
+        titles = make_title_dictionary()
+        if isinstance(titles, str):
+            #no csv of titles: the filenames are used instead
+            self.filename_to_title, self.title_to_filename = {}, {}
+        else:
+            self.filename_to_title, self.title_to_filename = titles
+        if os.path.exists(config.KNN_INDEX_NPZ):
+            self.index = load_knn_index()
+        else:
+            self.index = build_knn_index(
+                self.movies, self.distances, K=K,
+                titles=[self.filename_to_title.get(movie, movie)
+                        for movie in self.movies])
+        self.stable_sets = {}
+        if os.path.exists(config.CLUSTERS_PKL):
+            with open(config.CLUSTERS_PKL, 'r') as f:
+                self.stable_sets = pickle.load(f)
+        self.clusters = self._assign_clusters()
+        self.movie_to_medoid = dict((movie, medoid)
+                                    for medoid, members
+                                    in self.clusters.items()
+                                    for movie in members)
+        self.plotline_cache = PlotLineCache(max_size=cache_size, n_prefetch=0)
+        self._script_query = None
+        self._script_lock = threading.Lock()
+
+    def _assign_clusters(self):
+        '''
+        returns:
+        --------
+        dictionary: key medoid (filename), value list of the movies closest
+        to this medoid (all the movies, not only the stable sets)
+        '''
+        medoid_names = list(self.stable_sets)
+        if not medoid_names and os.path.exists(config.CLUSTER_MODEL_PKL):
+            from cluster_assignment import load_cluster_model
+            medoid_names = load_cluster_model().medoid_names
+        positions = dict((movie, index)
+                         for index, movie in enumerate(self.movies))
+        medoids = np.array([positions[medoid] for medoid in medoid_names
+                            if medoid in positions], dtype=np.int64)
+        if not len(medoids):
+            return {}
+        assignment = assign_points_to_clusters(medoids, self.distances)
+        movies = np.array(self.movies)
+        return dict((self.movies[medoid],
+                     list(movies[assignment == medoid]))
+                    for medoid in medoids)
+
+    def filename(self, title):
+        #accepts a title or a filename
+        return self.title_to_filename.get(title, title)
+
+    def title(self, filename):
+        return self.filename_to_title.get(filename, filename)
+
+    def closest(self, title, n=10):
+        n = min(n, self.index.K)
+        return [{'title': neighbour_title, 'filename': neighbour,
+                 'distance': distance}
+                for neighbour_title, neighbour, distance
+                in self.index.query(self.filename(title), n)]
+
+    def cluster(self, title):
+        filename = self.filename(title)
+        medoid = self.movie_to_medoid[filename]
+        return {'medoid': self.title(medoid),
+                'movies': sorted(self.title(movie)
+                                 for movie in self.clusters[medoid]),
+                'stable': filename in self.stable_sets.get(medoid, ())}
+
+    def plotline(self, title):
+        plotline = self.plotline_cache.get(self.filename(title))
+        return dict((emotion, list(y)) for (emotion, index), (x, y)
+                    in plotline.emotion_dictionary_smooth.items())
+
+    def script(self, text, n=10, budget_ms=None):
+        with self._script_lock:
+            if self._script_query is None:
+                #loading the lexicon and smoothing the corpus takes a while,
+                #only done if scripts are sent
+                from script_query import ScriptQuery
+                self._script_query = ScriptQuery()
+        answer = self._script_query.query(text, n=n, budget_ms=budget_ms)
+        answer['closest'] = [{'title': self.title(filename),
+                              'filename': filename, 'distance': distance}
+                             for filename, distance in answer['closest']]
+        return answer
+
+class PlotlineHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    answers GET requests on the endpoints of the module docstring
+    '''
+    def do_GET(self):
+        start = time.time()
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/')
+        options = dict((key, values[0])
+                       for key, values in parse_qs(url.query).items())
+        data = self.server.data
+        try:
+            if endpoint == 'closest':
+                answer = data.closest(_title_option(options),
+                                      _number_option(options, 'n', 10))
+            elif endpoint == 'cluster':
+                answer = data.cluster(_title_option(options))
+            elif endpoint == 'plotline':
+                answer = data.plotline(_title_option(options))
+            elif endpoint == 'stats':
+                answer = self.server.latencies.summary()
+            else:
+                self._reply(404, {'error': 'unknown endpoint %s' %endpoint})
+                return
+        except BadRequest as e:
+            self._reply(400, {'error': str(e)})
+            return
+        except KeyError as e:
+            self._reply(404, {'error': 'not found: %s' %e})
+            return
+        except (IOError, ValueError) as e:
+            self._reply(500, {'error': str(e)})
+            return
+        self._reply(200, answer)
+        self.server.latencies.add(endpoint, time.time() - start)
+
+    def do_POST(self):
+        start = time.time()
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/')
+        options = dict((key, values[0])
+                       for key, values in parse_qs(url.query).items())
+        text = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if endpoint != 'script':
+            self._reply(404, {'error': 'unknown endpoint %s' %endpoint})
+            return
+        try:
+            budget_ms = _number_option(options, 'budget', None, float) \
+                        if 'budget' in options else None
+            answer = self.server.data.script(text,
+                                             _number_option(options, 'n', 10),
+                                             budget_ms)
+        except BadRequest as e:
+            self._reply(400, {'error': str(e)})
+            return
+        except (IOError, ValueError) as e:
+            self._reply(500, {'error': str(e)})
+            return
+        self._reply(200, answer)
+        self.server.latencies.add(endpoint, time.time() - start)
+
+    def _reply(self, code, answer):
+        body = json.dumps(answer)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        #no line printed per request
+        pass
+
+class ThreadPoolHTTPServer(BaseHTTPServer.HTTPServer):
+    '''
+    HTTP server handing the requests to a fixed number of threads (instead of
+    one new thread per request, as SocketServer.ThreadingMixIn)
+    '''
+    def __init__(self, server_address, data, n_threads=8):
+        BaseHTTPServer.HTTPServer.__init__(self, server_address,
+                                           PlotlineHandler)
+        self.data = data
+        self.latencies = LatencyCounter()
+        self._requests = Queue()
+        for _ in xrange(n_threads):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        while True:
+            request, client_address = self._requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address))
+
+def _option(name, default=None):
+    #options given as name=value in the command line
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + '='):
+            return int(arg.split('=')[1])
+    return default
+
+if __name__ == '__main__':
+    port = _option('port', 8000)
+    print 'loading the data...'
+    server = ThreadPoolHTTPServer(('localhost', port), PlotlineData(),
+                                  n_threads=_option('threads', 8))
+    print 'serving on http://localhost:%d (Ctrl-C to stop)' %port
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
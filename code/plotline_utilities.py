@@ -1,56 +1,159 @@
 '''
 list of utilities functions defined in this code:
 
-- progression_bar: use to print a progression bar in the terminal
-- smoothing: smoothes out plots (Lowess)
+- smoothing: smoothes out plots (Lowess by default, or one of the O(n)
+             smoothers: gaussian, savgol, ema, moving_average)
 - make_title_dictionary: creates 2 dictionaries that allow to go from the
                         filename to the title of the movie
 - prepare_dictionary: makes a dictionary with the smoothed arrays
 '''
 
-import sys
 import os
-import statsmodels.api as sm
 import numpy as np
 
-def progression_bar(i, Ntot, Nbars=60, char='-'):
-    '''
-    Shows a progression bar with Nbars
-    parameters:
-    -----------
-    i: index of the files
-    Ntot: total number of files
-    Nbars: how many bars to fill
-    char: character to show as progression
-    '''
-    nbars = int( (i+1)*1./Ntot * Nbars )
-    sys.stdout.write('\r[' + nbars*char)
-    sys.stdout.write((Nbars-nbars)*' '+']')
-    sys.stdout.write('%d/%d'%(i, Ntot))
-    sys.stdout.flush()
+from instrumentation import timer
+#statsmodels is only imported when Lowess is used (see smoothing), importing
+#statsmodels.api at load time costs more than the rest of the pipeline needs
+
+SMOOTHING_METHODS = ('lowess', 'gaussian', 'savgol', 'ema', 'moving_average')
 
-def smoothing(y_vals, frac=0.05):
+def smoothing(y_vals, frac=0.05, method='lowess'):
     '''
     parameters:
     -----------
     y_vals: list of sentiment scores
     frac: parameter of smoothing
+          (fraction of the points used for each local estimate; for the O(n)
+          smoothers it sets the width of the window)
+    method: STR, one of SMOOTHING_METHODS
+            'lowess' (default) is the reference, superlinear in len(y_vals)
+            'gaussian' gaussian kernel, convolution done with the FFT
+            'savgol' Savitzky-Golay filter (local quadratic fit)
+            'ema' exponential moving average, run forward and backward
+            'moving_average' centered moving average computed with cumsum
 
     returns:
     --------
     x_smooth_vals
     y_smooth_vals
     '''
-    x_vals = np.arange(len(y_vals))
-    lowess = sm.nonparametric.lowess(y_vals, x_vals, frac = frac)
-    y_smooth_vals = lowess[:, 1]
-    x_smooth_vals = lowess[:, 0]
+    with timer('smooth'):
+        return _smoothing(y_vals, frac, method)
+
+def _smoothing(y_vals, frac, method):
+    if method == 'lowess':
+        from statsmodels.nonparametric.smoothers_lowess import lowess as\
+                                                                sm_lowess
+        x_vals = np.arange(len(y_vals))
+        lowess = sm_lowess(y_vals, x_vals, frac = frac)
+        y_smooth_vals = lowess[:, 1]
+        x_smooth_vals = lowess[:, 0]
+        return x_smooth_vals, y_smooth_vals
+
+    y_vals = np.asarray(y_vals, dtype=float)
+    x_smooth_vals = np.arange(len(y_vals), dtype=float)
+    window = _window_length(len(y_vals), frac)
+    if method == 'gaussian':
+        y_smooth_vals = _gaussian_smoothing(y_vals, window)
+    elif method == 'savgol':
+        y_smooth_vals = _savgol_smoothing(y_vals, window)
+    elif method == 'ema':
+        y_smooth_vals = _ema_smoothing(y_vals, window)
+    elif method == 'moving_average':
+        y_smooth_vals = _moving_average_smoothing(y_vals, window)
+    else:
+        raise ValueError('unknown smoothing method %s, choose among %s'
+                         %(method, ', '.join(SMOOTHING_METHODS)))
     return x_smooth_vals, y_smooth_vals
 
+def _window_length(n, frac):
+    '''
+    number of points covered by the smoothing window (same meaning as the
+    frac of Lowess), forced to be odd so the window is centered
+    '''
+    window = max(int(round(frac * n)), 1)
+    if window % 2 == 0:
+        window += 1
+    return window
+
+def _reflect_pad(y_vals, half_width):
+    #mirror the edges, so that the start and the end of the script are not
+    #pulled towards 0
+    half_width = min(half_width, len(y_vals) - 1)
+    if half_width <= 0:
+        return y_vals, 0
+    return np.pad(y_vals, half_width, mode='reflect'), half_width
+
+def _gaussian_smoothing(y_vals, window):
+    '''
+    the Lowess tricube kernel spanning `window` points has a standard
+    deviation of about window/5, the gaussian kernel uses the same width
+    '''
+    sigma = max(window / 5., 0.5)
+    half_width = int(np.ceil(3 * sigma))
+    padded, pad = _reflect_pad(y_vals, half_width)
+    kernel_x = np.arange(-half_width, half_width + 1)
+    kernel = np.exp(-0.5 * (kernel_x / sigma)**2)
+    kernel /= kernel.sum()
+    #convolution through the FFT: the cost does not depend on the kernel size
+    n_fft = len(padded) + len(kernel) - 1
+    convolved = np.fft.irfft(np.fft.rfft(padded, n_fft) *
+                             np.fft.rfft(kernel, n_fft), n_fft)
+    start = half_width + pad
+    return convolved[start:start + len(y_vals)]
+
+def _savgol_smoothing(y_vals, window, polyorder=2):
+    '''
+    least square fit of a polynomial of order polyorder on each window,
+    expressed as a fixed convolution kernel
+    '''
+    window = max(window, polyorder + 1 + (polyorder % 2))
+    half_width = window // 2
+    padded, pad = _reflect_pad(y_vals, half_width)
+    if pad < half_width:
+        #script too short for the window: fall back on a global fit
+        coefficients = np.polyfit(np.arange(len(y_vals)), y_vals,
+                                  min(polyorder, len(y_vals) - 1))
+        return np.polyval(coefficients, np.arange(len(y_vals)))
+    vander = np.vander(np.arange(-half_width, half_width + 1),
+                       polyorder + 1, increasing=True)
+    kernel = np.linalg.pinv(vander)[0]
+    return np.convolve(padded, kernel[::-1], mode='valid')
+
+def _ema_smoothing(y_vals, window):
+    '''
+    exponential moving average, applied forward then backward so that the
+    smoothed plot is not shifted towards the end of the script
+    (each pass is the recursion value += alpha * (y - value), run by
+    scipy.signal.lfilter, starting from the first value of the pass)
+    '''
+    from scipy.signal import lfilter
+    alpha = 2. / (window + 1)
+    y_vals = np.asarray(y_vals, dtype=np.float64)
+    forward, _ = lfilter([alpha], [1., alpha - 1.], y_vals,
+                         zi=[(1. - alpha) * y_vals[0]])
+    backward, _ = lfilter([alpha], [1., alpha - 1.], forward[::-1],
+                          zi=[(1. - alpha) * forward[-1]])
+    return backward[::-1]
+
+def _moving_average_smoothing(y_vals, window):
+    '''
+    centered moving average, each point costs two lookups in the cumulative
+    sum; near the edges the average is taken on the points available
+    '''
+    half_width = window // 2
+    cumulative = np.concatenate(([0.], np.cumsum(y_vals)))
+    indices = np.arange(len(y_vals))
+    low = np.maximum(indices - half_width, 0)
+    high = np.minimum(indices + half_width + 1, len(y_vals))
+    return (cumulative[high] - cumulative[low]) / (high - low)
+
 def make_title_dictionary():
     '''
-    this function relies on the creation of the 'successful_files.csv' by the
-    scraping script.
+    this function relies on the creation of the 'scraping.db' (see
+    scraping_store.py) or of the 'successful_files.csv' by the scraping
+    script. The file is read once (see catalog.load_catalog): the
+    dictionaries are shared between the calls, and should not be modified.
 
     returns:
     --------
@@ -58,23 +161,11 @@ def make_title_dictionary():
        - with the filename as key (without extension) and title as value
        - with title as value and filename as key
     '''
-    filename = '../data/scraping/successful_files.csv'
-    if not os.path.isfile(filename):
-        return 'Please make sure the csv %s exits' %(filename)
-    with open(filename,'r') as f:
-        text = f.read()
-    lines = text.split('\n')
-    filename_to_title = {}
-    title_to_filename = {}
-    for line in lines:
-        if len(line)>=2:
-            info = line.split(';')
-            title = info[0]
-            filename = info[3]
-            filename_to_title[filename] = title
-            title_to_filename[title] = filename
-
-    return filename_to_title, title_to_filename
+    from catalog import load_catalog, CSV_PATH
+    catalog = load_catalog()
+    if catalog is None:
+        return 'Please make sure the csv %s exits' %(CSV_PATH)
+    return catalog.filename_to_title, catalog.title_to_filename
 
 def prepare_dictionary(filename):
     '''
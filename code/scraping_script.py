@@ -7,12 +7,31 @@ Usage:
 ------
 To execute this script, type in a terminal
 $ python scraping_script.py
+the movies are handled by 8 threads by default, to change it (and the
+website, for instance a local copy of the pages)
+$ python scraping_script.py workers=4 base_url=http://localhost:8000
+(browsers=2 sets the maximum number of selenium browsers)
+the pages are kept in ../data/scraping/cache (see http_cache.py), and only
+checked again after ttl seconds (one week by default); to parse the pages
+again without network, or to disable the cache
+$ python scraping_script.py offline=yes
+$ python scraping_script.py cache=off
+the progress is saved in ../data/scraping/scraping.db (see scraping_store.py):
+an interrupted scraping continues where it stopped when the script is run
+again (retry=yes to also try again the movies logged as errors)
 
 Challenges --> choices:
 -----------------------
 some scripts are in html, some in pdf (<50) --> pdfs are ignored
 some html scripts have javascript --> the package requests is not enough,
-and the package selenium is used instead
+and the package selenium is used instead, but only for the pages whose
+static html does not contain the script (a small pool of headless browsers
+is started when first needed, the number of such pages is printed)
+scraping one movie after the other is slow --> the movies are handled by a
+pool of threads (each with a keep-alive requests.Session), with a minimum
+interval between two requests to the same website, and retries with an
+increasing delay when a request fails; the files are still written in the
+order of the movies
 
 Files created:
 --------------
@@ -25,6 +44,10 @@ in the ../data/scraping folder:
     * movies_pdf_script.csv: a CSV file with one row for each movie which were
       not available in html (usually as pdf) with simply the title of the movie
     * scraping_error.csv: a list of movies that could not be scraped
+    * scraping.db: status of each movie, from which the CSV files are
+      written
+in the ../data/scraping/cache folder:
+    the pages downloaded (see http_cache.py)
 '''
 
 import requests
@@ -32,15 +55,126 @@ import re
 import os
 import sys
 import codecs
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+from urlparse import urlparse
 from bs4 import BeautifulSoup
-from plotline_utilities import progression_bar
-from selenium import webdriver
+import config
+from instrumentation import Progress, count, save_metrics, timer
+from http_cache import ResponseCache, DEFAULT_TTL
+from scraping_store import ScrapingStore
 
-def get_all_movies():
+BASE_URL = 'http://www.imsdb.com'
+
+class RateLimiter(object):
+    '''
+    makes sure two requests to the same website are at least min_interval
+    seconds apart, whichever thread sends them
+    '''
+    def __init__(self, min_interval=0.2):
+        self.min_interval = min_interval
+        self._next_time = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_time.get(host, now))
+            self._next_time[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class Fetcher(object):
+    '''
+    downloads pages with one keep-alive requests.Session per thread (the
+    connections to the website are reused from one page to the next)
+
+    the pages can be kept on disk (see http_cache.py): a page is then only
+    downloaded again if it changed
+
+    usage:
+    ------
+    fetcher = Fetcher(cache=ResponseCache())
+    html = fetcher.get(u'http://www.imsdb.com/all%20scripts/')
+    '''
+    def __init__(self, min_interval=0.2, n_retries=3, backoff=1.,
+                 timeout=30, cache=None):
+        '''
+        parameters:
+        -----------
+        min_interval: minimum time (s) between two requests to the same host
+        n_retries: number of new attempts after a failed request (connection
+                   error, time out, error 429 or 5xx)
+        backoff: delay (s) before the first new attempt, doubled each time
+        timeout: time (s) after which a request is considered failed
+        cache: ResponseCache (None to always download the pages)
+        '''
+        self.cache = cache
+        self.rate_limiter = RateLimiter(min_interval)
+        self.n_retries = n_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get(self, url):
+        '''
+        returns:
+        --------
+        text of the page at url
+        raises requests.RequestException if all the attempts failed (or if
+        the page is not in the cache, in offline mode)
+        '''
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.lookup(url)
+            if entry is not None and self.cache.is_fresh(entry):
+                return self.cache.text(entry)
+            if self.cache.offline:
+                raise requests.RequestException('not in the cache: ' + url)
+            headers = self.cache.conditional_headers(entry)
+        else:
+            headers = {}
+        host = urlparse(url).netloc
+        delay = self.backoff
+        for attempt in xrange(self.n_retries + 1):
+            self.rate_limiter.wait(host)
+            try:
+                with timer('download'):
+                    response = self._session().get(url, timeout=self.timeout,
+                                                   headers=headers)
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.raise_for_status()
+                if self.cache is None:
+                    return response.text
+                if response.status_code == 304 and entry is not None:
+                    return self.cache.touch(url, entry)
+                if response.status_code == 200:
+                    self.cache.store(url, response.text, response.headers)
+                return response.text
+            except requests.RequestException:
+                if attempt == self.n_retries:
+                    raise
+            count('download retries')
+            time.sleep(delay)
+            delay *= 2
+
+def get_all_movies(fetcher=None, base_url=BASE_URL):
     '''
     Scrape 'http://www.imsdb.com/all%20scripts/' to extract the list of
     available scripts on IMSDb and the URL at which to access them.
 
+    Parameters:
+    -----------
+    fetcher: Fetcher used to download the page (a new one if None)
+    base_url: address of the website
+
     Returns:
     --------
     movie list: list of tuples
@@ -58,10 +192,11 @@ def get_all_movies():
     ex2:
     (u'Abyss, The', u'/Movie Scripts/Abyss, The Script.html', u'Abyss')
     '''
+    if fetcher is None:
+        fetcher = Fetcher()
     # Parse the page http://www.imsdb.com/all%20scripts/ with beautiful soup
-    link_all_scripts = 'http://www.imsdb.com/all%20scripts/'
-    response_all_scripts = requests.get(link_all_scripts)
-    soup = BeautifulSoup(response_all_scripts.text, 'html.parser')
+    link_all_scripts = base_url + '/all%20scripts/'
+    soup = BeautifulSoup(fetcher.get(link_all_scripts), 'html.parser')
 
     # This webpage is constructed with tables, the 3rd one is the one we want
     find_tables = soup.findAll('td', valign='top')
@@ -97,26 +232,14 @@ def check_movie_info(movies):
             return 'One of the movie link does not start with /Movie Scripts/.'
     return 'All movie URLs have a correct format.'
 
-def handle_movie (movie, browser):
+def parse_movie_page(html):
     '''
-    Download the script corresponding to `movie`, using selenium
-
-    Parameters
-    ----------
-    movie: tuple
-        a tuple from the `movies` list created by `get_all_movies`
-            (movie title, link to movie page, movie_title)
-    browser: object
-        the browser used by selenium to get complete html page
+    Returns
+    -------
+    genre list, writer list, link to the script ('' if none) found in the
+    page with all the movie information
     '''
-    # Unpack tuple
-    title, link_to_movie_page, movie_title = movie
-
-    # Interrogate the page with all the movie information (ratings, writer,
-    # genre, link to script)
-    full_html_link = u'http://www.imsdb.com' + link_to_movie_page
-    response_script = requests.get(full_html_link)
-    soup = BeautifulSoup(response_script.text, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Get all relevant information (genre, writer, script) from page
     list_links = soup.findAll('table', "script-details")[0].findAll('a')
@@ -131,75 +254,373 @@ def handle_movie (movie, browser):
             genre.append(link.get_text())
         if href[0:9]== "/scripts/":
             script = href
+    return genre, writer, script
 
-    # If the link to the script points to a PDF, skip this movie, but log
-    # the information in `movies_pdf_script.csv`
+def parse_script_page(html):
+    '''
+    Returns
+    -------
+    text of the script, None if the page does not have the expected
+    structure
+    '''
+    soup = BeautifulSoup(html, 'html.parser')
+    cells = soup.findAll('td', "scrtext")
+    if len(cells) != 1:
+        return None
+    return cells[0].get_text()
+
+def scrape_movie(movie, browser, fetcher, base_url=BASE_URL, stats=None):
+    '''
+    Download the pages of `movie` (nothing is written, see write_result)
+
+    Parameters
+    ----------
+    movie: tuple
+        a tuple from the `movies` list created by `get_all_movies`
+            (movie title, link to movie page, movie_title)
+    browser: BrowserPool used when the static html of the script page does
+        not contain the script (None to never use selenium)
+    fetcher: Fetcher used for the pages
+    base_url: address of the website
+    stats: ScrapingStats, counts the pages which needed a browser
+
+    Returns
+    -------
+    ('pdf', None, None, None), ('error', None, None, None) or
+    ('success', genre, writer, text)
+    '''
+    # Unpack tuple
+    title, link_to_movie_page, movie_title = movie
+
+    # Interrogate the page with all the movie information (ratings, writer,
+    # genre, link to script)
+    page = fetcher.get(base_url + link_to_movie_page)
+    with timer('parse'):
+        genre, writer, script = parse_movie_page(page)
+
+    # If the link to the script points to a PDF, skip this movie
     if script == '' or script[-5:] != '.html':
-        path_to_directory = '../data/scraping/'
-        pdf_logging_filename = path_to_directory + 'movies_pdf_script.csv'
-        with open(pdf_logging_filename, 'a') as f:
+        return ('pdf', None, None, None)
+
+    # Parse the webpage which contains the script text: most pages have it
+    # in their static html, the others need javascript (slow path)
+    full_script_url = base_url + script
+    page = fetcher.get(full_script_url)
+    with timer('parse'):
+        text = parse_script_page(page)
+    slow_path = text is None and browser is not None
+    if slow_path:
+        with timer('browser'):
+            page = browser.page_source_of(full_script_url)
+        with timer('parse'):
+            text = parse_script_page(page)
+    if stats is not None:
+        stats.add(slow_path, text is not None)
+    # unexpected structure of the page
+    if text is None:
+        return ('error', None, None, None)
+    return ('success', genre, writer, text)
+
+def write_result(movie, result, store=None):
+    '''
+    writes the files for one movie (see the module docstring)
+
+    Parameters
+    ----------
+    movie: tuple (movie title, link to movie page, movie_title)
+    result: tuple returned by scrape_movie
+    store: ScrapingStore in which the movie is recorded (the CSV files are
+        then written from it, see ScrapingStore.export_csv), None to append
+        the movie to the CSV files directly
+    '''
+    title, link_to_movie_page, movie_title = movie
+    status, genre, writer, text = result
+
+    filename = None
+    if status == 'success':
+        # Write the script text to a file
+        filename = os.path.join(config.TEXTS_DIR, movie_title + '.txt')
+        with codecs.open(filename, "w",
+                encoding='ascii', errors='ignore') as f:
+            f.write(text)
+
+    if store is not None:
+        store.record(movie, result, filename)
+
+    # If the link to the script points to a PDF, log the information in
+    # `movies_pdf_script.csv`
+    elif status == 'pdf':
+        with open(config.PDF_CSV, 'a') as f:
             new_row = title + '\n'
             f.write(new_row)
 
-    # If the link to the script points to an html page, write the corresponding
-    # text to a file and include the movie in a csv file, with meta-information
+    # If the scraping does not go as planned (unexpected structure, or the
+    # page could not be downloaded), log the file name in an error file
+    elif status == 'error':
+        with open(config.ERROR_CSV, 'a') as error_file:
+            new_row = title + '\n'
+            error_file.write( new_row )
+
+    # Normal scraping: include the movie in a csv file, with
+    # meta-information
     else:
+        new_row = title + ';' + str(genre) + ';' + str(writer) + ';' \
+                + movie_title + ';' + filename + '\n'
+        with open(config.SUCCESSFUL_CSV, 'a') as f:
+            f.write(new_row)
 
-        # Parse the webpage which contains the script text
-        full_script_url =  u'http://www.imsdb.com' + script
-        browser.get(full_script_url)
-        page_text = browser.page_source
-        soup = BeautifulSoup(page_text, 'html.parser')
-
-        # If the scraping does not go as planned (unexpected structure),
-        # log the file name in an error file
-        if len(soup.findAll('td', "scrtext"))!=1:
-            error_file_name = '../data/scraping/scraping_error.csv'
-            with open(error_file_name, 'a') as error_file:
-                new_row = title + '\n'
-                error_file.write( new_row )
-
-        # Normal scraping:
-        else:
-            # Write the script text to a file
-            path_to_directory = '../data/scraping/texts/'
-            filename = path_to_directory + movie_title + '.txt'
-            text = soup.findAll('td', "scrtext")[0].get_text()
-            with codecs.open(filename, "w",
-                    encoding='ascii', errors='ignore') as f:
-                f.write(text)
-
-            # Add the meta-information to a CSV file
-            path_to_directory = '../data/scraping/'
-            success_filename = path_to_directory + 'successful_files.csv'
-            new_row = title + ';' + str(genre) + ';' + str(writer) + ';' \
-                    + movie_title + ';' + filename + '\n'
-            with open(success_filename, 'a') as f:
-                f.write(new_row)
+def headless_firefox():
+    '''
+    Returns
+    -------
+    selenium Firefox browser, without window
+    '''
+    from selenium import webdriver
+    options = webdriver.FirefoxOptions()
+    options.headless = True
+    return webdriver.Firefox(options=options)
 
-if __name__ == '__main__':
+class BrowserPool(object):
+    '''
+    selenium browsers shared between threads, each browser loading one page
+    at a time; the browsers are started when first needed (most pages do not
+    need one) and reused afterwards
+
+    usage:
+    ------
+    browser = BrowserPool(n_browsers=2)
+    html = browser.page_source_of(url)
+    browser.quit()
+    '''
+    def __init__(self, n_browsers=2, make_browser=headless_firefox,
+                 browsers=None):
+        '''
+        parameters:
+        -----------
+        n_browsers: maximum number of browsers
+        make_browser: function starting a new browser
+        browsers: list of browsers already started
+        '''
+        self.make_browser = make_browser
+        self._idle = Queue()
+        browsers = browsers or []
+        for browser in browsers:
+            self._idle.put(browser)
+        self._browsers = list(browsers)
+        self._n_free_slots = max(n_browsers - len(browsers), 0)
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            start_new = self._idle.empty() and self._n_free_slots > 0
+            if start_new:
+                self._n_free_slots -= 1
+        if start_new:
+            try:
+                browser = self.make_browser()
+            except Exception:
+                #the slot stays free for the next page
+                with self._lock:
+                    self._n_free_slots += 1
+                raise
+            with self._lock:
+                self._browsers.append(browser)
+            return browser
+        return self._idle.get()
+
+    def page_source_of(self, url):
+        browser = self._acquire()
+        try:
+            browser.get(url)
+            return browser.page_source
+        finally:
+            self._idle.put(browser)
+
+    def quit(self):
+        for browser in self._browsers:
+            browser.quit()
+
+class ScrapingStats(object):
+    '''
+    number of script pages read from their static html (fast path) and with
+    a browser (slow path)
+    '''
+    def __init__(self):
+        self.fast = 0
+        self.slow = 0
+        self.slow_failed = 0
+        self._lock = threading.Lock()
+
+    def add(self, slow_path, success):
+        with self._lock:
+            if slow_path:
+                self.slow += 1
+                if not success:
+                    self.slow_failed += 1
+            else:
+                self.fast += 1
+
+    def summary(self):
+        return {'static html': self.fast, 'browser': self.slow,
+                'browser failed': self.slow_failed}
+
+def browser_errors():
+    '''
+    Returns
+    -------
+    tuple of the exceptions raised by the browsers (selenium
+    WebDriverException, empty if selenium is not installed)
+    '''
+    try:
+        from selenium.common.exceptions import WebDriverException
+    except ImportError:
+        return ()
+    return (WebDriverException,)
+
+def handle_movie (movie, browser, fetcher=None, base_url=BASE_URL):
+    '''
+    Download the script corresponding to `movie`, using selenium, and write
+    the files (see the module docstring)
 
+    Parameters
+    ----------
+    movie: tuple
+        a tuple from the `movies` list created by `get_all_movies`
+            (movie title, link to movie page, movie_title)
+    browser: object
+        the browser used by selenium to get complete html page, if the
+        static html of the page does not contain the script
+    '''
+    if fetcher is None:
+        fetcher = Fetcher()
+    write_result(movie, scrape_movie(movie, BrowserPool(n_browsers=1,
+                                                        browsers=[browser]),
+                                     fetcher, base_url))
+
+def scrape_movies(movies, browser, n_workers=8, fetcher=None,
+                  base_url=BASE_URL, store=None, retry_errors=False):
+    '''
+    handles the movies with a pool of n_workers threads, and writes the
+    results in the order of movies (the files are the same as if the movies
+    were handled one after the other)
+
+    with a store, the movies already scraped (in a previous, possibly
+    interrupted, run) are skipped, and the CSV files are written from the
+    store at the end
+
+    Parameters
+    ----------
+    movies: list returned by get_all_movies
+    browser: BrowserPool, shared by the threads, for the pages that need
+             javascript (None to never use selenium)
+    n_workers: number of threads
+    fetcher: Fetcher (a new one if None)
+    base_url: address of the website
+    store: ScrapingStore (None to append to the CSV files)
+    retry_errors: BOOL, on True the movies logged as error are tried again
+
+    Returns
+    -------
+    ScrapingStats
+    '''
+    if fetcher is None:
+        fetcher = Fetcher()
+    stats = ScrapingStats()
+    if store is not None:
+        store.add_movies(movies)
+        movies = store.pending(movies, retry_errors=retry_errors)
+
+    errors = (requests.RequestException, IndexError) + browser_errors()
+
+    def _scrape(movie):
+        try:
+            return scrape_movie(movie, browser, fetcher, base_url, stats)
+        except errors:
+            # the pages could not be downloaded, the page of the movie
+            # does not have the expected structure, or the browser failed
+            # (to start or to load the page)
+            return ('error', None, None, None)
+
+    pool = ThreadPool(n_workers)
+    progress = Progress(len(movies), 'scraping')
+    try:
+        for i, result in enumerate(pool.imap(_scrape, movies)):
+            write_result(movies[i], result, store)
+            progress.update()
+    finally:
+        progress.close()
+        pool.terminate()
+        if store is not None:
+            store.export_csv()
+    return stats
+
+def _option(name, default=None):
+    #options given as name=value in the command line
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + '='):
+            return arg.split('=', 1)[1]
+    return default
+
+def scrape_all(base_url=BASE_URL, use_cache=True, ttl=DEFAULT_TTL,
+               offline=False, n_browsers=2, n_workers=8, retry_errors=False):
+    '''
+    scrapes all the movies of the website (the ones already done in
+    scraping.db are skipped), see the module docstring for the files
+
+    returns:
+    --------
+    ScrapingStats of the run
+    '''
     # Create data/scraping/texts files
-    if not os.path.exists('../data'):
-        os.mkdir('../data')
-        print 'making ../data folder'
-    if not os.path.exists('../data/scraping'):
-        os.mkdir('../data/scraping')
-        print 'making ../data/scraping folder'
-    if not os.path.exists('../data/scraping/texts'):
-        os.mkdir('../data/scraping/texts')
-        print 'making ../data/scraping/texts folder'
+    for path in [config.DATA_DIR, config.SCRAPING_DIR, config.TEXTS_DIR]:
+        if not os.path.exists(path):
+            os.mkdir(path)
+            print 'making %s folder' %path
+
+    cache = None
+    if use_cache:
+        cache = ResponseCache(ttl=ttl, offline=offline)
+    fetcher = Fetcher(cache=cache)
 
     # List all the available movies, and the corresponding URL links
-    movies = get_all_movies()
+    movies = get_all_movies(fetcher, base_url)
     print check_movie_info(movies)
 
     # Write all the scripts (in texts folder) and the summary of the movies
     # in .csv format (in scraping folder)
-    browser = webdriver.Firefox()
-    for i,movie in enumerate(movies):
-        handle_movie(movie, browser)
-        progression_bar(i, len(movies))
+    # the pages rendered by a browser are not cached: none offline
+    browser = None
+    if cache is None or not cache.offline:
+        browser = BrowserPool(n_browsers=n_browsers)
+    store = ScrapingStore()
+    try:
+        stats = scrape_movies(movies, browser, n_workers=n_workers,
+                              fetcher=fetcher, base_url=base_url,
+                              store=store, retry_errors=retry_errors)
+    finally:
+        if browser is not None:
+            browser.quit()
+    print 'movies per status: ' + ', '.join('%s %d' %(status, count)
+                                  for status, count
+                                  in sorted(store.counts().items()))
+    store.close()
+    print 'script pages read from the static html: %(static html)d, ' \
+          'with a browser: %(browser)d (failed: %(browser failed)d)' \
+          %stats.summary()
+    if cache is not None:
+        print 'pages from the cache: %(from cache)d, not modified: ' \
+              '%(not modified)d, downloaded: %(downloaded)d' %cache.summary()
+    return stats
+
+if __name__ == '__main__':
+    stats = scrape_all(base_url=_option('base_url', BASE_URL),
+                       use_cache=_option('cache', 'on') != 'off',
+                       ttl=float(_option('ttl', DEFAULT_TTL)),
+                       offline=_option('offline', 'no') == 'yes',
+                       n_browsers=int(_option('browsers', 2)),
+                       n_workers=int(_option('workers', 8)),
+                       retry_errors=_option('retry', 'no') == 'yes')
+    save_metrics('scraping_script', extra={'pages': stats.summary()})
 
 '''comments on the scraping results
 movies that were not scraped successfully:
@@ -0,0 +1,172 @@
+'''
+state of the scraping, in a SQLite database ('../data/scraping/scraping.db')
+
+one row per movie of IMSDb, with its status:
+    'pending' (not scraped yet), 'success', 'pdf' or 'error'
+and, for the movies scraped successfully, the genres and writers (as JSON
+lists) and the filename of the text
+
+each movie is recorded in its own transaction as soon as it is scraped: if
+the scraping is interrupted, the next run only handles the movies which are
+not done, and no movie is recorded twice
+
+the CSV files of the scraping (successful_files.csv, movies_pdf_script.csv,
+scraping_error.csv) are written from the database (export_csv), in the order
+of the movies on IMSDb
+'''
+
+import json
+import os
+import sqlite3
+import time
+import config
+
+DEFAULT_PATH = config.SCRAPING_DB
+
+class ScrapingStore(object):
+    '''
+    usage:
+    ------
+    store = ScrapingStore()
+    store.add_movies(movies)
+    for movie in store.pending(movies):
+        ...
+        store.record(movie, result)
+    store.export_csv()
+    '''
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS movies ('
+                'position INTEGER, title TEXT PRIMARY KEY, link TEXT, '
+                'movie_title TEXT, status TEXT, genres TEXT, writers TEXT, '
+                'filename TEXT, updated REAL)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS movie_title_index '
+                'ON movies (movie_title)')
+
+    def add_movies(self, movies):
+        '''
+        movies: list returned by scraping_script.get_all_movies, the movies
+                already known keep their status
+        '''
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO movies (position, title, link, '
+                'movie_title, status) VALUES (?, ?, ?, ?, ?)',
+                [(position, title, link, movie_title, 'pending')
+                 for position, (title, link, movie_title)
+                 in enumerate(movies)])
+
+    def status(self, title):
+        row = self.connection.execute(
+                'SELECT status FROM movies WHERE title = ?',
+                (title,)).fetchone()
+        return row[0] if row is not None else None
+
+    def pending(self, movies, retry_errors=False):
+        '''
+        returns:
+        --------
+        the movies (in the order of movies) which were not scraped yet
+        (nor logged as error, unless retry_errors)
+        '''
+        done = ('success', 'pdf') if retry_errors \
+               else ('success', 'pdf', 'error')
+        finished = set(title for title, in self.connection.execute(
+                'SELECT title FROM movies WHERE status IN (%s)'
+                %','.join('?' * len(done)), done))
+        return [movie for movie in movies if movie[0] not in finished]
+
+    def record(self, movie, result, filename=None):
+        '''
+        parameters:
+        -----------
+        movie: tuple (movie title, link to movie page, movie_title)
+        result: tuple returned by scraping_script.scrape_movie
+        filename: path of the text of the script (successful movies)
+        '''
+        title, link, movie_title = movie
+        status, genre, writer, text = result
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO movies (title, link, movie_title) '
+                'VALUES (?, ?, ?)', (title, link, movie_title))
+            self.connection.execute(
+                'UPDATE movies SET status = ?, genres = ?, writers = ?, '
+                'filename = ?, updated = ? WHERE title = ?',
+                (status,
+                 json.dumps(genre) if genre is not None else None,
+                 json.dumps(writer) if writer is not None else None,
+                 filename, time.time(), title))
+
+    def counts(self):
+        '''
+        returns:
+        --------
+        dictionary: number of movies per status
+        '''
+        return dict(self.connection.execute(
+                'SELECT status, COUNT(*) FROM movies GROUP BY status'))
+
+    def successful_movies(self):
+        '''
+        returns:
+        --------
+        list of tuples (title, genre list, writer list, movie_title,
+        filename), in the order of the movies on IMSDb
+        '''
+        return [(title, json.loads(genres), json.loads(writers),
+                 movie_title, filename)
+                for title, genres, writers, movie_title, filename
+                in self.connection.execute(
+                    'SELECT title, genres, writers, movie_title, filename '
+                    'FROM movies WHERE status = ? ORDER BY position',
+                    ('success',))]
+
+    def titles(self, status):
+        return [title for title, in self.connection.execute(
+                'SELECT title FROM movies WHERE status = ? ORDER BY position',
+                (status,))]
+
+    def export_csv(self, path_to_directory=None):
+        '''
+        writes successful_files.csv, movies_pdf_script.csv and
+        scraping_error.csv (see scraping_script.py) from the database, in
+        path_to_directory (config.SCRAPING_DIR by default)
+        '''
+        if path_to_directory is None:
+            path_to_directory = config.SCRAPING_DIR
+        with open(os.path.join(path_to_directory, 'successful_files.csv'),
+                  'w') as f:
+            for title, genre, writer, movie_title, filename \
+                    in self.successful_movies():
+                f.write(title + ';' + str(genre) + ';' + str(writer) + ';'
+                        + movie_title + ';' + filename + '\n')
+        with open(os.path.join(path_to_directory, 'movies_pdf_script.csv'),
+                  'w') as f:
+            for title in self.titles('pdf'):
+                f.write(title + '\n')
+        with open(os.path.join(path_to_directory, 'scraping_error.csv'),
+                  'w') as f:
+            for title in self.titles('error'):
+                f.write(title + '\n')
+
+    def title_dictionaries(self):
+        '''
+        returns:
+        --------
+        two dictionaries (see plotline_utilities.make_title_dictionary):
+           - with the filename as key (without extension) and title as value
+           - with title as key and filename as value
+        '''
+        rows = self.connection.execute(
+                'SELECT movie_title, title FROM movies WHERE status = ? '
+                'ORDER BY position', ('success',)).fetchall()
+        return dict(rows), dict((title, filename)
+                                for filename, title in rows)
+
+    def close(self):
+        self.connection.close()
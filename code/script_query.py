@@ -0,0 +1,142 @@
+'''
+from the text of a new script to its closest movies and its cluster, in one
+call, without writing any file
+
+i) the words are lemmatized (emotions_script.text_to_words, with a cache of
+   the lemmas kept between queries)
+ii) the emotions are counted by windows of 100 words
+    (emotions_script.emotion_array)
+iii) the counts are smoothed as for the movies of the corpus
+     (cluster_assignment.smooth_array, i.e. LoadPlotLine)
+iv) the plotline is compared with DTW to the movies of the corpus, visiting
+    them by increasing lower bound and stopping the comparisons that cannot
+    be among the n closest (acc_dtw.search_closest)
+v) the cluster is given by the cluster model if it was saved (see
+   cluster_assignment.py)
+
+the lexicon, the lemmas and the smoothed corpus stay in memory between
+queries; the time spent in each step is returned with the answer
+
+Usage:
+------
+To find the closest movies to a script saved as a text file, type in a
+terminal
+$ python script_query.py path/to/script.txt
+'''
+
+import os
+import sys
+import time
+import numpy as np
+
+import acc_dtw
+import config
+from cluster_assignment import load_cluster_model, smooth_array
+from dtw_script import list_legit_files, prepare_all_arrays
+from emotions_script import LemmaCache, emotion_array, emotion_matrix, \
+                            load_dictionary_and_vocabulary, text_to_words
+
+class ScriptQuery(object):
+    '''
+    usage:
+    ------
+    script_query = ScriptQuery()
+    answer = script_query.query(text, n=10, budget_ms=500)
+    '''
+    def __init__(self, movies=None, list_smooth_arrays=None,
+                 NRC_emotions_file=config.NRC_EMOTIONS_FILE,
+                 smoothing_method='lowess'):
+        '''
+        parameters:
+        -----------
+        movies, list_smooth_arrays: the corpus, defaults to all the movies of
+                                    '../data/emotions/arrays' (smoothed once)
+        NRC_emotions_file: path to the lexicon
+        smoothing_method: STR, see plotline_utilities.SMOOTHING_METHODS
+        '''
+        emotion_dict, vocabulary = \
+                        load_dictionary_and_vocabulary(NRC_emotions_file)
+        self.word_rows, self.matrix = emotion_matrix(emotion_dict)
+        self.lemma_cache = LemmaCache()
+        self.smoothing_method = smoothing_method
+        if movies is None:
+            movies = list_legit_files()
+            list_smooth_arrays = prepare_all_arrays(movies, smoothing_method)
+        self.movies = list(movies)
+        self.list_energies = [acc_dtw.energy(arr)
+                              for arr in list_smooth_arrays]
+        self.cluster_model = None
+        if os.path.exists(config.CLUSTER_MODEL_PKL):
+            self.cluster_model = load_cluster_model()
+        #compiles the DTW now, rather than during the first query
+        acc_dtw.search_closest(np.ones(2), [np.ones(2)], n=1)
+
+    def query(self, text, n=10, budget_ms=None):
+        '''
+        parameters:
+        -----------
+        text: STR, the script
+        n: number of closest movies
+        budget_ms: time (ms) after which the search of the closest movies
+                   stops (the closest found so far are returned), None to
+                   always finish the search
+
+        returns:
+        --------
+        dictionary with
+            'closest': list of (filename, distance), the closest first
+            'cluster': see cluster_assignment.ClusterModel.assign (None if
+                       no cluster model was saved)
+            'complete': False if the budget stopped the search
+            'comparisons': number of DTW computed
+            'timings (ms)': time spent in each step
+        '''
+        timings = {}
+        start = time.time()
+        deadline = start + budget_ms / 1000. if budget_ms is not None \
+                   else None
+
+        words = text_to_words(text, self.lemma_cache)
+        step = time.time()
+        timings['lemmatize'] = (step - start) * 1000.
+
+        array_emotions = emotion_array(words, self.word_rows, self.matrix)
+        if len(array_emotions) == 0:
+            raise ValueError('the script is shorter than one window of words')
+        timings['emotions'] = (time.time() - step) * 1000.
+        step = time.time()
+
+        smoothed = smooth_array(array_emotions, self.smoothing_method)
+        timings['smoothing'] = (time.time() - step) * 1000.
+        step = time.time()
+
+        indices, distances, n_dtw, complete = acc_dtw.search_closest(
+                    smoothed, self.list_energies, n=n, deadline=deadline)
+        timings['search'] = (time.time() - step) * 1000.
+        step = time.time()
+
+        cluster = None
+        if self.cluster_model is not None:
+            cluster = self.cluster_model.assign_smoothed(smoothed,
+                                                         record=False)
+        timings['cluster'] = (time.time() - step) * 1000.
+        timings['total'] = (time.time() - start) * 1000.
+        return {'closest': [(self.movies[index], distance)
+                            for index, distance in zip(indices, distances)],
+                'cluster': cluster,
+                'complete': complete,
+                'comparisons': n_dtw,
+                'timings (ms)': timings}
+
+if __name__ == '__main__':
+    script_query = ScriptQuery()
+    with open(sys.argv[1]) as f:
+        text = f.read()
+    answer = script_query.query(text)
+    for filename, distance in answer['closest']:
+        print filename + '('+ str(round(distance,1))+')'
+    if answer['cluster'] is not None:
+        print 'cluster: %s' %answer['cluster']['cluster']
+    for step in ['lemmatize', 'emotions', 'smoothing', 'search', 'cluster',
+                 'total']:
+        print '%s: %.1f ms' %(step, answer['timings (ms)'][step])
@@ -0,0 +1,182 @@
+'''
+this script compares the O(n) smoothers of plotline_utilities with Lowess
+i) the raw data as .npy is found in '../data/emotions/arrays'
+ii) every movie is smoothed with each method (all 10 emotions, frac=0.1, as
+    in LoadPlotLine.make_emotion_dictionary), and the runtime is recorded
+iii) the shape of the smoothed plots is compared to the Lowess reference
+iv) the pairwise DTW distances are computed on a sample of movies for each
+    method, and the nearest neighbours are compared to the Lowess ones
+
+Usage:
+------
+To execute this script, type in a terminal
+$ python smoothing_benchmark.py
+or, to change the number of movies used for the DTW comparison (default 60)
+$ python smoothing_benchmark.py 100
+
+Measures reported:
+------------------
+ms/movie: average time to smooth the 10 emotions of a movie
+rmse: root mean square difference with Lowess, divided by the standard
+      deviation of the Lowess plot (0 means identical shapes)
+corr: average Pearson correlation with the Lowess plot
+top10 overlap: fraction of the 10 closest movies (DTW) that are the same as
+               with Lowess
+rank corr: Spearman correlation between the DTW distances obtained with the
+           method and with Lowess (one row per movie, averaged)
+'''
+
+import os
+import sys
+import time
+import numpy as np
+
+import acc_dtw
+import config
+from instrumentation import Progress, save_metrics
+from plotline_utilities import smoothing, SMOOTHING_METHODS
+
+def smooth_movie(array_emotions, method, frac=0.1):
+    '''
+    returns:
+    --------
+    np array [time, emotions], with smoothed counts (all 10 emotions)
+    '''
+    smoothed_emotion_list = []
+    for index in xrange(array_emotions.shape[1]):
+        x, y = smoothing(array_emotions[:, index], frac=frac, method=method)
+        smoothed_emotion_list.append(y)
+    return np.transpose(np.array(smoothed_emotion_list))
+
+def shape_difference(reference, smoothed):
+    '''
+    parameters:
+    -----------
+    reference, smoothed: np arrays [time, emotions]
+
+    returns:
+    --------
+    normalized rmse and mean correlation over the emotions
+    '''
+    list_rmse = []
+    list_corr = []
+    for index in xrange(reference.shape[1]):
+        ref = reference[:, index]
+        other = smoothed[:, index]
+        scale = ref.std()
+        if scale == 0:
+            continue
+        list_rmse.append(np.sqrt(np.mean((ref - other)**2)) / scale)
+        if other.std() > 0:
+            list_corr.append(np.corrcoef(ref, other)[0, 1])
+    return np.mean(list_rmse), np.mean(list_corr)
+
+def pairwise_dtw(list_arrays):
+    '''
+    returns:
+    --------
+    square np.array of the DTW distances between the arrays
+    '''
+    n = len(list_arrays)
+    distances = np.zeros((n, n))
+    for index1 in xrange(n):
+        for index2 in xrange(index1+1, n):
+            d = acc_dtw.dtw(list_arrays[index1], list_arrays[index2])[0]
+            distances[index1, index2] = d
+            distances[index2, index1] = d
+    return distances
+
+def _ranks(values):
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values)] = np.arange(len(values))
+    return ranks
+
+def neighbour_agreement(reference, distances, n_neighbours=10):
+    '''
+    parameters:
+    -----------
+    reference, distances: square arrays of pairwise distances (Lowess, method)
+    n_neighbours: size of the neighbourhood to compare
+
+    returns:
+    --------
+    mean overlap of the nearest neighbours, mean Spearman correlation
+    '''
+    n = reference.shape[0]
+    n_neighbours = min(n_neighbours, n - 1)
+    list_overlap = []
+    list_rank_corr = []
+    for index in xrange(n):
+        others = np.arange(n) != index
+        ref_row = reference[index][others]
+        row = distances[index][others]
+        top_ref = set(np.argsort(ref_row)[:n_neighbours])
+        top = set(np.argsort(row)[:n_neighbours])
+        list_overlap.append(len(top_ref & top) * 1. / n_neighbours)
+        list_rank_corr.append(np.corrcoef(_ranks(ref_row), _ranks(row))[0, 1])
+    return np.mean(list_overlap), np.mean(list_rank_corr)
+
+def benchmark(legit_files, path_to_file, n_dtw=60, frac=0.1):
+    '''
+    parameters:
+    -----------
+    legit_files: list of filenames (without extension)
+    path_to_file: directory of the .npy files
+    n_dtw: number of movies used to compare the DTW nearest neighbours
+    frac: parameter of smoothing
+
+    returns:
+    --------
+    dictionary: key method, value dictionary of the measures
+    '''
+    raw_arrays = [np.load(os.path.join(path_to_file, filename + '.npy'))
+                  for filename in legit_files]
+    smoothed = {}
+    results = {}
+    for method in SMOOTHING_METHODS:
+        start = time.time()
+        smoothed[method] = []
+        with Progress(len(raw_arrays), method) as progress:
+            for array_emotions in raw_arrays:
+                smoothed[method].append(smooth_movie(array_emotions, method,
+                                                     frac))
+                progress.update()
+        elapsed = time.time() - start
+        results[method] = {'ms/movie': elapsed * 1000. / len(raw_arrays)}
+
+    for method in SMOOTHING_METHODS:
+        shapes = [shape_difference(ref, arr) for ref, arr in
+                  zip(smoothed['lowess'], smoothed[method])]
+        results[method]['rmse'] = np.mean([rmse for rmse, corr in shapes])
+        results[method]['corr'] = np.mean([corr for rmse, corr in shapes])
+
+    n_dtw = min(n_dtw, len(raw_arrays))
+    print 'DTW on %d movies' %n_dtw
+    reference = pairwise_dtw(smoothed['lowess'][:n_dtw])
+    for method in SMOOTHING_METHODS:
+        distances = pairwise_dtw(smoothed[method][:n_dtw])
+        overlap, rank_corr = neighbour_agreement(reference, distances)
+        results[method]['top10 overlap'] = overlap
+        results[method]['rank corr'] = rank_corr
+    return results
+
+def print_results(results):
+    columns = ['ms/movie', 'rmse', 'corr', 'top10 overlap', 'rank corr']
+    print '\n'
+    print 'method'.ljust(16) + ''.join(column.rjust(15) for column in columns)
+    print '-' * (16 + 15 * len(columns))
+    for method in SMOOTHING_METHODS:
+        print method.ljust(16) + ''.join(('%.3f' %results[method][column])
+                                         .rjust(15) for column in columns)
+
+if __name__ == '__main__':
+    n_dtw = 60
+    if len(sys.argv) > 1:
+        n_dtw = int(sys.argv[1])
+
+    path_to_file = config.ARRAYS_DIR
+    files = os.listdir(path_to_file)
+    legit_files = [filename[:-4] for filename in files if filename[-3:]=='npy']
+    results = benchmark(legit_files, path_to_file, n_dtw=n_dtw)
+    print_results(results)
+    save_metrics('smoothing_benchmark', extra={'results': results})
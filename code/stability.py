@@ -0,0 +1,131 @@
+'''
+stability of a clustering repeated several times (see
+medoids.investigate_stability)
+
+the runs are compared through their co-association matrix: entry (i, j)
+counts the runs in which the movies i and j ended up in the same cluster.
+Nothing depends on matching the clusters of different runs, so the analysis
+still holds when the medoids change from one run to the next.
+
+- coassociation_matrix: the counts (uint8 or uint16), built by blocks of rows
+- consensus_run: the run that agrees the most with all the others (its
+  clusters are the consensus clusters)
+- movie_stability: for each movie, the fraction of the runs in which it was
+  with the other movies of its consensus cluster (1: always)
+- stable_core: for each consensus cluster, the movies that were in the same
+  cluster as its medoid in every run
+
+the runs are given as cluster codes (integers 0..k-1, one per movie, see
+cluster_metrics.cluster_codes)
+'''
+
+import numpy as np
+
+from cluster_metrics import row_cluster_sums, BLOCK_ELEMENTS
+
+def coassociation_matrix(list_codes, block_elements=BLOCK_ELEMENTS):
+    '''
+    parameters:
+    -----------
+    list_codes: list of np.arrays (one per run) of the cluster code of each
+                movie
+
+    returns:
+    --------
+    square np.array of size m x m: number of runs in which movies i and j
+    are in the same cluster
+    '''
+    n_runs = len(list_codes)
+    m = len(list_codes[0])
+    dtype = np.uint8 if n_runs < 2**8 else np.uint16
+    counts = np.zeros((m, m), dtype=dtype)
+    block = max(1, block_elements // max(m, 1))
+    for codes in list_codes:
+        for start in xrange(0, m, block):
+            stop = min(start + block, m)
+            counts[start:stop] += codes[start:stop, None] == codes[None, :]
+    return counts
+
+def _within_sums(counts, codes, k):
+    #for each movie, sum of its co-association counts with its own cluster
+    within = np.empty(len(codes))
+    for start, stop, sums in row_cluster_sums(counts, codes, k):
+        within[start:stop] = sums[np.arange(stop - start), codes[start:stop]]
+    return within
+
+def consensus_run(counts, list_codes, k):
+    '''
+    returns:
+    --------
+    index of the run whose clusters gather the pairs of movies that are the
+    most often together (sum of the co-association counts inside its
+    clusters)
+    '''
+    agreements = [_within_sums(counts, codes, k).sum()
+                  for codes in list_codes]
+    return int(np.argmax(agreements))
+
+def movie_stability(counts, codes, k, n_runs):
+    '''
+    parameters:
+    -----------
+    counts: co-association matrix
+    codes: consensus cluster code of each movie
+    k: number of clusters
+    n_runs: number of runs counted in counts
+
+    returns:
+    --------
+    np.array, for each movie the average fraction of the runs in which it was
+    in the same cluster as the other movies of its consensus cluster
+    np.array of size k, average of the previous over each cluster
+    '''
+    sizes = np.bincount(codes, minlength=k)
+    within = _within_sums(counts, codes, k) - n_runs #the movie itself
+    others = np.maximum(sizes[codes] - 1, 1)
+    per_movie = within / (others * float(n_runs))
+    per_movie[sizes[codes] <= 1] = 1.
+    per_cluster = np.bincount(codes, weights=per_movie, minlength=k) \
+                  / np.maximum(sizes, 1)
+    return per_movie, per_cluster
+
+def stable_core(counts, medoids, n_runs):
+    '''
+    returns:
+    --------
+    dictionary: key medoid (index), value np.array of the indices of the
+    movies that were in the same cluster as the medoid in all the runs
+    '''
+    return dict((medoid, np.where(counts[medoid] == n_runs)[0])
+                for medoid in medoids)
+
+def stability_report(list_codes, list_medoids, k):
+    '''
+    parameters:
+    -----------
+    list_codes: list of np.arrays (one per run) of the cluster code of each
+                movie
+    list_medoids: list of np.arrays (one per run) of the medoids, in the
+                  order of the codes
+    k: number of clusters
+
+    returns:
+    --------
+    dictionary with
+        'consensus run': index of the consensus run
+        'medoids': medoids of the consensus clusters
+        'codes': consensus cluster code of each movie
+        'movie stability', 'cluster stability': see movie_stability
+        'core': see stable_core
+    '''
+    n_runs = len(list_codes)
+    counts = coassociation_matrix(list_codes)
+    best = consensus_run(counts, list_codes, k)
+    codes = list_codes[best]
+    per_movie, per_cluster = movie_stability(counts, codes, k, n_runs)
+    return {'consensus run': best,
+            'medoids': list_medoids[best],
+            'codes': codes,
+            'movie stability': per_movie,
+            'cluster stability': per_cluster,
+            'core': stable_core(counts, list_medoids[best], n_runs)}
@@ -0,0 +1,325 @@
+'''
+streaming version of the scraping, emotion and smoothing steps: each script
+goes through all the steps as soon as it is downloaded, instead of waiting
+for the whole batch of the previous step (scraping_script.py, then
+emotions_script.py, then dtw_script.py)
+
+stages (each with its own number of threads):
+i) fetch: download the pages of the movie and extract the text of the
+   script (scraping_script.scrape_movie)
+ii) lemmatize: list of lemmatized words (emotions_script.text_to_words)
+iii) emotions: emotion counts by windows of 100 words
+     (emotions_script.emotion_array)
+iv) smooth: smoothed plotline (cluster_assignment.smooth_array)
+
+the stages are connected by bounded queues: when a stage is slower than the
+previous one, its queue fills up and the previous stage waits (backpressure),
+so the slowest stage sets the throughput and the memory stays bounded. For
+each stage, the time spent working, waiting for an item (starved) and
+waiting for room in the next queue (blocked) is reported.
+
+the files are the same as with the batch scripts: the texts and the CSV files
+of the scraping (recorded in scraping.db, see scraping_store.py), and the
+emotion counts in '../data/emotions/arrays'; the smoothed plotlines are saved
+in '../data/emotions/smoothed' (see config.py)
+
+a movie whose fetch fails for any reason is recorded as an error (the
+traceback of an unexpected exception is printed); an exception raised by
+another stage drops the movie, with its traceback
+
+Usage:
+------
+To execute this script, type in a terminal
+$ python streaming_pipeline.py
+to change the number of threads of each stage (fetch, lemmatize, emotions,
+smooth), the size of the queues and the smoother (see
+plotline_utilities.smoothing)
+$ python streaming_pipeline.py workers=8,1,1,2 queue=16 smoothing=gaussian
+'''
+
+import os
+import sys
+import threading
+import time
+import traceback
+from Queue import Queue
+
+import numpy as np
+
+import config
+from instrumentation import save_metrics
+_END = object() #put in a queue after the last item
+
+class StageMetrics(object):
+    '''
+    what the threads of a stage did, in seconds (summed over the threads)
+    '''
+    def __init__(self, name, n_workers):
+        self.name = name
+        self.n_workers = n_workers
+        self.items = 0
+        self.dropped = 0 #function returned None (pdf, error...)
+        self.errors = 0 #function raised an exception
+        self.busy = 0.
+        self.starved = 0. #waiting for the previous stage
+        self.blocked = 0. #waiting for the next stage (backpressure)
+        self.max_queue = 0 #largest number of items waiting in the input
+        self._lock = threading.Lock()
+
+    def add(self, busy, starved, blocked, outcome, queue_size):
+        with self._lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            self.max_queue = max(self.max_queue, queue_size)
+            if outcome == 'item':
+                self.items += 1
+            elif outcome == 'dropped':
+                self.dropped += 1
+            else:
+                self.errors += 1
+
+    def summary(self, elapsed):
+        '''
+        returns:
+        --------
+        dictionary with the counts, and the fraction of the time the threads
+        of the stage spent working, starved and blocked
+        '''
+        total = max(elapsed * self.n_workers, 1e-9)
+        return {'stage': self.name, 'workers': self.n_workers,
+                'items': self.items, 'dropped': self.dropped,
+                'errors': self.errors, 'max queue': self.max_queue,
+                'busy': self.busy / total, 'starved': self.starved / total,
+                'blocked': self.blocked / total,
+                'items/s': self.items / max(elapsed, 1e-9)}
+
+class Pipeline(object):
+    '''
+    chain of stages connected by bounded queues
+
+    usage:
+    ------
+    pipeline = Pipeline([('fetch', fetch, 8), ('smooth', smooth, 2)],
+                        queue_size=16)
+    for result in pipeline.run(items):
+        ... (results in the order in which they are ready)
+    pipeline.report()
+    '''
+    def __init__(self, stages, queue_size=16):
+        '''
+        parameters:
+        -----------
+        stages: list of tuples (name, function, number of threads); each
+                function takes the output of the previous one, and returns
+                None to drop the item
+        queue_size: maximum number of items waiting between two stages
+        '''
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = [StageMetrics(name, n_workers)
+                        for name, function, n_workers in stages]
+        self.elapsed = 0.
+
+    def _worker(self, function, metrics, queue_in, queue_out, finished):
+        #the item is dropped when function raises, with its traceback
+        while True:
+            start = time.time()
+            item = queue_in.get()
+            got = time.time()
+            if item is _END:
+                finished()
+                return
+            queue_size = queue_in.qsize()
+            try:
+                result = function(item)
+                outcome = 'item' if result is not None else 'dropped'
+            except Exception:
+                traceback.print_exc()
+                sys.stderr.write('stage %s: item dropped\n' %metrics.name)
+                result = None
+                outcome = 'error'
+            done = time.time()
+            if result is not None:
+                queue_out.put(result)
+            metrics.add(done - got, got - start, time.time() - done,
+                        outcome, queue_size)
+
+    def run(self, items):
+        '''
+        generator of the results of the last stage, as soon as they are ready
+        '''
+        start = time.time()
+        queues = [Queue(self.queue_size) for _ in self.stages]
+        queues.append(Queue(self.queue_size))
+        for position, (name, function, n_workers) in enumerate(self.stages):
+            next_workers = self.stages[position + 1][2] \
+                           if position + 1 < len(self.stages) else 1
+            finished = self._finisher(n_workers, queues[position + 1],
+                                      next_workers)
+            for _ in xrange(n_workers):
+                thread = threading.Thread(target=self._worker,
+                                          args=(function,
+                                                self.metrics[position],
+                                                queues[position],
+                                                queues[position + 1],
+                                                finished))
+                thread.daemon = True
+                thread.start()
+
+        #the items are fed from another thread, the first queue is bounded
+        def _feed():
+            for item in items:
+                queues[0].put(item)
+            for _ in xrange(self.stages[0][2]):
+                queues[0].put(_END)
+        feeder = threading.Thread(target=_feed)
+        feeder.daemon = True
+        feeder.start()
+
+        while True:
+            result = queues[-1].get()
+            if result is _END:
+                break
+            yield result
+        self.elapsed = time.time() - start
+
+    def _finisher(self, n_workers, queue_out, next_workers):
+        #the last thread of a stage to finish tells the next stage
+        remaining = [n_workers]
+        lock = threading.Lock()
+        def finished():
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                for _ in xrange(next_workers):
+                    queue_out.put(_END)
+        return finished
+
+    def report(self, verbose=True):
+        '''
+        returns:
+        --------
+        list of the summaries of the stages (see StageMetrics.summary), the
+        stage with the largest busy fraction is the bottleneck
+        '''
+        summaries = [metrics.summary(self.elapsed)
+                     for metrics in self.metrics]
+        if verbose:
+            print '*'*50
+            print 'elapsed: %.1f s' %self.elapsed
+            for summary in summaries:
+                print ('%(stage)s (%(workers)d threads): %(items)d items '
+                       '(%(items/s).1f/s), dropped %(dropped)d, errors '
+                       '%(errors)d | busy %(busy).0f%%, starved '
+                       '%(starved).0f%%, blocked %(blocked).0f%% | max queue '
+                       '%(max queue)d') %dict(summary,
+                                              busy=summary['busy']*100,
+                                              starved=summary['starved']*100,
+                                              blocked=summary['blocked']*100)
+            bottleneck = max(summaries, key=lambda summary: summary['busy'])
+            print 'slowest stage: %s' %bottleneck['stage']
+            print '*'*50
+        return summaries
+
+def script_stages(fetcher, browser, base_url, word_rows, matrix, lemma_cache,
+                  n_workers=(8, 1, 1, 2), smoothing_method='lowess'):
+    '''
+    returns:
+    --------
+    the stages of the module docstring, for Pipeline; the items are
+    dictionaries which gain a key at each stage ('result' after fetch,
+    'words', 'counts', 'smoothed')
+    '''
+    import requests
+    from cluster_assignment import smooth_array
+    from emotions_script import emotion_array, text_to_words
+    from scraping_script import scrape_movie
+
+    def fetch(item):
+        #every failure is a result, so that write_result records the movie
+        try:
+            item['result'] = scrape_movie(item['movie'], browser, fetcher,
+                                          base_url)
+        except (requests.RequestException, IndexError):
+            item['result'] = ('error', None, None, None)
+        except Exception:
+            #the browser failed (WebDriverException...), or an unexpected error
+            traceback.print_exc()
+            item['result'] = ('error', None, None, None)
+        return item
+
+    def lemmatize(item):
+        if item['result'][0] == 'success':
+            item['words'] = text_to_words(item['result'][3], lemma_cache)
+        return item
+
+    def emotions(item):
+        if 'words' in item:
+            item['counts'] = emotion_array(item.pop('words'), word_rows,
+                                           matrix)
+        return item
+
+    def smooth(item):
+        if 'counts' in item and len(item['counts']):
+            item['smoothed'] = smooth_array(item['counts'], smoothing_method)
+        return item
+
+    return [('fetch', fetch, n_workers[0]),
+            ('lemmatize', lemmatize, n_workers[1]),
+            ('emotions', emotions, n_workers[2]),
+            ('smooth', smooth, n_workers[3])]
+
+def _option(name, default=None):
+    #options given as name=value in the command line
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + '='):
+            return arg.split('=', 1)[1]
+    return default
+
+if __name__ == '__main__':
+    from emotions_script import LemmaCache, emotion_matrix, \
+                                load_dictionary_and_vocabulary
+    from http_cache import ResponseCache
+    from scraping_script import BASE_URL, BrowserPool, Fetcher, \
+                                get_all_movies, write_result
+    from scraping_store import ScrapingStore
+
+    for path in [config.TEXTS_DIR, config.ARRAYS_DIR, config.SMOOTHED_DIR]:
+        if not os.path.exists(path):
+            os.makedirs(path)
+    base_url = _option('base_url', BASE_URL)
+    n_workers = [int(n) for n in _option('workers', '8,1,1,2').split(',')]
+    fetcher = Fetcher(cache=ResponseCache())
+    browser = BrowserPool(n_browsers=2)
+    emotion_dict, vocabulary = \
+        load_dictionary_and_vocabulary(config.NRC_EMOTIONS_FILE)
+    word_rows, matrix = emotion_matrix(emotion_dict)
+    store = ScrapingStore()
+
+    movies = get_all_movies(fetcher, base_url)
+    store.add_movies(movies)
+    pipeline = Pipeline(script_stages(fetcher, browser, base_url, word_rows,
+                                      matrix, LemmaCache(), n_workers,
+                                      _option('smoothing', 'lowess')),
+                        queue_size=int(_option('queue', 16)))
+    start = time.time()
+    try:
+        for item in pipeline.run({'movie': movie}
+                                 for movie in store.pending(movies)):
+            #files written by this thread only (the store is not shared)
+            write_result(item['movie'], item['result'], store)
+            if 'counts' in item:
+                np.save(os.path.join(config.ARRAYS_DIR, item['movie'][2]),
+                        item['counts'])
+            if 'smoothed' in item:
+                np.save(os.path.join(config.SMOOTHED_DIR, item['movie'][2]),
+                        item['smoothed'])
+            print '%6.1f s  %s: %s' %(time.time() - start, item['movie'][0],
+                                      item['result'][0])
+    finally:
+        browser.quit()
+        store.export_csv()
+        store.close()
+    save_metrics('streaming_pipeline', extra={'stages': pipeline.report()})
@@ -0,0 +1,204 @@
+'''
+deterministic synthetic corpus, to benchmark the scripts (see benchmark.py)
+or run them without the scraped data and without network
+
+- screenplay: text of a screenplay-like script (scene headings, character
+  names, dialogue and action lines); on average hit_rate of the words of the
+  dialogue and action lines are words of the NRC lexicon, the others are
+  filler words which are not in it. The rate of lexicon words follows a
+  smooth arc along the script, so that the emotion counts rise and fall as
+  in a plot
+- emotion_array: emotion counts [windows, emotions] of the kind computed by
+  emotions_script.py, drawn directly (much faster than counting the words of
+  a generated text): Poisson counts around the average rate of each emotion
+  in the lexicon, modulated by arcs drawn around n_shapes families of arcs,
+  so that the movies form clusters
+- the lengths of the scripts follow a lognormal distribution (median 24000
+  words, ie about 240 windows of 100 words, between 5000 and 60000 words)
+
+movie i only depends on (seed, i): the first 100 movies of a corpus of
+10000 movies are the corpus of 100 movies
+
+Usage:
+------
+To write 1000 scripts and their emotion counts in a new data folder (the
+lexicon is copied), then run the pipeline on it
+$ python synthetic_corpus.py 1000 /tmp/synthetic
+$ PLOTLINE_DATA_DIR=/tmp/synthetic python pipeline.py
+'''
+
+import os
+import shutil
+import sys
+import numpy as np
+
+import config
+
+#words of the dialogue and action lines which carry no emotion (the ones in
+#the lexicon are removed, see Corpus)
+FILLER_WORDS = '''the a an and of to in on at with for from by he she they we
+you i it his her their our your my this that these those is are was were be
+been has have had do does did what where when who how here there then now
+just up down out into over back around door room table car street phone
+window hand head eyes face looks turns walks stands sits opens closes takes
+moves goes comes says knows thinks wants sees hears picks beat moment later
+again still too also'''.split()
+
+SCENES = ('INT.', 'EXT.')
+PLACES = ('HOUSE', 'OFFICE', 'STREET', 'CAR', 'KITCHEN', 'BAR', 'CORRIDOR',
+          'SHIP', 'FOREST', 'STATION')
+TIMES = ('DAY', 'NIGHT', 'CONTINUOUS', 'LATER')
+NAMES = ('ALEX', 'SAM', 'JORDAN', 'MORGAN', 'CASEY', 'RILEY', 'TAYLOR',
+         'JAMIE')
+GENRES = ('Drama', 'Thriller', 'Comedy', 'Action', 'Horror', 'Romance',
+          'Sci-Fi', 'Crime')
+
+def script_length(rng):
+    '''
+    number of words of a script (lognormal, median 24000 words)
+    '''
+    return int(np.clip(rng.lognormal(np.log(24000), 0.35), 5000, 60000))
+
+def _arc(t, coefficients):
+    #smooth curve of t in [0, 1], between 0.5 and 1.5
+    #coefficients: rows (amplitude, frequency, phase) of sinusoids
+    curve = np.zeros(len(t))
+    for amplitude, frequency, phase in coefficients:
+        curve += amplitude * np.sin(2 * np.pi * frequency * t + phase)
+    return 1 + 0.5 * curve / np.abs(coefficients[:, 0]).sum()
+
+class Corpus(object):
+    '''
+    usage:
+    ------
+    corpus = Corpus(emotion_dict, seed=0)
+    text = corpus.screenplay(12)
+    array_emotions = corpus.emotion_array(12)
+    '''
+    def __init__(self, emotion_dict, seed=0, hit_rate=0.2, n_shapes=3,
+                 size_block=100):
+        '''
+        parameters:
+        -----------
+        emotion_dict: see emotions_script.load_dictionary_and_vocabulary
+        seed: INT, the corpus only depends on it
+        hit_rate: average fraction of the words of the dialogue and action
+                  lines which are in the lexicon
+        n_shapes: number of families of emotional arcs
+        size_block: number of words of a window (see emotions_script)
+        '''
+        self.seed = seed
+        self.hit_rate = hit_rate
+        self.n_shapes = n_shapes
+        self.size_block = size_block
+        self.lexicon = np.array(sorted(emotion_dict), dtype=object)
+        self.filler = np.array([word for word in FILLER_WORDS
+                                if word not in emotion_dict], dtype=object)
+        matrix = np.array([emotion_dict[word] for word in self.lexicon],
+                          dtype=np.float64)
+        #average count of each emotion in a window
+        self.rates = matrix.mean(axis=0) * hit_rate * size_block
+        self.families = [np.random.RandomState([seed, 1, family]).rand(
+                                                    len(self.rates), 3, 3)
+                         for family in xrange(n_shapes)]
+
+    def _movie(self, index):
+        #random state, number of words and arcs (one per emotion) of a movie
+        rng = np.random.RandomState([self.seed, 0, index])
+        n_words = script_length(rng)
+        family = self.families[rng.randint(self.n_shapes)]
+        coefficients = family + rng.normal(0, 0.1, family.shape)
+        #amplitude in [0.2, 1], frequency in [0.5, 3], phase in [0, 2 pi]
+        coefficients = coefficients * [0.8, 2.5, 2 * np.pi] + [0.2, 0.5, 0.]
+        return rng, n_words, coefficients
+
+    def screenplay(self, index):
+        '''
+        returns:
+        --------
+        STR, text of the script of movie index
+        '''
+        rng, n_words, coefficients = self._movie(index)
+        t = np.arange(n_words) / float(n_words)
+        #the arcs of the emotions, averaged, set the rate of lexicon words
+        arc = np.mean([_arc(t, emotion) for emotion in coefficients], axis=0)
+        from_lexicon = rng.rand(n_words) < np.clip(self.hit_rate * arc, 0, 1)
+        words = np.where(from_lexicon,
+                         self.lexicon[rng.randint(len(self.lexicon),
+                                                  size=n_words)],
+                         self.filler[rng.randint(len(self.filler),
+                                                 size=n_words)])
+        lines = []
+        position = 0
+        while position < n_words:
+            if rng.rand() < 0.05:
+                lines += ['', '%s %s - %s' %(SCENES[rng.randint(2)],
+                                             PLACES[rng.randint(len(PLACES))],
+                                             TIMES[rng.randint(len(TIMES))]),
+                          '']
+            length = rng.randint(4, 15)
+            line = ' '.join(words[position:position + length])
+            if rng.rand() < 0.5:
+                #dialogue, after the name of the character
+                lines += [' ' * 20 + NAMES[rng.randint(len(NAMES))],
+                          ' ' * 10 + line, '']
+            else:
+                lines.append(line.capitalize())
+            position += length
+        return '\n'.join(lines)
+
+    def emotion_array(self, index):
+        '''
+        returns:
+        --------
+        np.array [windows, emotions] of the emotion counts of movie index
+        (about as many windows as the words of its screenplay make)
+        '''
+        rng, n_words, coefficients = self._movie(index)
+        n_windows = max(len(xrange(0, n_words - self.size_block,
+                                   self.size_block)), 1)
+        t = np.arange(n_windows) / float(n_windows)
+        arcs = np.transpose([_arc(t, emotion) for emotion in coefficients])
+        return rng.poisson(self.rates * arcs).astype(np.float64)
+
+    def genres(self, index):
+        rng = np.random.RandomState([self.seed, 2, index])
+        return sorted(set(GENRES[genre]
+                          for genre in rng.randint(len(GENRES),
+                                                   size=rng.randint(1, 4))))
+
+def write_corpus(corpus, n_movies, directory,
+                 NRC_emotions_file=config.NRC_EMOTIONS_FILE):
+    '''
+    writes a data folder with the same structure as '../data': the scripts
+    (scraping/texts), the list of the movies (scraping/successful_files.csv),
+    the emotion counts (emotions/arrays) and the lexicon
+    '''
+    texts = os.path.join(directory, 'scraping', 'texts')
+    arrays = os.path.join(directory, 'emotions', 'arrays')
+    for path in [texts, arrays]:
+        if not os.path.exists(path):
+            os.makedirs(path)
+    shutil.copy(NRC_emotions_file, os.path.join(directory, 'emotions'))
+    with open(os.path.join(directory, 'scraping', 'successful_files.csv'),
+              'w') as f:
+        for index in xrange(n_movies):
+            movie_title = 'movie_%05d' %index
+            filename = os.path.join(texts, movie_title + '.txt')
+            with open(filename, 'w') as text_file:
+                text_file.write(corpus.screenplay(index))
+            np.save(os.path.join(arrays, movie_title),
+                    corpus.emotion_array(index))
+            f.write('Movie %05d;%s;%s;%s;%s\n'
+                    %(index, str(corpus.genres(index)),
+                      str(['Writer %d' %(index % 50)]), movie_title,
+                      filename))
+
+if __name__ == '__main__':
+    from emotions_script import load_dictionary_and_vocabulary
+    n_movies = int(sys.argv[1])
+    directory = sys.argv[2]
+    emotion_dict, vocabulary = \
+        load_dictionary_and_vocabulary(config.NRC_EMOTIONS_FILE)
+    write_corpus(Corpus(emotion_dict), n_movies, directory)
+    print '%d movies written in %s' %(n_movies, directory)
@@ -0,0 +1,92 @@
+'''
+checks of the restart policy of medoids.py
+
+$ python -m unittest test_medoids
+'''
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+import medoids
+from instrumentation import METRICS
+
+def _distances(n=60, seed=0):
+    #euclidean distances between points drawn around 3 centers
+    rng = np.random.RandomState(seed)
+    points = np.concatenate([rng.normal(center, 1., (n // 3, 2))
+                             for center in [(0, 0), (6, 0), (0, 6)]])
+    return np.sqrt(((points[:, None] - points[None, :]) ** 2).sum(axis=2))
+
+def _restarts():
+    return METRICS.summary()['counters'].get('clustering restarts', 0)
+
+class StoppingPointTest(unittest.TestCase):
+    def test_never_stops(self):
+        costs = [5., 4., 3., 2., 1.]
+        self.assertIsNone(medoids.stopping_point(costs, patience=3))
+        self.assertIsNone(medoids.stopping_point(costs, hit_rate=0.6,
+                                                 min_restarts=2))
+
+    def test_patience(self):
+        costs = [3., 2., 2., 2., 2., 1.]
+        self.assertEqual(medoids.stopping_point(costs, patience=3), 5)
+
+class EarlyStoppingTest(unittest.TestCase):
+    def setUp(self):
+        METRICS.reset()
+
+    def test_patience_runs_more_than_min_restarts(self):
+        medoids.clusters_k(3, _distances(), n_restarts=100, seed=0,
+                           patience=10, min_restarts=10)
+        self.assertGreater(_restarts(), 10)
+        self.assertLessEqual(_restarts(), 100)
+
+    def test_hit_rate_runs_min_restarts(self):
+        medoids.clusters_k(3, _distances(), n_restarts=100, seed=0,
+                           hit_rate=0.3, min_restarts=10)
+        self.assertGreaterEqual(_restarts(), 10)
+
+    def test_chosen_num_cluster_with_patience(self):
+        distances = _distances()
+        movies = ['movie%d' % i for i in xrange(len(distances))]
+        chosen = medoids.chosen_num_cluster(movies, 3, distances, seed=0,
+                                            patience=10)
+        self.assertGreater(_restarts(), 10)
+        self.assertEqual(len(chosen[0]), 3)
+
+    def test_chosen_num_cluster_min_restarts(self):
+        distances = _distances()
+        movies = ['movie%d' % i for i in xrange(len(distances))]
+        medoids.chosen_num_cluster(movies, 3, distances, seed=0,
+                                   hit_rate=0.3, min_restarts=25)
+        self.assertGreaterEqual(_restarts(), 25)
+
+class ShareDistancesTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.npy')
+        os.close(handle)
+        np.save(self.path, _distances())
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_slice_of_memmap(self):
+        distances = np.load(self.path, mmap_mode='r')
+        self.assertEqual(medoids.share_distances(distances),
+                         (self.path, False))
+        path, temporary = medoids.share_distances(distances[:10, :10])
+        os.remove(path)
+        self.assertTrue(temporary)
+        #the processes cluster the slice, not the whole file
+        mini, curr_medoids = medoids.clusters_k(2, distances[:10, :10],
+                                                n_restarts=8, n_jobs=2,
+                                                seed=0)
+        self.assertTrue((curr_medoids < 10).all())
+        self.assertEqual(mini, medoids.clusters_k(
+                                2, np.array(distances[:10, :10]),
+                                n_restarts=8, seed=0)[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+'''
+checks of the plans of pipeline.py, on stages writing small files in a
+temporary folder
+
+$ python -m unittest test_pipeline
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import config
+from pipeline import Runner, Stage
+
+def _write(outputs):
+    for path in outputs:
+        with open(path, 'w') as f:
+            f.write('written by the stage\n')
+
+def _fail():
+    raise IOError('no network')
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = lambda name: os.path.join(self.directory, name)
+        self.texts, self.arrays, self.distances, self.knn = \
+            path('texts'), path('arrays'), path('distances'), path('knn')
+        self.state_path = path('pipeline_state.json')
+        #the metrics of the stages are saved in self.directory
+        self.metrics_dir = config.METRICS_DIR
+        config.METRICS_DIR = path('metrics')
+        #the scraping fails, as without network
+        self.stages = [Stage('scrape', _fail, [], [self.texts]),
+                       Stage('emotions', _write, [self.texts], [self.arrays],
+                             {'outputs': [self.arrays]}),
+                       Stage('distances', _write, [self.arrays],
+                             [self.distances], {'outputs': [self.distances]}),
+                       Stage('knn', _write, [self.distances], [self.knn],
+                             {'outputs': [self.knn]})]
+        #outputs made before the pipeline: no state, no texts, no arrays
+        _write([self.distances, self.knn])
+
+    def tearDown(self):
+        config.METRICS_DIR = self.metrics_dir
+        shutil.rmtree(self.directory)
+
+    def _runner(self):
+        return Runner(self.stages, state_path=self.state_path)
+
+    def test_no_state_outputs_present(self):
+        runner = self._runner()
+        self.assertEqual(runner.plan(['knn']), [])
+        self.assertEqual(runner.run(['knn'], verbose=False), {})
+        #the fingerprints are recorded, and a change of input is seen
+        with open(self.state_path, 'r') as f:
+            self.assertEqual(sorted(json.load(f)), ['distances', 'knn'])
+        with open(self.distances, 'a') as f:
+            f.write('changed by hand\n')
+        self.assertEqual(self._runner().plan(['knn']), ['knn'])
+
+    def test_adopt(self):
+        runner = self._runner()
+        self.assertEqual(runner.adopt(), ['distances', 'knn'])
+        with open(self.distances, 'a') as f:
+            f.write('changed by hand\n')
+        self.assertEqual(runner.adopt(), [])
+        self.assertEqual(runner.adopt(['knn'], overwrite=True), ['knn'])
+        self.assertEqual(self._runner().plan(['knn']), [])
+
+    def test_missing_outputs(self):
+        runner = self._runner()
+        runner.adopt()
+        #run only if asked for, or if a stage run reads them
+        os.remove(self.knn)
+        self.assertEqual(runner.plan(['distances']), [])
+        self.assertEqual(runner.plan(['knn']), ['knn'])
+        #the stages before distances are run for its missing inputs
+        os.remove(self.distances)
+        self.assertEqual(runner.plan(['distances']),
+                         ['scrape', 'emotions', 'distances'])
+
+    def test_upstream_cannot_run(self):
+        outcomes = self._runner().run(['knn', 'emotions'], verbose=False)
+        self.assertTrue(outcomes['scrape'].endswith('IOError: no network\n'))
+        self.assertEqual(outcomes['emotions'], 'not run: scrape did not run')
+        self.assertEqual(outcomes['distances'],
+                         'not run: emotions did not run')
+        self.assertEqual(outcomes['knn'], 'not run: distances did not run')
+
+    def test_missing_inputs(self):
+        stages = self.stages[1:]
+        outcomes = Runner(stages, state_path=self.state_path).run(
+                        ['emotions'], verbose=False)
+        self.assertEqual(outcomes['emotions'],
+                         'not run: missing inputs ' + self.texts)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+'''
+checks of scraping_script.py against the saved pages of fixtures/imsdb,
+served by a local server (see fixture_server.py)
+
+$ python -m unittest test_scraping
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import config
+from fixture_server import start_server
+from scraping_script import BrowserPool, Fetcher, get_all_movies, \
+                            scrape_movies
+from scraping_store import ScrapingStore
+
+SCRIPT_PAGE = '<html><td class="scrtext"><pre>rendered by javascript' \
+              '</pre></td></html>'
+
+class _Browser(object):
+    #stand-in for a selenium browser, which runs the javascript of the page
+    def __init__(self):
+        self.urls = []
+        self.page_source = None
+
+    def get(self, url):
+        self.urls.append(url)
+        self.page_source = SCRIPT_PAGE
+
+    def quit(self):
+        pass
+
+class ScrapeMoviesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        #the texts and the CSV files are written in self.directory
+        self.paths = config.TEXTS_DIR, config.SCRAPING_DIR
+        config.TEXTS_DIR = config.SCRAPING_DIR = self.directory
+        self.store = ScrapingStore(os.path.join(self.directory,
+                                                'scraping.db'))
+        self.fetcher = Fetcher(min_interval=0., n_retries=0)
+        self.movies = get_all_movies(self.fetcher, self.base_url)
+
+    def tearDown(self):
+        self.store.close()
+        config.TEXTS_DIR, config.SCRAPING_DIR = self.paths
+        shutil.rmtree(self.directory)
+
+    def _scrape(self, browser=None):
+        return scrape_movies(self.movies, browser, n_workers=3,
+                             fetcher=self.fetcher, base_url=self.base_url,
+                             store=self.store)
+
+    def test_movie_list(self):
+        self.assertEqual(self.movies[0],
+                         (u'Abyss, The',
+                          u'/Movie Scripts/Abyss, The Script.html', u'Abyss'))
+        self.assertEqual(len(self.movies), 5)
+
+    def test_statuses(self):
+        stats = self._scrape()
+        status = self.store.status
+        self.assertEqual(status(u'Abyss, The'), 'success')
+        self.assertEqual(status(u'Alien'), 'success')
+        self.assertEqual(status(u'Casablanca'), 'pdf')
+        #the script needs javascript, and there is no browser
+        self.assertEqual(status(u'Dark Star'), 'error')
+        #the movie page does not exist (404)
+        self.assertEqual(status(u'Missing Page'), 'error')
+        self.assertEqual(stats.summary(), {'static html': 3, 'browser': 0,
+                                           'browser failed': 0})
+        title, genre, writer, movie_title, filename = \
+            self.store.successful_movies()[1]
+        self.assertEqual((genre, writer), ([u'Horror', u'Sci-Fi'],
+                                           [u"Dan O'Bannon"]))
+        with open(filename, 'r') as f:
+            self.assertIn('RIPLEY', f.read())
+        with open(os.path.join(self.directory, 'movies_pdf_script.csv'),
+                  'r') as f:
+            self.assertEqual(f.read(), 'Casablanca\n')
+
+    def test_browser_fallback(self):
+        browser = _Browser()
+        stats = self._scrape(BrowserPool(n_browsers=1,
+                                         make_browser=lambda: browser))
+        self.assertEqual(self.store.status(u'Dark Star'), 'success')
+        self.assertEqual(browser.urls,
+                         [self.base_url + '/scripts/Dark-Star.html'])
+        self.assertEqual(stats.slow, 1)
+
+    def test_resume(self):
+        self._scrape()
+        self.assertEqual(self.store.pending(self.movies), [])
+        self.assertEqual([movie[0] for movie
+                          in self.store.pending(self.movies,
+                                                retry_errors=True)],
+                         [u'Dark Star', u'Missing Page'])
+
+if __name__ == '__main__':
+    unittest.main()